@@ -27,7 +27,14 @@
 from .config import *
 from .deploy import *
 from .inventory import *
+from .constructed import *
+from .inventorydb import *
+from .inventorydiff import *
+from .profiler import *
 from .repository import *
 from .inventoryaws import *
+from .inventorytf import *
+from .codeindex import *
+from .ansiblecfg import *
 
 # vim: ft=python:ts=4:sw=4
\ No newline at end of file
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Reader of the Ansible configuration, without importing Ansible.
+#
+# The configuration file is the first found in the same order used by Ansible:
+#
+#   - the file in the environment variable ANSIBLE_CONFIG, or the ansible.cfg
+#     in it if it's a directory
+#   - ansible.cfg in the base directory of Ansible of the repository
+#   - ~/.ansible.cfg
+#   - /etc/ansible/ansible.cfg
+#
+# Like in Ansible, a value in the environment variable ANSIBLE_<NAME> overrides
+# the one in the file, the values are read without interpolation and the quotes
+# around them are removed.
+#
+
+from __future__ import print_function
+
+import os
+import ConfigParser
+
+CONFIG_FILES = ['~/.ansible.cfg', '/etc/ansible/ansible.cfg']
+
+
+class AnsibleCfg(object):
+    """
+    The Ansible configuration seen from a directory
+    """
+
+    def __init__(self, base=None):
+        self.config_file = self.find_config_file(base)
+
+        self._parser = ConfigParser.RawConfigParser()
+        if self.config_file is not None:
+            try:
+                self._parser.read(self.config_file)
+            except ConfigParser.Error as e:
+                raise ValueError("Error reading the Ansible configuration %s: %s" % (self.config_file, e))
+
+    @classmethod
+    def find_config_file(cls, base=None):
+        """
+        The configuration file used by Ansible when it runs in base
+        """
+        for candidate in cls.candidates(base):
+            if os.path.isfile(candidate):
+                return candidate
+        return None
+
+    @staticmethod
+    def candidates(base=None):
+        """
+        The paths where the configuration file is searched, in order
+        """
+        candidates = []
+
+        env_config = os.environ.get('ANSIBLE_CONFIG')
+        if env_config:
+            env_config = os.path.expanduser(env_config)
+            if os.path.isdir(env_config):
+                env_config = os.path.join(env_config, 'ansible.cfg')
+            candidates.append(env_config)
+
+        if base is not None:
+            candidates.append(os.path.join(base, 'ansible.cfg'))
+
+        candidates.extend(os.path.expanduser(c) for c in CONFIG_FILES)
+        return candidates
+
+    def get(self, section, name, default=None):
+        """
+        A configuration value, from the environment variable ANSIBLE_<NAME> if set
+        """
+        value = os.environ.get("ANSIBLE_%s" % name.upper())
+
+        if value is None:
+            try:
+                value = self._parser.get(section, name)
+            except (ConfigParser.NoSectionError, ConfigParser.NoOptionError):
+                return default
+
+        return self._unquote(value)
+
+    @staticmethod
+    def _unquote(value):
+        if len(value) > 1 and value[0] == value[-1] and value[0] in ['"', "'"]:
+            return value[1:-1]
+        return value
+
+# vim: ft=python:ts=4:sw=4
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Incremental SQLite index of the Ansible code of a repository.
+#
+# The task files of the roles, the handlers and the playbooks are parsed and
+# their task names, tags and includes are stored in a SQLite file in local_tmp.
+# The tasks inside blocks (block, rescue and always) are included, and so are
+# the plays, the roles and the tasks of the playbooks.
+#
+# Each file is recorded with its fingerprint (inode, size and mtime) and when
+# the index is updated only the new and the changed files are parsed again, the
+# files that don't exist any more are removed. Files that can't be parsed are
+# recorded too, without content, so they are not parsed again until they change.
+#
+# The connection is shared by the threads of the process and used by one of
+# them at a time.
+#
+
+from __future__ import print_function
+
+import os
+import re
+import yaml
+import sqlite3
+import threading
+
+
+class CodeIndex(object):
+    """
+    SQLite index of the roles, task files, task names, tags and includes
+    """
+
+    VERSION = 1
+
+    SCHEMA = [
+        "CREATE TABLE files (id INTEGER PRIMARY KEY, path TEXT NOT NULL, kind TEXT NOT NULL, role TEXT, "
+        "ino INTEGER, size INTEGER, mtime REAL)",
+        "CREATE TABLE tasks (file_id INTEGER NOT NULL, name TEXT NOT NULL)",
+        "CREATE TABLE tags (file_id INTEGER NOT NULL, tag TEXT NOT NULL)",
+        "CREATE TABLE includes (file_id INTEGER NOT NULL, target TEXT NOT NULL)",
+        "CREATE UNIQUE INDEX files_path ON files (path)",
+        "CREATE INDEX tasks_file ON tasks (file_id)",
+        "CREATE INDEX tasks_name ON tasks (name)",
+        "CREATE INDEX tags_file ON tags (file_id)",
+        "CREATE INDEX tags_tag ON tags (tag)",
+        "CREATE INDEX includes_file ON includes (file_id)",
+    ]
+
+    # Keys of a task or a play that contain other tasks
+    TASK_LISTS = ['block', 'rescue', 'always', 'pre_tasks', 'tasks', 'post_tasks', 'handlers']
+
+    # Keys of a task or a play that include other files
+    INCLUDES = [
+        'include', 'include_tasks', 'import_tasks', 'import_playbook',
+        'include_role', 'import_role', 'include_vars',
+    ]
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self._conn = None
+        self._lock = threading.RLock()
+
+    def update(self, files):
+        """
+        Updates the index with a list of (path, kind, role) of the files to index
+        """
+        with self._lock:
+            self._update(self._connect(), files)
+
+    def _update(self, conn, files):
+        known = dict(
+            (row[1], (row[0], list(row[2:])))
+            for row in conn.execute("SELECT id, path, ino, size, mtime FROM files")
+        )
+
+        with conn:
+            current = set()
+            for path, kind, role in files:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                current.add(path)
+                fingerprint = [st.st_ino, st.st_size, st.st_mtime]
+
+                if path in known:
+                    if known[path][1] == fingerprint:
+                        continue
+                    self._delete(conn, known[path][0])
+
+                cursor = conn.execute(
+                    "INSERT INTO files (path, kind, role, ino, size, mtime) VALUES (?, ?, ?, ?, ?, ?)",
+                    (path, kind, role, st.st_ino, st.st_size, st.st_mtime)
+                )
+                self._index_file(conn, cursor.lastrowid, path)
+
+            for path in set(known) - current:
+                self._delete(conn, known[path][0])
+
+    def roles(self):
+        """
+        Lists the roles with at least one indexed file
+        """
+        return self._column("SELECT DISTINCT role FROM files WHERE role IS NOT NULL ORDER BY role")
+
+    def tags(self):
+        """
+        Lists all the tags
+        """
+        return self._column("SELECT DISTINCT tag FROM tags ORDER BY tag")
+
+    def task_names(self):
+        """
+        Lists all the names of the tasks
+        """
+        return self._column("SELECT DISTINCT name FROM tasks ORDER BY name")
+
+    def includes(self, path):
+        """
+        Lists what a file includes, as written in the file
+        """
+        return self._column(
+            "SELECT i.target FROM includes i JOIN files f ON f.id = i.file_id WHERE f.path = ?", (path,)
+        )
+
+    def close(self):
+        """
+        Closes the connection to the database
+        """
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _connect(self):
+        """
+        Opens the database, creating it or replacing it if it's of an older version
+        """
+        if self._conn is not None:
+            return self._conn
+
+        db_dir = os.path.dirname(self.db_file)
+        if db_dir and not os.path.isdir(db_dir):
+            os.makedirs(db_dir)
+
+        conn = sqlite3.connect(self.db_file, timeout=10, check_same_thread=False)
+        if conn.execute("PRAGMA user_version").fetchone()[0] != self.VERSION:
+            with conn:
+                for table in ['files', 'tasks', 'tags', 'includes']:
+                    conn.execute("DROP TABLE IF EXISTS %s" % table)
+                for statement in self.SCHEMA:
+                    conn.execute(statement)
+                conn.execute("PRAGMA user_version = %d" % self.VERSION)
+
+        self._conn = conn
+        return self._conn
+
+    def _column(self, query, params=()):
+        with self._lock:
+            return [r[0] for r in self._connect().execute(query, params)]
+
+    @staticmethod
+    def _delete(conn, file_id):
+        for table in ['tasks', 'tags', 'includes']:
+            conn.execute("DELETE FROM %s WHERE file_id = ?" % table, (file_id,))
+        conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+    def _index_file(self, conn, file_id, path):
+        """
+        Parses one file and stores its content
+        """
+        try:
+            with open(path) as f:
+                doc = yaml.load(f, Loader=yaml.CLoader)
+        except (OSError, IOError, yaml.YAMLError):
+            return
+
+        tasks, tags, includes = [], set(), []
+        self._walk(doc, tasks, tags, includes)
+
+        conn.executemany("INSERT INTO tasks (file_id, name) VALUES (?, ?)", ((file_id, t) for t in tasks))
+        conn.executemany("INSERT INTO tags (file_id, tag) VALUES (?, ?)", ((file_id, t) for t in tags))
+        conn.executemany("INSERT INTO includes (file_id, target) VALUES (?, ?)", ((file_id, i) for i in includes))
+
+    @classmethod
+    def _walk(cls, items, tasks, tags, includes):
+        """
+        Collects names, tags and includes from a list of tasks or plays
+        """
+        if not isinstance(items, list):
+            return
+
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+
+            # Plays have a list of hosts, tasks have a name for --start-at-task
+            if isinstance(item.get('name'), basestring) and 'hosts' not in item:
+                tasks.append(item['name'])
+
+            tags.update(cls._tags(item.get('tags')))
+
+            for key in cls.INCLUDES:
+                target = item.get(key)
+                if isinstance(target, dict):
+                    target = target.get('name', target.get('file'))
+                if isinstance(target, basestring) and target.strip():
+                    includes.append(target.split()[0])
+
+            # The roles of a play and their tags
+            for role in item.get('roles') or []:
+                if isinstance(role, dict):
+                    tags.update(cls._tags(role.get('tags')))
+                    role = role.get('role', role.get('name'))
+                if isinstance(role, basestring):
+                    includes.append(role)
+
+            for key in cls.TASK_LISTS:
+                cls._walk(item.get(key), tasks, tags, includes)
+
+    @staticmethod
+    def _tags(tags):
+        """
+        The tags as a list, from a list or a comma separated string
+        """
+        if tags is None:
+            return []
+        if not isinstance(tags, list):
+            tags = re.split(r'\s*,\s*', "%s" % tags)
+        return [("%s" % t).strip() for t in tags if ("%s" % t).strip()]
+
+# vim: ft=python:ts=4:sw=4
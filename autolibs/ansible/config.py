@@ -26,11 +26,11 @@
 from __future__ import print_function
 
 import os
-import configparser
-from cfutils.gitutils import *
+from autolibs.gitmeta import is_git_repo
+from autolibs.repoconfig import RepoConfig
 
 
-class AnsibleConfig:
+class AnsibleConfig(object):
     """
     Ansible Section Configuration
     """
@@ -39,15 +39,24 @@ class AnsibleConfig:
             raise ValueError("Not a GIT repository: %s" % repo_base)
         self._repo_base = repo_base
 
-        self.config_file = os.path.join(self._repo_base, self.config_file())
+        # Configuration section, shared with the other components and looked up
+        # at every access so the changes to the file are seen
+        repo_config = RepoConfig.of(self._repo_base)
+        repo_config.section("ansible", "Ansible")
+        self.config_file = repo_config.config_file
 
-        # Configuration section
-        self.config = configparser.ConfigParser()
-        self.config.read(self.config_file)
-        if "ansible" not in self.config.sections():
-            raise LookupError("Ansible configuration section doesn't exist in %s." % self.config_file)
+    @property
+    def config(self):
+        """
+        The parsed configuration file
+        """
+        return RepoConfig.of(self._repo_base).config
 
-        self._ansible = self.config['ansible']
+    def _get(self, option, default=None):
+        """
+        A value of the Ansible section
+        """
+        return RepoConfig.of(self._repo_base).get("ansible", option, default)
 
     @staticmethod
     def config_file():
@@ -60,7 +69,7 @@ class AnsibleConfig:
         """
         Base directory of Ansible
         """
-        base_dir = self._ansible.get("base_dir", "ansible")
+        base_dir = self._get("base_dir", "ansible")
         if full_path:
             base_dir = os.path.join(self._repo_base, base_dir)
         return base_dir
@@ -69,7 +78,7 @@ class AnsibleConfig:
         """
         Directory containing the roles
         """
-        roles_dir = self._ansible.get("roles_dir", "roles")
+        roles_dir = self._get("roles_dir", "roles")
         if full_path:
             roles_dir = os.path.join(self.base_dir(True), roles_dir)
         return roles_dir
@@ -78,7 +87,7 @@ class AnsibleConfig:
         """
         Directory containing the playbooks
         """
-        playbooks_dir = self._ansible.get("playbooks_dir", "playbooks")
+        playbooks_dir = self._get("playbooks_dir", "playbooks")
         if full_path:
             playbooks_dir = os.path.join(self.base_dir(True), playbooks_dir)
         return playbooks_dir
@@ -87,7 +96,7 @@ class AnsibleConfig:
         """
         Directory containing the inventories
         """
-        inventories_dir = self._ansible.get("inventories_dir", "inventories")
+        inventories_dir = self._get("inventories_dir", "inventories")
         if full_path:
             inventories_dir = os.path.join(self.base_dir(True), inventories_dir)
         return inventories_dir
@@ -96,42 +105,42 @@ class AnsibleConfig:
         """
         User used to run Ansible
         """
-        return self._ansible.get("run_as", None)
+        return self._get("run_as", None)
 
     def dynamic_inventory_file(self):
         """
         Name of the dynamic inventory script file
         """
-        return self._ansible.get("dynamic_inventory_file", "inventory")
+        return self._get("dynamic_inventory_file", "inventory")
 
     def vault_file(self):
         """
         Name of the file containing the Ansible Vault password
         """
-        return self._ansible.get("vault_file", "vault.txt")
+        return self._get("vault_file", "vault.txt")
 
     def ssh_key_file(self):
         """
         Name of the SSH private key used to connect to the remote machines
         """
-        return self._ansible.get("ssh_key_file", "access_key.pem")
+        return self._get("ssh_key_file", "access_key.pem")
 
     def exec_ansible(self):
         """
         Executable for "ansible-ansible"
         """
-        return self._ansible.get("exec_ansible", "ansible")
+        return self._get("exec_ansible", "ansible")
 
     def exec_ansible_playbook(self):
         """
         Executable for "ansible-playbook"
         """
-        return self._ansible.get("exec_ansible_playbook", "ansible-playbook")
+        return self._get("exec_ansible_playbook", "ansible-playbook")
 
     def exec_ansible_vault(self):
         """
         Executable for "ansible-vault"
         """
-        return self._ansible.get("exec_ansible_vault", "ansible-vault")
+        return self._get("exec_ansible_vault", "ansible-vault")
 
 # vim: ft=python:ts=4:sw=4
\ No newline at end of file
@@ -0,0 +1,395 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+#
+# Groups constructed from the compiled host variables, similar to the Ansible
+# "constructed" inventory plugin.
+#
+# A group with a "condition" receives all the hosts for which the expression is
+# true. A group with a "key" is a template: one group is created for every
+# distinct value of the key, named "<prefix>_<value>".
+#
+#    groups:
+#     - name: "redhat"
+#       condition: "ansible_os_family == 'RedHat' and not decommissioned"
+#     - name: "backend_net"
+#       condition: "subnet(ansible_host, '10.2.0.0/16')"
+#     - name: "dc"
+#       key: "datacenter"
+#       # Optional, defaults to the name of the entry
+#       prefix: "dc"
+#
+# When a group created from a key has the name of a group already defined, the
+# hosts are added to the existing group and its variables are kept.
+#
+# Expressions are evaluated once over the whole host table and not host by
+# host: for every variable referenced the table builds an inverted index
+# value -> hosts, then each expression is resolved with set operations on the
+# indexes. The indexes are shared by all the groups so adding a group that uses
+# already indexed variables costs only a few set operations.
+#
+# Supported expressions:
+#
+#   var == value, var != value, var < value, ... (also dotted names: ec2.az)
+#   the order comparisons match only numbers with numbers and strings with strings
+#   var in [value1, value2], var not in [...]
+#   'value' in list_var
+#   defined(var), undefined(var), match(var, 'regex'), subnet(var, 'CIDR')
+#   and, or, not, parenthesis, and a bare variable for truthiness
+#
+
+from __future__ import print_function
+
+import re
+import ast
+import socket
+import struct
+from collections import OrderedDict
+
+
+_MISSING = object()
+
+
+def lookup_var(variables, path, default=_MISSING):
+    """
+    Looks up a dotted variable path inside a dictionary of variables
+    """
+    value = variables
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            return default
+        value = value[key]
+    return value
+
+
+def ipv4_network(cidr):
+    """
+    Converts a CIDR string into a (network, netmask) tuple of integers
+    """
+    try:
+        address, prefix = (cidr.split('/', 1) + ['32'])[:2]
+        prefix = int(prefix)
+        if not 0 <= prefix <= 32:
+            raise ValueError()
+        netmask = (0xffffffff << (32 - prefix)) & 0xffffffff
+        return ipv4_to_int(address) & netmask, netmask
+    except (ValueError, AttributeError):
+        raise ValueError("Invalid network address '%s'." % cidr)
+
+
+def ipv4_to_int(address):
+    """
+    Converts an IPv4 address into an integer
+    """
+    try:
+        return struct.unpack('!I', socket.inet_aton(address))[0]
+    except (socket.error, TypeError):
+        raise ValueError("Invalid IPv4 address '%s'." % address)
+
+
+def comparable(a, b):
+    """
+    Tells if two values can be ordered: both numbers, booleans excluded, or both strings
+    """
+    def is_number(x):
+        return isinstance(x, (int, long, float)) and not isinstance(x, bool)
+
+    if is_number(a) and is_number(b):
+        return True
+    return isinstance(a, basestring) and isinstance(b, basestring)
+
+
+def group_name(name):
+    """
+    Transforms a string into a valid Ansible group name
+    """
+    return re.sub(r'[^A-Za-z0-9_]', '_', name)
+
+
+class HostTable(object):
+    """
+    Column-oriented view of the compiled hosts
+    """
+
+    def __init__(self, host_vars):
+        self.names = sorted(host_vars)
+        self._rows = [host_vars[h] for h in self.names]
+        self.all_rows = frozenset(range(len(self.names)))
+
+        self._columns = {}
+        self._elements = {}
+        self._defined = {}
+
+    def column(self, var):
+        """
+        Inverted index value -> set of row numbers for a (dotted) variable. The
+        index is built on first use with a single pass over the table.
+        """
+        if var in self._columns:
+            return self._columns[var]
+
+        path = var.split('.')
+        index, elements, defined = {}, {}, set()
+
+        for i, row in enumerate(self._rows):
+            value = lookup_var(row, path)
+            if value is _MISSING:
+                continue
+            defined.add(i)
+
+            # Lists are indexed both as a whole and by their elements
+            if isinstance(value, list):
+                for item in value:
+                    if not isinstance(item, (dict, list)):
+                        elements.setdefault(item, set()).add(i)
+                value = tuple(value)
+
+            try:
+                index.setdefault(value, set()).add(i)
+            except TypeError:
+                # Unhashable values (dictionaries) can only be tested as defined
+                continue
+
+        self._columns[var] = index
+        self._elements[var] = elements
+        self._defined[var] = frozenset(defined)
+        return index
+
+    def elements(self, var):
+        """
+        Inverted index element -> set of row numbers for list variables
+        """
+        self.column(var)
+        return self._elements[var]
+
+    def defined(self, var):
+        """
+        Row numbers where the variable is defined
+        """
+        self.column(var)
+        return self._defined[var]
+
+    def select(self, var, predicate):
+        """
+        Row numbers whose value satisfies a predicate. The predicate is called
+        once per distinct value, not once per host.
+        """
+        result = set()
+        for value, rows in self.column(var).iteritems():
+            try:
+                if predicate(value):
+                    result |= rows
+            except (TypeError, ValueError):
+                continue
+        return result
+
+    def hosts(self, rows):
+        """
+        Host names of a set of row numbers, in a stable order
+        """
+        return [self.names[i] for i in sorted(rows)]
+
+
+class ConditionEvaluator(object):
+    """
+    Evaluates condition expressions over a HostTable producing sets of rows
+    """
+
+    _COMPARE = {
+        ast.Lt:  lambda a, b: a < b,
+        ast.LtE: lambda a, b: a <= b,
+        ast.Gt:  lambda a, b: a > b,
+        ast.GtE: lambda a, b: a >= b,
+    }
+
+    def __init__(self, table):
+        self.table = table
+        self._parsed = {}
+
+    def evaluate(self, expression):
+        """
+        Returns the set of rows matching the expression
+        """
+        if expression not in self._parsed:
+            try:
+                self._parsed[expression] = ast.parse(expression.strip(), mode='eval').body
+            except SyntaxError as e:
+                raise ValueError("Invalid condition '%s': %s." % (expression, e))
+
+        try:
+            return self._eval(self._parsed[expression])
+        except ValueError as e:
+            raise ValueError("Invalid condition '%s': %s" % (expression, e))
+
+    def _eval(self, node):
+        if isinstance(node, ast.BoolOp):
+            results = [self._eval(v) for v in node.values]
+            if isinstance(node.op, ast.And):
+                return set.intersection(*[set(r) for r in results])
+            return set.union(*[set(r) for r in results])
+
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return self.table.all_rows - self._eval(node.operand)
+
+        if isinstance(node, ast.Compare):
+            # Chained comparisons like "a < x < b" are split in pairs
+            result, left = set(self.table.all_rows), node.left
+            for op, right in zip(node.ops, node.comparators):
+                result &= self._compare(left, op, right)
+                left = right
+            return result
+
+        if isinstance(node, ast.Call):
+            return self._call(node)
+
+        if self._is_var(node):
+            var = self._var_name(node)
+            return self.table.select(var, bool)
+
+        raise ValueError("unsupported expression '%s'." % type(node).__name__)
+
+    def _compare(self, left, op, right):
+        # Literal in list variable
+        if isinstance(op, (ast.In, ast.NotIn)) and self._is_var(right) and not self._is_var(left):
+            var = self._var_name(right)
+            rows = set(self.table.elements(var).get(self._literal(left), ()))
+            if isinstance(op, ast.NotIn):
+                return self.table.all_rows - rows
+            return rows
+
+        if not self._is_var(left):
+            raise ValueError("the left side of a comparison must be a variable.")
+
+        var, value = self._var_name(left), self._literal(right)
+
+        if isinstance(op, (ast.Eq, ast.NotEq)):
+            rows = set(self.table.column(var).get(self._hashable(value), ()))
+            if isinstance(op, ast.NotEq):
+                return self.table.all_rows - rows
+            return rows
+
+        if isinstance(op, (ast.In, ast.NotIn)):
+            if not isinstance(value, (list, tuple)):
+                raise ValueError("the right side of 'in' must be a list.")
+            column = self.table.column(var)
+            rows = set()
+            for v in value:
+                rows |= column.get(self._hashable(v), set())
+            if isinstance(op, ast.NotIn):
+                return self.table.all_rows - rows
+            return rows
+
+        if type(op) in self._COMPARE:
+            compare = self._COMPARE[type(op)]
+            if not comparable(value, value):
+                raise ValueError("the right side of '%s' must be a number or a string." % type(op).__name__)
+            return self.table.select(var, lambda x: comparable(x, value) and compare(x, value))
+
+        raise ValueError("unsupported operator '%s'." % type(op).__name__)
+
+    def _call(self, node):
+        name = node.func.id if isinstance(node.func, ast.Name) else None
+        if not node.args or not self._is_var(node.args[0]):
+            raise ValueError("the first argument of '%s' must be a variable." % name)
+        var = self._var_name(node.args[0])
+
+        if name == 'defined' and len(node.args) == 1:
+            return set(self.table.defined(var))
+
+        if name == 'undefined' and len(node.args) == 1:
+            return self.table.all_rows - self.table.defined(var)
+
+        if name == 'match' and len(node.args) == 2:
+            regex = re.compile(self._literal(node.args[1]))
+            return self.table.select(var, lambda x: regex.search(x) is not None)
+
+        if name == 'subnet' and len(node.args) == 2:
+            network, netmask = ipv4_network(self._literal(node.args[1]))
+            return self.table.select(var, lambda x: ipv4_to_int(x) & netmask == network)
+
+        raise ValueError("unsupported function '%s'." % name)
+
+    def _is_var(self, node):
+        if isinstance(node, ast.Attribute):
+            return self._is_var(node.value)
+        return isinstance(node, ast.Name) and node.id not in ['True', 'False', 'None']
+
+    def _var_name(self, node):
+        if isinstance(node, ast.Attribute):
+            return "%s.%s" % (self._var_name(node.value), node.attr)
+        return node.id
+
+    @staticmethod
+    def _literal(node):
+        try:
+            return ast.literal_eval(node)
+        except ValueError:
+            raise ValueError("expected a literal value.")
+
+    @staticmethod
+    def _hashable(value):
+        return tuple(value) if isinstance(value, list) else value
+
+
+def evaluate_constructed_groups(host_vars, conditional=None, keyed=None, existing=()):
+    """
+    Evaluates the constructed groups over the compiled host variables. Returns
+    an ordered dictionary group name -> sorted list of host names and, for keyed
+    groups, the list of group definitions that have been generated. No definition
+    is generated for the names in existing, their hosts are only added.
+    """
+    table = HostTable(host_vars)
+    evaluator = ConditionEvaluator(table)
+    memberships = OrderedDict()
+    generated = []
+
+    for g in conditional or []:
+        memberships[g['name']] = table.hosts(evaluator.evaluate(g['condition']))
+
+    for g in keyed or []:
+        prefix = g.get('prefix', g['name'])
+        separator = g.get('separator', '_')
+        rows = evaluator.evaluate(g['condition']) if g.get('condition') else table.all_rows
+
+        for value, value_rows in sorted(table.column(g['key']).items()):
+            if isinstance(value, tuple) or value is None or value == "":
+                continue
+            value_rows = value_rows & rows
+            if not value_rows:
+                continue
+
+            name = group_name("%s%s%s" % (prefix, separator, value) if prefix else "%s" % value)
+            if name not in memberships and name not in existing:
+                definition = dict((k, v) for k, v in g.items() if k not in ['key', 'prefix', 'separator', 'condition'])
+                definition['name'] = name
+                definition['description'] = g.get('description', "%s %s" % (prefix or g['key'], value))
+                generated.append(definition)
+                memberships[name] = []
+
+            memberships[name] = sorted(set(memberships.get(name, [])) | set(table.hosts(value_rows)))
+
+    return memberships, generated
+
+# vim: ft=python:ts=4:sw=4
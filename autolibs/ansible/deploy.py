@@ -39,17 +39,18 @@ from cfutils.formatting import print_c
 
 class DeployConfig:
 
-    def __init__(self, repo_info, playbook_file, target, filter, kwargs=[]):
+    def __init__(self, repo_info, playbook_file, target, filter, kwargs=()):
 
         # Load all the variables that configure the deployment
         self._set_playbook(repo_info, playbook_file)
         self._set_inventory(repo_info, target)
+        self._set_environment(repo_info, target)
         self._set_vault(repo_info, target)
         self._set_ssh_key(repo_info, target)
 
         # Add vault if needed
         self.common_args = ""
-        if len(repo_info.vaulted()) > 0:
+        if repo_info.any_vaulted():
             if self.vault_file is not None:
                 self.common_args += " --vault-password-file=%s" % self.vault_file
             else:
@@ -122,6 +123,16 @@ class DeployConfig:
         if self.inventory is None:
             raise ScriptError("Can't find the inventory file anywhere in %s." % search_in)
 
+    def _set_environment(self, repo_info, target):
+        """
+        Sets the environment variables for Ansible and the inventory scripts
+        """
+        self.environment = {}
+
+        # The dynamic inventory loads only the subtrees of the target
+        if self.use_dynamic:
+            self.environment['INVENTORY_PARTITION'] = target
+
     def _set_vault(self, repo_info, target):
         """
         Sets the configuration for using vaulted files
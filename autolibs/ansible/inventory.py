@@ -38,15 +38,34 @@
 #    # merged over the parent ones.
 #    import: [ 'other_file.yml', 'other_dir/', 'wildcard*' ]
 #
+#    # Imports and executables can be tagged with the partitions that need them,
+#    # usually the environments. When a partition is selected, with --partition
+#    # or INVENTORY_PARTITION, the entries tagged only for other partitions are
+#    # not parsed nor executed. Untagged entries are always loaded.
+#    import:
+#     - 'common/'
+#     - { path: 'production/', partitions: ['prod'] }
+#
 #    # The executables described here will be executed and their YAML output
 #    # be included the same way as with the "import" statement. The loading
 #    # happens sequentially following the list. The items loaded with this
-#    # statement overrides the "import" statement
+#    # statement overrides the "import" statement. The paths are relative to the
+#    # directory of the inventory script and the working directories to the one
+#    # where the script was started, or the repository base when the inventory is
+#    # used as a library.
 #    executables:
 #     - path: inventory-aws
 #       args: ["-r eu-west-2"]
 #       working_dir: "."
 #       environment:  {}
+#       partitions: ["prod", "staging"]
+#     # Executables printing one JSON record per line, {"host": {...}},
+#     # {"group": {...}} or {"vars": {...}}, are started before the imports are
+#     # loaded and their records are read and merged by a thread of their own
+#     # as they arrive, while the imports are loaded and the others run
+#     - path: inventory-aws
+#       args: ["--ndjson"]
+#       format: ndjson
 #
 #    # Hosts section
 #    hosts:
@@ -72,6 +91,27 @@
 #       description: "RedHat 7"
 #       # Groups can be categorized to assign them a meaning
 #       type: "linux_distribution"
+#     - name: "centos_lon"
+#       # Groups with a condition receive all the hosts whose compiled variables
+#       # satisfy it. See constructed.py for the supported expressions.
+#       condition: "ansible_distribution == 'CentOS' and datacenter == 'lon'"
+#     - name: "dc"
+#       # Groups with a key create one group per distinct value of the host
+#       # variable, in this case "dc_<datacenter>"
+#       key: "datacenter"
+#
+#    # Facts copied from Ansible's jsonfile fact cache into the host variables,
+#    # so groups with a condition or a key can use them and playbooks can skip
+#    # gathering facts. The path defaults to fact_caching_connection in the
+#    # ansible.cfg and, when a partition is selected, its subdirectory is used
+#    # if present. Fact files older than max_age seconds are ignored, the default
+#    # is fact_caching_timeout and 0 never expires. Facts override inventory vars.
+#    facts:
+#      path: "~/.ansible/facts"
+#      max_age: 86400
+#      vars:
+#       - ansible_distribution
+#       - { name: "memory_mb", fact: "ansible_memtotal_mb" }
 #
 #    # Global variables
 #    vars:
@@ -125,33 +165,108 @@ import glob
 import time
 import copy
 import json
+import hashlib
+import threading
+import fnmatch
+import marshal
 import StringIO
+import subprocess
+import multiprocessing
 from repository import *
+from constructed import *
+from inventorydb import *
+from inventorydiff import *
+from autolibs.gitmeta import fingerprint
+from profiler import Profiler
 from cfutils.execute import *
 from cfutils.formatting import *
 
 
+# Data of the inventory being compiled, set only inside the worker processes
+_WORKER = {}
+
+# Marks the facts missing from the fact cache, as None is a valid value
+_NO_FACT = object()
+
+
+def compile_host(host, ansible_groups):
+    """
+    Resolves the variables of one host merging, in order, the variables of the
+    groups it belongs to and its own variables
+    """
+    h_name     = host["name"]
+    h_memberof = list(host.get("memberof") or [])
+    h_vars     = host.get("vars", {}) or {}
+
+    g_vars = {}
+    for g in h_memberof:
+        g_vars = merge(g_vars, ansible_groups[g]["vars"])
+    h_vars = merge(g_vars, h_vars)
+
+    h_vars = merge(h_vars, {
+        "memberof": h_memberof
+    })
+
+    return h_name, {
+        "vars": h_vars,
+        "member_of": h_memberof
+    }
+
+
+def _init_worker(ansible_groups, host_list):
+    """
+    Receives the data of the inventory when a worker process starts. The processes
+    are forked so the data is inherited and not pickled.
+    """
+    _WORKER['groups'] = ansible_groups
+    _WORKER['hosts'] = host_list
+
+
+def _compile_shard(bounds):
+    """
+    Compiles a contiguous shard of the host list inside a worker process. Only the
+    names and the variables are sent back, the groups are a copy of "memberof",
+    as a single marshal string: the parent rebuilds the variables of every host at
+    C speed instead of unpickling them object by object. The variables are plain
+    data, like the ones saved in the JSON cache.
+    """
+    start, end = bounds
+    return marshal.dumps([
+        (h_name, host["vars"])
+        for h_name, host in (compile_host(h, _WORKER['groups']) for h in _WORKER['hosts'][start:end])
+    ])
+
+
 class YAMLInventory(object):
 
-    def __init__(self, yaml_file, override_yaml="", repo_info=None):
+    CACHE_EXPIRE = 180
+    PARALLEL_MIN_HOSTS = 1000
+
+    def __init__(self, yaml_file, override_yaml="", repo_info=None, partition=None, workers=None, cache_file=None,
+                 profiler=None, script_dir=None, working_dir=None):
         repo_info = AnsibleRepo() if repo_info is None else repo_info
         if repo_info.base is None:
-            print_c("ERROR: ", color="light_red", end='')
-            print("The current directory is not a GIT repository.")
-            sys.exit(1)
-
-        local_tmp = repo_info.ans_config('defaults', 'local_tmp', '~/.ansible/tmp')
+            raise LookupError("The current directory is not a GIT repository.")
 
         self.ansible_group_list = []
         self.ansible_host_list  = []
         self.group_list         = []
         self.host_list          = []
         self.global_vars        = {}
+        self.keyed_groups       = []
+        self.facts              = {}
+        self.hashes             = {}
+        self.sources            = {}
+        self.dynamic            = False
+        self.script_dir         = paths_full(script_dir or repo_info.base)
+        self.working_dir        = paths_full(working_dir or repo_info.base)
         self.inventory_base     = self.detect_inventory_base(yaml_file, repo_info)
         self.yaml_file          = yaml_file
-        self.cache_file         = paths_full(local_tmp, 'inventory-cache.yml')
-        self.CACHE_EXPIRE       = 180
+        self.partition          = partition or None
+        self.workers            = int(workers or 1) if workers != 0 else multiprocessing.cpu_count()
+        self.cache_file         = cache_file or self.cache_path(repo_info, self.partition, yaml_file, override_yaml)
         self.override_yaml      = override_yaml
+        self.profiler           = profiler or Profiler(enabled=False)
 
         # Load from cache only if the script has been called from the same process or
         # the cache is older than X minutes (inventory changes are not frequent)
@@ -161,35 +276,64 @@ class YAMLInventory(object):
         if load_cache:
             try:
                 # Loads the data from the cache file
-                load_cache = self._load_cache()
+                with self.profiler.phase('load_cache'):
+                    load_cache = self._load_cache() and not sources_changed(self.sources)
             except (ValueError, IOError):
-                # Cache is disabled if there are issues loading it
+                # Cache is disabled if there are issues loading it, another
+                # thread or process may have removed it already
                 load_cache = False
-                os.remove(self.cache_file)
+                try:
+                    os.remove(self.cache_file)
+                except OSError:
+                    pass
                 print("Error loading the cache file. Discarding cache.", file=sys.stderr)
 
+        self.profiler.count('cache', 'hit' if load_cache else 'miss')
+
         if not load_cache:
             """ Loading steps """
             # Load all the YAML files, starting with the main file
-            self._load_yaml()
+            with self.profiler.phase('load_yaml'):
+                self._load_yaml()
+            # Separates the group templates that are expanded from host variables
+            with self.profiler.phase('split_keyed_groups'):
+                self._split_keyed_groups()
 
             # Adds some predefined groups common to all hosts
-            self._add_default_groups()
+            with self.profiler.phase('add_default_groups'):
+                self._add_default_groups()
             # Checks that all the groups referenced by hosts and groups are
             # present in the group list
-            self._check_groups()
+            with self.profiler.phase('check_groups'):
+                self._check_groups()
             # Adds some predefined global variables
-            self._add_default_variables()
+            with self.profiler.phase('add_default_variables'):
+                self._add_default_variables()
 
             # Converts the group data structure loaded from the YAML file into
             # the group data structure required by Ansible.
-            self._create_ansible_groups()
+            with self.profiler.phase('create_ansible_groups'):
+                self._create_ansible_groups()
             # Converts the host data structure loaded from the YAML file into
             # host data structure required by Ansible.
-            self._create_ansible_hosts()
+            with self.profiler.phase('create_ansible_hosts'):
+                self._create_ansible_hosts()
+            # Copies the configured facts from the fact cache into the hosts
+            with self.profiler.phase('add_fact_variables'):
+                self._add_fact_variables(repo_info)
+            # Evaluates the groups constructed from the compiled host variables
+            with self.profiler.phase('create_constructed_groups'):
+                self._create_constructed_groups()
+            # Computes the content hashes of the compiled hosts and groups
+            with self.profiler.phase('compute_hashes'):
+                self.hashes = compute_hashes(self.ansible_host_list, self.ansible_group_list)
 
             # Saves the data in the cache
-            self._save_cache()
+            with self.profiler.phase('save_cache'):
+                self._save_cache()
+
+        self.profiler.count('hosts', len(self.ansible_host_list))
+        self.profiler.count('groups', len(self.ansible_group_list))
 
     def get_list(self):
         """
@@ -226,21 +370,95 @@ class YAMLInventory(object):
             return self.group_list
         return "\n".join([x[attribute] for x in self.group_list if attribute in x])
 
-    def detect_inventory_base(self, main_yaml_file, repo_info, opt_paths=[]):
+    def query(self, hosts=None, groups=None, fields=None):
+        """
+        CUSTOM: Returns a projection of the hosts matching any of the host patterns
+        and belonging to any of the groups, patterns can use shell wildcards. Without
+        fields only the sorted names are returned, otherwise a list of dictionaries
+        with the requested (dotted) variables. The field "groups" lists the groups
+        of the host.
+        """
+        # Restrict the candidates using the group members
+        if groups:
+            candidates = set()
+            for pattern in groups:
+                for g_name in self._match_names(pattern, self.ansible_group_list):
+                    candidates.update(self.ansible_group_list[g_name]["hosts"])
+            candidates.intersection_update(self.ansible_host_list)
+        else:
+            candidates = self.ansible_host_list
+
+        if hosts:
+            selected = set()
+            for pattern in hosts:
+                selected.update(self._match_names(pattern, candidates))
+        else:
+            selected = candidates
+
+        names = sorted(selected)
+        if not fields:
+            return names
+
+        result = []
+        for h_name in names:
+            host = self.ansible_host_list[h_name]
+            entry = {'name': h_name}
+            for field in fields:
+                if field == 'groups':
+                    entry[field] = sorted(host["member_of"])
+                elif field != 'name':
+                    entry[field] = lookup_var(host["vars"], field.split('.'), None)
+            result.append(entry)
+
+        return result
+
+    @classmethod
+    def from_cache(cls, cache_file):
+        """
+        CUSTOM: Loads a compiled inventory directly from a cache file, regardless of
+        its age and without looking for the YAML sources
+        """
+        inventory = cls.__new__(cls)
+        inventory.cache_file = cache_file
+        if not inventory._load_cache():
+            raise ValueError("The inventory cache %s is incomplete." % cache_file)
+        return inventory
+
+    @classmethod
+    def load_database(cls, yaml_file, override_yaml="", repo_info=None, partition=None, **kwargs):
+        """
+        CUSTOM: Opens the SQLite materialisation of the inventory. The inventory is
+        compiled and materialised again only when its files changed, or after
+        CACHE_EXPIRE seconds if it runs executables or reads facts. Other keyword
+        arguments are passed to the constructor.
+        """
+        repo_info = AnsibleRepo() if repo_info is None else repo_info
+        cache_file = cls.cache_path(repo_info, partition or None, yaml_file, override_yaml)
+        profiler = kwargs.get('profiler', None) or Profiler(enabled=False)
+
+        database = InventoryDB(re.sub(r'\.yml$', '.db', cache_file))
+        if not database.is_fresh(override_yaml, cls.CACHE_EXPIRE):
+            inventory = cls(yaml_file, override_yaml, repo_info, partition, **kwargs)
+            with profiler.phase('build_database'):
+                database.build(inventory)
+
+        return database
+
+    def detect_inventory_base(self, main_yaml_file, repo_info, opt_paths=()):
         """
         Searches for the YAML main file in a series of default locations
         """
         # Search priority:
-        #  - The specified YAML file
+        #  - The specified YAML file, relative to the working directory
         #  - The directory where the script is located
         #  - The inventory directory configured for the repository
         #  - The repository root
         search_in = [
-            paths_full(os.path.dirname(main_yaml_file)),
-            paths_full(os.path.dirname(sys.argv[0])),
+            paths_full(self.working_dir, os.path.dirname(main_yaml_file)),
+            self.script_dir,
             paths_full(repo_info.base, repo_info.inventory_base),
             paths_full(repo_info.base)
-        ] + opt_paths
+        ] + list(opt_paths)
 
         for where in search_in:
             full_path = paths_full(where, main_yaml_file)
@@ -249,6 +467,30 @@ class YAMLInventory(object):
 
         raise Exception("Can't find the inventory base anywhere in %s." % search_in)
 
+    @staticmethod
+    def cache_path(repo_info, partition=None, yaml_file=None, override_yaml=""):
+        """
+        Path of the cache file. Each repository, main file, override and partition
+        has its own, as local_tmp can be shared by many repositories.
+        """
+        local_tmp = paths_full(repo_info.base, os.path.expanduser(
+            repo_info.ans_config('defaults', 'local_tmp', '~/.ansible/tmp')
+        ))
+        repo_id = hashlib.sha1(os.path.abspath(repo_info.base).encode('utf-8')).hexdigest()[:12]
+        inventory_id = hashlib.sha1(json.dumps([yaml_file, override_yaml or ""])).hexdigest()[:12]
+
+        name = 'inventory-cache-%s-%s' % (repo_id, inventory_id)
+        if partition is not None:
+            name += '-%s' % re.sub(r'[^\w.-]', '_', partition)
+        return paths_full(local_tmp, '%s.yml' % name)
+
+    @staticmethod
+    def _match_names(pattern, names):
+        """ Names matching a shell pattern, without scanning them for plain names """
+        if not any(c in pattern for c in "*?["):
+            return [pattern] if pattern in names else []
+        return fnmatch.filter(names, pattern)
+
     @staticmethod
     def get_empty():
         """ Returns an empty inventory """
@@ -280,7 +522,7 @@ class YAMLInventory(object):
         """ Load the whole YAML inventory """
         self.group_list, self.host_list, self.global_vars = self._load_flat(self.yaml_file)
 
-    def _load_flat(self, file_path=None, load_list=[], use_yaml=None, is_first=True):
+    def _load_flat(self, file_path=None, load_list=None, use_yaml=None, is_first=True):
         """
         Loads a YAML file, including its imports, into separate instance variables.
         The data in the imported YAML files is all stored as a flat list, no hierarchy information is kept.
@@ -292,11 +534,16 @@ class YAMLInventory(object):
         if not file_path:
             file_path = self.yaml_file
 
+        # The files already imported by this load, to avoid circular graphs
+        if load_list is None:
+            load_list = []
+
         # Load in memory all the YAML data
         try:
             if use_yaml:
                 fp = StringIO.StringIO(use_yaml)
             else:
+                self._watch(paths_full(self.inventory_base, file_path))
                 fp = open(paths_full(self.inventory_base, file_path), "r")
             yaml_docs = yaml.load_all(fp, Loader=yaml.CLoader)
 
@@ -311,66 +558,103 @@ class YAMLInventory(object):
                 host_list    = doc.get("hosts",  []) or []
                 global_vars  = doc.get("vars",   {}) or {}
 
-                # Import from files and directories
-                for import_file in imports_list:
-                    import_file = paths_full(self.inventory_base, import_file)
+                # The configuration of the facts is merged in loading order
+                self.facts = merge(self.facts, doc.get("facts", {}) or {})
+
+                # Streaming executables are started first, they run and their
+                # records are read while the imports are loaded
+                streams = {}
+                try:
+                    for n, exec_entry in enumerate(execs_list):
+                        if self._in_partition(exec_entry) and exec_entry.get('format') == 'ndjson':
+                            streams[n] = self._start_stream(exec_entry)
+
+                    # Import from files and directories
+                    for import_entry in imports_list:
+                        # Subtrees needed only by other partitions are skipped entirely
+                        if not self._in_partition(import_entry):
+                            continue
+
+                        import_file = import_entry['path'] if isinstance(import_entry, dict) else import_entry
+                        import_file = paths_full(self.inventory_base, import_file)
 
-                    # Scan through BASH expansion (ignoring bad entries too)
-                    for yml_file in glob.glob(import_file):
-                        # Load only YAML files or directories, skip the others
-                        if not os.path.isdir(yml_file):
-                            if not re.match('.*\.ya?ml$', yml_file):
-                                continue
+                        # New files matching a pattern change the directories
+                        if glob.has_magic(import_file):
+                            for import_dir in glob.glob(os.path.dirname(import_file)):
+                                self._watch(import_dir)
 
-                        # Avoid circular graphs
-                        if yml_file in load_list:
+                        # Scan through BASH expansion (ignoring bad entries too)
+                        for yml_file in glob.glob(import_file):
+                            # Load only YAML files or directories, skip the others
+                            if not os.path.isdir(yml_file):
+                                if not re.match('.*\.ya?ml$', yml_file):
+                                    continue
+
+                            # Avoid circular graphs
+                            if yml_file in load_list:
+                                continue
+                            load_list.append(yml_file)
+
+                            # Load YAML data
+                            yml_file = paths_full(self.inventory_base, yml_file)
+
+                            # Imports work both on files and directories
+                            if os.path.isfile(yml_file):
+                                to_import = [yml_file]
+                            elif os.path.isdir(yml_file):
+                                self._watch(yml_file)
+                                to_import = [paths_full(yml_file, i) for i in os.listdir(yml_file)]
+                            else:
+                                raise Exception("Can't find inventory file %s imported from %s." % (yml_file, file_path))
+
+                            # Recursively load the data from the imports and merge the result
+                            for i in to_import:
+                                with self.profiler.phase(i, 'files'):
+                                    i_groups, i_hosts, i_vars = self._load_flat(i, load_list, use_yaml=None, is_first=False)
+
+                                group_list  = self._merge_import_objs(group_list, i_groups)
+                                host_list   = self._merge_import_objs(host_list, i_hosts)
+                                global_vars = merge(global_vars, i_vars)
+
+                    # Execute the scripts and include their output
+                    for n, exec_entry in enumerate(execs_list):
+                        if not self._in_partition(exec_entry):
                             continue
-                        load_list.append(yml_file)
 
-                        # Load YAML data
-                        yml_file = paths_full(self.inventory_base, yml_file)
+                        # The output of the executables can change at any time
+                        self.dynamic = True
 
-                        # Imports work both on files and directories
-                        if os.path.isfile(yml_file):
-                            to_import = [yml_file]
-                        elif os.path.isdir(yml_file):
-                            to_import = [paths_full(yml_file, i) for i in os.listdir(yml_file)]
-                        else:
-                            raise Exception("Can't find inventory file %s imported from %s." % (yml_file, file_path))
+                        cmd, working_dir, env = self._executable_command(exec_entry)
+                        exec_path = paths_full(self.script_dir, exec_entry['path'])
 
-                        # Recursively load the data from the imports and merge the result
-                        for i in to_import:
-                            i_groups, i_hosts, i_vars = self._load_flat(i, load_list, use_yaml=None, is_first=False)
+                        # Wait for the records of the streaming executables
+                        if n in streams:
+                            with self.profiler.phase(cmd, 'executables'):
+                                records = self._stream_records(streams[n])
+                            if records is None:
+                                continue
+                            i_groups, i_hosts, i_vars = records
 
                             group_list  = self._merge_import_objs(group_list, i_groups)
                             host_list   = self._merge_import_objs(host_list, i_hosts)
                             global_vars = merge(global_vars, i_vars)
+                            continue
 
-                # Execute the scripts and include their output
-                for exec_entry in execs_list:
-                    # Working directory
-                    working_dir = exec_entry.get('working_dir', os.getcwd()) or os.getcwd()
-
-                    # Environment variables
-                    env = os.environ.copy()
-                    env.update(exec_entry.get('environment', {}) or {})
-
-                    # Command to execute
-                    args = exec_entry.get('args', []) or []
-                    exec_path = paths_full(os.path.dirname(sys.argv[0]), exec_entry['path'])
-                    cmd = "%s %s" % (exec_path, ' '.join(args))
-
-                    # Execute
-                    stdout, stderr, rc = exec_cmd(cmd, cwd=working_dir, env=env)
-                    if rc != 0:
-                        print(stderr, file=sys.stderr)
-                        continue
+                        # Execute
+                        with self.profiler.phase(cmd, 'executables'):
+                            stdout, stderr, rc = exec_cmd(cmd, cwd=working_dir, env=env)
+                            if rc != 0:
+                                print(stderr, file=sys.stderr)
+                                continue
 
-                    # Merge recursively the result
-                    i_groups, i_hosts, i_vars = self._load_flat(i, load_list, use_yaml=stdout, is_first=False)
-                    group_list  = self._merge_import_objs(group_list, i_groups)
-                    host_list   = self._merge_import_objs(host_list, i_hosts)
-                    global_vars = merge(global_vars, i_vars)
+                            # Merge recursively the result
+                            i_groups, i_hosts, i_vars = self._load_flat(exec_path, load_list, use_yaml=stdout, is_first=False)
+                        group_list  = self._merge_import_objs(group_list, i_groups)
+                        host_list   = self._merge_import_objs(host_list, i_hosts)
+                        global_vars = merge(global_vars, i_vars)
+                finally:
+                    # The streams not read, because of an error, are stopped
+                    self._stop_streams(streams)
 
         except (IOError, yaml.YAMLError), exc:
             raise Exception("Error loading file file %s: %s." % (file_path, exc))
@@ -385,6 +669,135 @@ class YAMLInventory(object):
 
         return group_list, host_list, global_vars
 
+    def _watch(self, path):
+        """
+        Records the fingerprint of a file or directory the inventory is loaded from
+        """
+        self.sources[path] = fingerprint(path)
+
+    def _executable_command(self, exec_entry):
+        """
+        Command line, working directory and environment of an executable
+        """
+        # Working directory
+        working_dir = paths_full(self.working_dir, exec_entry.get('working_dir', '') or '')
+
+        # Environment variables
+        env = os.environ.copy()
+        env.update(exec_entry.get('environment', {}) or {})
+
+        # Command to execute
+        args = exec_entry.get('args', []) or []
+        exec_path = paths_full(self.script_dir, exec_entry['path'])
+        cmd = "%s %s" % (exec_path, ' '.join(args))
+
+        return cmd, working_dir, env
+
+    def _start_stream(self, exec_entry):
+        """
+        Starts a streaming executable and the thread that reads its records while
+        it runs. Returns the process, the thread and where the thread puts the
+        records or the error.
+        """
+        cmd, working_dir, env = self._executable_command(exec_entry)
+        process = subprocess.Popen(cmd, shell=True, cwd=working_dir, env=env, stdout=subprocess.PIPE)
+        result = {}
+
+        def read():
+            try:
+                result['records'] = self._read_ndjson(process, cmd)
+            except Exception as e:
+                result['error'] = e
+
+        reader = threading.Thread(target=read, name="ndjson %s" % cmd)
+        reader.daemon = True
+        reader.start()
+
+        return process, reader, result
+
+    @staticmethod
+    def _stream_records(stream):
+        """
+        Waits for the records of a streaming executable, raising its error if the
+        output is invalid
+        """
+        process, reader, result = stream
+        reader.join()
+        if 'error' in result:
+            raise result['error']
+        return result['records']
+
+    def _read_ndjson(self, process, cmd):
+        """
+        Reads the records of a streaming executable while it's still running, in
+        the thread of the stream. The records with the same name are merged in
+        order as they arrive. Returns None if the executable fails.
+        """
+        lists = {'group': [], 'host': []}
+        index = {'group': {}, 'host': {}}
+        global_vars = {}
+
+        for line in iter(process.stdout.readline, ''):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                process.kill()
+                raise Exception("Invalid record in the output of %s: %s." % (cmd, e))
+
+            if 'vars' in record:
+                global_vars = merge(global_vars, record['vars'] or {})
+
+            for kind in ['group', 'host']:
+                if kind not in record:
+                    continue
+                item = record[kind]
+                if not isinstance(item, dict) or not item.get('name'):
+                    process.kill()
+                    raise Exception("The %s records must have a name, in the output of %s." % (kind, cmd))
+
+                position = index[kind].get(item['name'])
+                if position is None:
+                    index[kind][item['name']] = len(lists[kind])
+                    lists[kind].append(item)
+                else:
+                    lists[kind][position] = merge(lists[kind][position], item)
+
+        process.stdout.close()
+        if process.wait() != 0:
+            print("The executable %s failed with exit code %d." % (cmd, process.returncode), file=sys.stderr)
+            return None
+
+        return lists['group'], lists['host'], global_vars
+
+    @staticmethod
+    def _stop_streams(streams):
+        """
+        Kills the streaming executables still running and waits for all of them
+        and for their threads
+        """
+        for process, reader, _ in streams.values():
+            if process.poll() is None:
+                process.kill()
+            reader.join(5)
+            if not reader.is_alive() and not process.stdout.closed:
+                process.stdout.close()
+            process.wait()
+
+    def _in_partition(self, entry):
+        """
+        Checks if an import or executable entry is needed by the selected partition
+        """
+        if self.partition is None or not isinstance(entry, dict):
+            return True
+
+        partitions = entry.get('partitions', []) or []
+        if not isinstance(partitions, list):
+            partitions = [partitions]
+
+        return not partitions or self.partition in partitions
+
     def _check_yaml_format(self, doc, file_path):
         """
         Checks the format of each YAML entry, to ensure it's in the correct format
@@ -395,6 +808,16 @@ class YAMLInventory(object):
         if not isinstance(doc.get("executables", []) or [], list):
             raise Exception("The key 'executables' must be a list, in %s." % file_path)
 
+        for entry in doc.get("executables", []) or []:
+            if not isinstance(entry, dict) or not entry.get('path'):
+                raise Exception("The executables must be dictionaries with a 'path' key, in %s." % file_path)
+            if entry.get('format', 'yaml') not in ['yaml', 'ndjson']:
+                raise Exception("The format of the executables must be 'yaml' or 'ndjson', in %s." % file_path)
+
+        for entry in doc.get("import", []) or []:
+            if not isinstance(entry, basestring) and not (isinstance(entry, dict) and entry.get('path')):
+                raise Exception("The imports must be paths or dictionaries with a 'path' key, in %s." % file_path)
+
         if not isinstance(doc.get("groups", []) or [], list):
             raise Exception("The key 'groups' must be a list, in %s." % file_path)
 
@@ -404,6 +827,22 @@ class YAMLInventory(object):
         if not isinstance(doc.get("vars", {}) or {}, dict):
             raise Exception("The key 'vars' must be a dictionary, in %s." % file_path)
 
+        facts = doc.get("facts", {}) or {}
+        if not isinstance(facts, dict) or not isinstance(facts.get("vars", []) or [], list):
+            raise Exception("The key 'facts' must be a dictionary with a list of 'vars', in %s." % file_path)
+
+        for entry in facts.get("vars", []) or []:
+            if not isinstance(entry, basestring) and not (isinstance(entry, dict) and entry.get('fact')):
+                raise Exception("The facts must be names or dictionaries with a 'fact' key, in %s." % file_path)
+
+    def _split_keyed_groups(self):
+        """
+        Removes from the group list the groups that are templates expanded from host
+        variables, they will be created after the hosts are compiled
+        """
+        self.keyed_groups = [g for g in self.group_list if g.get("key")]
+        self.group_list = [g for g in self.group_list if not g.get("key")]
+
     def _add_default_groups(self):
         """
         Adds some predefined groups common to all hosts
@@ -466,55 +905,201 @@ class YAMLInventory(object):
         """
         result = {}
         for g in self.group_list:
-            g_name     = g["name"]                      # name is compulsory
-            g_hosts    = g.get("hosts", []) or []
-            g_memberof = g.get("memberof", []) or []
-            g_vars     = merge(
-                self.global_vars,
-                g.get("vars", {}) or {}
-            )
-
-            g_vars = merge(g_vars, {
-                "memberof": g_memberof
-            })
-
-            result[g_name] = {
-                "hosts": g_hosts,
-                "member_of": g_memberof,
-                "vars": g_vars
-            }
+            result[g["name"]] = self._create_ansible_group(g)   # name is compulsory
 
         self.ansible_group_list = result
 
+    def _create_ansible_group(self, g):
+        """
+        Converts one group loaded from the YAML file into the Ansible structure
+        """
+        g_hosts    = g.get("hosts", []) or []
+        g_memberof = g.get("memberof", []) or []
+        g_vars     = merge(
+            self.global_vars,
+            g.get("vars", {}) or {}
+        )
+
+        g_vars = merge(g_vars, {
+            "memberof": g_memberof
+        })
+
+        return {
+            "hosts": g_hosts,
+            "member_of": g_memberof,
+            "vars": g_vars
+        }
+
     def _create_ansible_hosts(self):
         """
         Converts the host data structure loaded from the YAML file into host data structure
         required by Ansible.
         """
-        result = {}
-        for h in self.host_list:
-            h_name     = h["name"]
-            h_memberof = h.get("memberof", []) or []
-            h_vars     = h.get("vars", {}) or {}
-
-            # Add the hosts to the groups it belongs to and load group's variables
-            g_vars = {}
-            for g in h_memberof:
-                self.ansible_group_list[g]["hosts"] = union([h_name], self.ansible_group_list[g]["hosts"])
-                g_vars = merge(g_vars, self.ansible_group_list[g]["vars"])
-            h_vars = merge(g_vars, h_vars)
-
-            h_vars = merge(h_vars, {
-                "memberof": h_memberof
-            })
+        if self.workers > 1 and len(self.host_list) >= self.PARALLEL_MIN_HOSTS:
+            compiled = self._compile_hosts_parallel()
+        else:
+            compiled = [compile_host(h, self.ansible_group_list) for h in self.host_list]
 
-            result[h_name] = {
-                "vars": h_vars,
-                "member_of": h_memberof
-            }
+        # Add the hosts to the groups they belong to, following the order of the hosts
+        result = {}
+        group_hosts = {}
+        for h_name, host in compiled:
+            for g in host["member_of"]:
+                if g not in group_hosts:
+                    self.ansible_group_list[g]["hosts"] = list(self.ansible_group_list[g]["hosts"])
+                    group_hosts[g] = set(self.ansible_group_list[g]["hosts"])
+                if h_name not in group_hosts[g]:
+                    group_hosts[g].add(h_name)
+                    self.ansible_group_list[g]["hosts"].append(h_name)
+
+            result[h_name] = host
 
         self.ansible_host_list = result
 
+    def _compile_hosts_parallel(self):
+        """
+        Compiles the hosts on a pool of processes. The host list is split in contiguous
+        shards and the forked workers share the resolved groups read-only, the results
+        are returned in the order of the shards so the output is deterministic.
+        """
+        shard_size = max(1, -(-len(self.host_list) // (self.workers * 4)))
+        shards = [(i, i + shard_size) for i in range(0, len(self.host_list), shard_size)]
+
+        pool = multiprocessing.Pool(
+            processes=self.workers,
+            initializer=_init_worker,
+            initargs=(self.ansible_group_list, self.host_list)
+        )
+        try:
+            results = pool.map(_compile_shard, shards, chunksize=1)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+        return [
+            (h_name, {"vars": h_vars, "member_of": list(h_vars["memberof"])})
+            for shard in results for h_name, h_vars in marshal.loads(shard)
+        ]
+
+    def _add_fact_variables(self, repo_info):
+        """
+        Copies the configured facts from Ansible's jsonfile fact cache into the
+        compiled host variables. Hosts without fresh facts are left untouched.
+        """
+        fact_vars = self.facts.get("vars", []) or []
+        if not fact_vars:
+            return
+
+        # The facts expire with time
+        self.dynamic = True
+
+        facts_dir = self.facts.get("path") or repo_info.ans_config('defaults', 'fact_caching_connection', None)
+        if not facts_dir:
+            raise Exception("The fact cache isn't configured, set 'facts.path' in the inventory or "
+                            "fact_caching_connection in ansible.cfg.")
+        facts_dir = paths_full(self.inventory_base, facts_dir)
+
+        # Each partition, usually the environment, can have its own fact cache
+        if self.partition is not None and os.path.isdir(os.path.join(facts_dir, self.partition)):
+            facts_dir = os.path.join(facts_dir, self.partition)
+
+        max_age = self.facts.get("max_age")
+        if max_age is None:
+            max_age = repo_info.ans_config('defaults', 'fact_caching_timeout', 86400)
+        max_age = int(max_age)
+        prefix = self.facts.get("prefix", "") or ""
+
+        # Names of the variables and paths of the facts
+        mapping = []
+        for entry in fact_vars:
+            if isinstance(entry, dict):
+                mapping.append((entry.get("name") or entry["fact"], entry["fact"].split('.')))
+            else:
+                mapping.append((entry.replace('.', '_'), entry.split('.')))
+
+        try:
+            cached = set(os.listdir(facts_dir))
+        except OSError:
+            print("The fact cache %s doesn't exist." % facts_dir, file=sys.stderr)
+            return
+
+        now = time.time()
+        for h_name, host in self.ansible_host_list.iteritems():
+            fact_file = prefix + h_name
+            if fact_file not in cached:
+                continue
+            fact_file = os.path.join(facts_dir, fact_file)
+
+            try:
+                if max_age > 0 and now - os.path.getmtime(fact_file) > max_age:
+                    continue
+                with open(fact_file, 'r') as f:
+                    facts = json.load(f)
+            except (OSError, IOError, ValueError), exc:
+                print("Can't load the facts of %s: %s" % (h_name, exc), file=sys.stderr)
+                continue
+
+            for v_name, path in mapping:
+                value = self._lookup_fact(facts, path)
+                if value is not _NO_FACT:
+                    host["vars"][v_name] = value
+
+    @staticmethod
+    def _lookup_fact(facts, path):
+        """
+        Looks up a fact in the formats used by the different versions of Ansible,
+        with the facts at the top level or inside "ansible_facts", with or without
+        the "ansible_" prefix
+        """
+        candidates = [(facts, path)]
+        nested = facts.get("ansible_facts")
+        if isinstance(nested, dict):
+            candidates.append((nested, path))
+            if path[0].startswith("ansible_"):
+                candidates.append((nested, [path[0][len("ansible_"):]] + path[1:]))
+
+        for source, source_path in candidates:
+            value = lookup_var(source, source_path, _NO_FACT)
+            if value is not _NO_FACT:
+                return value
+
+        return _NO_FACT
+
+    def _create_constructed_groups(self):
+        """
+        Evaluates the groups with a condition or a key over the compiled host variables
+        and adds the resulting members to the Ansible groups and hosts. Group variables
+        of constructed groups are not merged into the host variables because these are
+        the input of the evaluation, Ansible applies them through the group.
+        """
+        conditional = [g for g in self.group_list if g.get("condition")]
+        if not conditional and not self.keyed_groups:
+            return
+
+        host_vars = dict((h, self.ansible_host_list[h]["vars"]) for h in self.ansible_host_list)
+        memberships, generated = evaluate_constructed_groups(
+            host_vars, conditional, self.keyed_groups, existing=self.ansible_group_list
+        )
+
+        # Groups created from keys are added as if they were loaded from YAML
+        for g in generated:
+            self.group_list.append(g)
+            self.ansible_group_list[g["name"]] = self._create_ansible_group(g)
+
+        for g_name, g_hosts in memberships.iteritems():
+            group = self.ansible_group_list[g_name]
+            known = set(group["hosts"])
+            group["hosts"] = group["hosts"] + [h for h in g_hosts if h not in known]
+
+            for h_name in g_hosts:
+                host = self.ansible_host_list[h_name]
+                for memberof in (host["member_of"], host["vars"].setdefault("memberof", [])):
+                    if g_name not in memberof:
+                        memberof.append(g_name)
+
     def _load_cache(self):
         """
         Loads the data from the cache file
@@ -528,6 +1113,14 @@ class YAMLInventory(object):
         self.host_list = cache.get('host_list', {})
         self.global_vars = cache.get('global_vars', {})
 
+        # Caches written before the hashes were introduced
+        self.hashes = cache.get('hashes', None) or \
+            compute_hashes(self.ansible_host_list, self.ansible_group_list)
+
+        # Caches written before the sources were recorded expire only with time
+        self.sources = cache.get('sources', {})
+        self.dynamic = cache.get('dynamic', True)
+
         # Returns true if all data has been loaded
         return self.ansible_group_list and \
             self.ansible_host_list and \
@@ -537,17 +1130,28 @@ class YAMLInventory(object):
 
     def _save_cache(self):
         """
-        Saves the data in the cache
+        Saves the data in the cache. The file is written aside and moved in place
+        so concurrent readers never see a partial one.
         """
         data = {
             'ansible_group_list': self.ansible_group_list,
             'ansible_host_list': self.ansible_host_list,
             'group_list': self.group_list,
             'host_list': self.host_list,
-            'global_vars': self.global_vars
+            'global_vars': self.global_vars,
+            'hashes': self.hashes,
+            'sources': self.sources,
+            'dynamic': self.dynamic
         }
 
-        with open(self.cache_file, 'w') as f:
-            json.dump(data, f)
+        tmp_file = "%s.%d.%d.tmp" % (self.cache_file, os.getpid(), threading.current_thread().ident)
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump(data, f)
+            os.rename(tmp_file, self.cache_file)
+        except (OSError, IOError):
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
 
 # vim: ft=python:ts=4:sw=4
\ No newline at end of file
@@ -32,7 +32,8 @@
 #
 # The script uses a file named "aws_credentials" to read the AWS credentials for
 # the boto3 library. The file must be present in the current working directory
-# or in the same directory as this script. Also, the file must have a safe
+# or in the same directory as this script, or its path must be set in the
+# environment variable INVENTORY_AWS_CREDENTIALS. Also, the file must have a safe
 # permissions of at least 0600.
 #
 # The script recognises the following tags:
@@ -49,31 +50,89 @@
 #
 #  Environment: if present, the script will add this value as a group membership
 #
+# The regions are scanned in parallel by a bounded pool of threads and each one
+# has its own timeout. The hosts are returned in the order of the regions, and a
+# region that fails or times out is reported without losing the others.
+#
+# The credentials are loaded and the boto3 session is created once per process
+# and the EC2 clients are cached per region with a pool of connections. The
+# instances are read with the DescribeInstances paginator using large pages and
+# only the fields needed by the inventory are kept from each page.
+#
+# Optionally the hosts of each region are saved in a snapshot, kept per region
+# and per credentials. Within the TTL the snapshots are used without contacting
+# AWS, after the TTL the old snapshot is still used while a detached process
+# scans the region again and replaces it.
+#
+# In NDJSON mode the output is one record per line, {"group": {...}},
+# {"vars": {...}} or {"host": {...}}, and the hosts are printed as soon as each
+# page of instances arrives from any region. A region that fails after some of
+# its pages have been printed can't be retracted, the failure is reported on
+# stderr.
+#
 
 from __future__ import print_function
 
 import re
 import os
+import sys
+import json
+import time
+import Queue
+import errno
 import boto3
+import hashlib
 import argparse
+import threading
+import subprocess
 import configparser
 from stat import *
 from cfutils import *
+from botocore.config import Config
+from multiprocessing.pool import ThreadPool
+
+
+# Session, credentials and clients shared by all the regions of a run
+_SESSION = None
+_CREDENTIALS = None
+_CLIENTS = {}
+_LOCK = threading.RLock()
+
+# Sent in place of the hosts when a worker starts a region
+_STARTED = object()
+
+# Connections kept open towards each region
+MAX_POOL_CONNECTIONS = 20
+
+# Instances per DescribeInstances page, 1000 is the maximum allowed by AWS
+PAGE_SIZE = 1000
+
+# Snapshots of the regions
+DEFAULT_CACHE_DIR = "~/.ansible/tmp/inventory-aws"
+REGIONS_TTL = 86400
+LOCK_EXPIRE = 600
 
 
 def load_credentials():
     """
     Load the credentials from specific file. We don't use the standard BOTO way
-    because we want to be able to manage the credentials differently
+    because we want to be able to manage the credentials differently. The file is
+    read only once per process.
     """
-    config = configparser.ConfigParser()
+    global _CREDENTIALS
+
+    with _LOCK:
+        if _CREDENTIALS is None:
+            _CREDENTIALS = read_credentials()
+        return _CREDENTIALS
 
-    # Look for the file
-    aws_credentials = os.path.join(os.getcwd(), "aws_credentials")
-    if not os.path.isfile(aws_credentials):
-        aws_credentials = os.path.join(os.path.dirname(sys.argv[0]), "aws_credentials")
-        if not os.path.isfile(aws_credentials):
-            raise Exception("Cannot find file aws_credentials")
+
+def read_credentials():
+    """
+    Reads and checks the credentials file
+    """
+    config = configparser.ConfigParser()
+    aws_credentials = credentials_file()
 
     # Ensuring strict permissions
     if os.stat(aws_credentials).st_mode & (S_IWGRP | S_IWOTH | S_IROTH):
@@ -89,42 +148,449 @@ def load_credentials():
     )
 
 
-def build_hosts(regions=[]):
+def credentials_file():
     """
-    Build the lists of hosts for the inventory
+    Looks for the credentials file
     """
-    instances = []
+    aws_credentials = os.environ.get('INVENTORY_AWS_CREDENTIALS', '')
+    if aws_credentials:
+        if not os.path.isfile(aws_credentials):
+            raise Exception("Cannot find file %s" % aws_credentials)
+        return os.path.abspath(aws_credentials)
 
-    for r in regions:
-        access_key, secret_key = load_credentials()
+    aws_credentials = os.path.join(os.getcwd(), "aws_credentials")
+    if not os.path.isfile(aws_credentials):
+        aws_credentials = os.path.join(os.path.dirname(sys.argv[0]), "aws_credentials")
+        if not os.path.isfile(aws_credentials):
+            raise Exception("Cannot find file aws_credentials")
 
-        ec2 = boto3.resource(
-            'ec2', region_name=r, aws_access_key_id=access_key, aws_secret_access_key=secret_key
-        )
+    return os.path.abspath(aws_credentials)
 
-        # Collect only running instances with tag: Ansible=True
-        filters = [
-            {'Name': 'tag-key', 'Values': ['Ansible']},
-            {'Name': 'tag-value', 'Values': ['True']},
-            {'Name': 'instance-state-name', 'Values': ['running']},
-        ]
 
-        instances.extend(
-            [build_host_info(i, r) for i in ec2.instances.filter(Filters=filters)]
+def get_session():
+    """
+    The boto3 session shared by all the regions
+    """
+    global _SESSION
+
+    access_key, secret_key = load_credentials()
+    with _LOCK:
+        if _SESSION is None:
+            _SESSION = boto3.session.Session(aws_access_key_id=access_key, aws_secret_access_key=secret_key)
+        return _SESSION
+
+
+def ec2_client(region, config=None):
+    """
+    The EC2 client of a region, created once from the shared session. The
+    configuration is used only when the client is created.
+    """
+    session = get_session()
+
+    # Sessions aren't thread safe, clients are created one at a time
+    with _LOCK:
+        if region not in _CLIENTS:
+            pool_config = Config(max_pool_connections=MAX_POOL_CONNECTIONS)
+            _CLIENTS[region] = session.client(
+                'ec2', region_name=region, config=pool_config.merge(config) if config else pool_config
+            )
+        return _CLIENTS[region]
+
+
+def reset_session():
+    """
+    Discards the shared session, credentials and clients
+    """
+    global _SESSION, _CREDENTIALS
+
+    with _LOCK:
+        _SESSION, _CREDENTIALS = None, None
+        _CLIENTS.clear()
+
+
+def build_hosts(regions=(), workers=8, timeout=30, cache_ttl=0, refresh=False, cache_dir=None):
+    """
+    Build the lists of hosts for the inventory. The regions are scanned in parallel
+    and the hosts are merged in the order of the regions. The regions that fail or
+    take longer than timeout seconds are reported on stderr and skipped.
+
+    With a cache TTL the fresh snapshots are used directly, the stale ones are used
+    and refreshed in background and the regions without a snapshot are scanned.
+    With refresh all the regions are scanned and their snapshots replaced.
+    """
+    pages = {}
+    completed = set()
+    for r, hosts in region_pages(regions, workers, timeout, cache_ttl, refresh, cache_dir):
+        if hosts is None:
+            completed.add(r)
+        else:
+            pages.setdefault(r, []).extend(hosts)
+
+    return [h for r in regions if r in completed for h in pages.get(r, [])]
+
+
+def iter_host_pages(regions=(), workers=8, timeout=30, cache_ttl=0, refresh=False, cache_dir=None):
+    """
+    Generates the lists of hosts as soon as each page arrives from any region, the
+    options are the same of build_hosts
+    """
+    for _, hosts in region_pages(regions, workers, timeout, cache_ttl, refresh, cache_dir):
+        if hosts:
+            yield hosts
+
+
+def region_pages(regions, workers=8, timeout=30, cache_ttl=0, refresh=False, cache_dir=None):
+    """
+    Generates (region, hosts) for each page of hosts and (region, None) when a
+    region is complete. The regions with a snapshot come first, in one page.
+    """
+    if not regions:
+        return
+
+    stale = []
+    to_scan = list(regions)
+    if cache_ttl > 0 and not refresh:
+        for r in regions:
+            snapshot = load_snapshot(r, cache_dir)
+            if snapshot is None:
+                continue
+            to_scan.remove(r)
+            if time.time() - snapshot['timestamp'] > cache_ttl:
+                stale.append(r)
+            yield r, snapshot['hosts']
+            yield r, None
+
+    completed = len(regions) - len(to_scan)
+    scanned = {}
+    for r, hosts in stream_regions(to_scan, workers, timeout):
+        if hosts is None:
+            completed += 1
+            if cache_ttl > 0 or refresh:
+                save_snapshot(r, {'hosts': scanned.get(r, [])}, cache_dir)
+        else:
+            scanned.setdefault(r, []).extend(hosts)
+        yield r, hosts
+
+    if stale:
+        start_refresher(stale, workers, timeout, cache_dir)
+
+    if not completed:
+        raise Exception("Cannot scan any of the regions %s." % ", ".join(regions))
+
+
+def scan_regions(regions, workers=8, timeout=30):
+    """
+    Scans the regions in parallel and returns the hosts of the regions that have
+    been scanned successfully. The failures are reported on stderr.
+    """
+    pages = {}
+    hosts = {}
+    for r, page in stream_regions(regions, workers, timeout):
+        if page is None:
+            hosts[r] = pages.get(r, [])
+        else:
+            pages.setdefault(r, []).extend(page)
+
+    return hosts
+
+
+def stream_regions(regions, workers=8, timeout=30):
+    """
+    Scans the regions in parallel and generates (region, hosts) for each page as
+    soon as it arrives and (region, None) when a region is complete. The regions
+    that fail or aren't complete timeout seconds after a worker has started them
+    are reported on stderr and are never completed. So are the regions still
+    queued when the whole scan exceeds timeout seconds for each round of workers,
+    as happens when all the workers are stuck on hung regions.
+    """
+    if not regions:
+        return
+
+    # Problems with the credentials are reported once, not once per region
+    get_session()
+
+    config = Config(connect_timeout=timeout, read_timeout=timeout, retries={'max_attempts': 2})
+    pages = Queue.Queue()
+    deadlines = {}
+    failed = {}
+    pending = set(regions)
+
+    size = max(1, min(workers, len(regions)))
+    pool = ThreadPool(processes=size)
+    try:
+        for r in regions:
+            pool.apply_async(_scan_started, (r, config, pages))
+        overall = time.time() + timeout * ((len(regions) + size - 1) // size)
+
+        while pending:
+            # The deadlines are checked also while other regions keep sending pages
+            now = time.time()
+            for r in list(pending):
+                if r in deadlines and now > deadlines[r]:
+                    failed[r] = "Timed out after %s seconds." % timeout
+                    pending.discard(r)
+                elif r not in deadlines and now > overall:
+                    failed[r] = "Not started, all the workers are busy."
+                    pending.discard(r)
+            if not pending:
+                break
+
+            try:
+                r, hosts, error = pages.get(timeout=0.1)
+            except Queue.Empty:
+                continue
+
+            # Late pages of regions already abandoned
+            if r not in pending:
+                continue
+
+            if hosts is _STARTED:
+                deadlines[r] = time.time() + timeout
+            elif error is not None:
+                failed[r] = error
+                pending.discard(r)
+            else:
+                if hosts is None:
+                    pending.discard(r)
+                yield r, hosts
+
+    finally:
+        # Threads still hung on a region are daemons and don't block the exit
+        pool.close()
+        if not failed and not pending:
+            pool.join()
+
+        for r in regions:
+            if r in failed:
+                print("Error scanning the region %s: %s" % (r, failed[r]), file=sys.stderr)
+
+
+def list_regions(cache_ttl=0, refresh=False, cache_dir=None):
+    """
+    The names of all the regions. With a cache TTL they're kept in a snapshot
+    for at least one day, as new regions are rare.
+    """
+    if cache_ttl > 0 and not refresh:
+        snapshot = load_snapshot('regions', cache_dir)
+        if snapshot is not None and time.time() - snapshot['timestamp'] < max(cache_ttl, REGIONS_TTL):
+            return snapshot['regions']
+
+    regions = [x['RegionName'] for x in get_session().client('ec2').describe_regions()['Regions']]
+    if cache_ttl > 0 or refresh:
+        save_snapshot('regions', {'regions': regions}, cache_dir)
+
+    return regions
+
+
+def snapshot_path(name, cache_dir=None):
+    """
+    Path of a snapshot, the snapshots are kept separate for each credentials
+    """
+    access_key, _ = load_credentials()
+    profile = hashlib.sha1(access_key.encode('utf-8')).hexdigest()[:12]
+    cache_dir = os.path.abspath(os.path.expanduser(cache_dir or DEFAULT_CACHE_DIR))
+    return os.path.join(cache_dir, profile, "%s.json" % name)
+
+
+def lock_path(name, cache_dir=None):
+    """
+    Path of the lock held while a snapshot is refreshed
+    """
+    return re.sub(r'\.json$', '.lock', snapshot_path(name, cache_dir))
+
+
+def load_snapshot(name, cache_dir=None):
+    """
+    Loads a snapshot, returns None if it's missing or unreadable
+    """
+    try:
+        with open(snapshot_path(name, cache_dir), 'r') as f:
+            snapshot = json.load(f)
+        return snapshot if isinstance(snapshot, dict) and 'timestamp' in snapshot else None
+    except (IOError, ValueError):
+        return None
+
+
+def save_snapshot(name, data, cache_dir=None):
+    """
+    Saves a snapshot, readers never see a partially written file. The snapshots are
+    only an optimisation so failures are ignored
+    """
+    path = snapshot_path(name, cache_dir)
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), 0o700)
+        with open(tmp_path, 'w') as f:
+            json.dump(dict(data, timestamp=time.time()), f)
+        os.rename(tmp_path, path)
+    except (OSError, IOError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def acquire_lock(path):
+    """
+    Creates a lock file exclusively. Locks older than LOCK_EXPIRE seconds have been
+    abandoned and are replaced.
+    """
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path), 0o700)
+
+    for _ in range(2):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+            os.write(fd, str(os.getpid()).encode('utf-8'))
+            os.close(fd)
+            return True
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        try:
+            if time.time() - os.path.getmtime(path) < LOCK_EXPIRE:
+                return False
+            os.remove(path)
+        except OSError:
+            pass
+
+    return False
+
+
+def is_locked(path):
+    """
+    Checks if a lock file is held
+    """
+    try:
+        return time.time() - os.path.getmtime(path) < LOCK_EXPIRE
+    except OSError:
+        return False
+
+
+def refresh_snapshots(regions, workers=8, timeout=30, cache_dir=None):
+    """
+    Scans the regions and replaces their snapshots. The regions that are already
+    being refreshed by another process are skipped.
+    """
+    locked = []
+    try:
+        for r in regions:
+            if acquire_lock(lock_path(r, cache_dir)):
+                locked.append(r)
+
+        for r, r_hosts in scan_regions(locked, workers, timeout).iteritems():
+            save_snapshot(r, {'hosts': r_hosts}, cache_dir)
+
+    finally:
+        for r in locked:
+            try:
+                os.remove(lock_path(r, cache_dir))
+            except OSError:
+                pass
+
+
+def start_refresher(regions, workers=8, timeout=30, cache_dir=None):
+    """
+    Starts a detached process that refreshes the snapshots of the regions
+    """
+    regions = [r for r in regions if not is_locked(lock_path(r, cache_dir))]
+    if not regions:
+        return
+
+    cmd = [
+        sys.executable, '-m', 'autolibs.bin.ansible.inventoryaws', '--background-refresh',
+        '--regions', ",".join(regions), '--workers', str(workers), '--timeout', str(timeout),
+    ]
+    if cache_dir:
+        cmd += ['--cache-dir', cache_dir]
+
+    # The credentials are passed explicitly as the script directory is different
+    env = dict(os.environ)
+    env['INVENTORY_AWS_CREDENTIALS'] = credentials_file()
+
+    with open(os.devnull, 'r+') as devnull:
+        subprocess.Popen(
+            cmd, env=env, stdin=devnull, stdout=devnull, stderr=devnull, close_fds=True, preexec_fn=os.setsid
         )
 
-    return instances
+
+def _scan_started(region, config, pages):
+    """
+    Tells the queue that a worker has started the region, then scans it
+    """
+    pages.put((region, _STARTED, None))
+    scan_region(region, config, pages)
+
+
+def scan_region(region, config=None, pages=None):
+    """
+    Collects the hosts of one region. With a queue each page is put in it as
+    (region, hosts, None) followed by (region, None, None) at the end, or by
+    (region, None, error) if the scan fails.
+    """
+    hosts = []
+    try:
+        for page in describe_instances(region, config):
+            page = [build_host_info(i, region) for i in page]
+            if pages is not None:
+                pages.put((region, page, None))
+            else:
+                hosts.extend(page)
+
+    except Exception as e:
+        if pages is None:
+            raise
+        pages.put((region, None, str(e) or e.__class__.__name__))
+        return
+
+    if pages is not None:
+        pages.put((region, None, None))
+
+    return hosts
+
+
+def describe_instances(region, config=None):
+    """
+    Generates the pages of the running instances with tag Ansible=True of a
+    region. Each page is a list of instances reduced to the fields used by the
+    inventory, so the full responses are released as soon as they are read.
+    """
+    paginator = ec2_client(region, config).get_paginator('describe_instances')
+
+    # Collect only running instances with tag: Ansible=True
+    filters = [
+        {'Name': 'tag-key', 'Values': ['Ansible']},
+        {'Name': 'tag-value', 'Values': ['True']},
+        {'Name': 'instance-state-name', 'Values': ['running']},
+    ]
+
+    for page in paginator.paginate(Filters=filters, PaginationConfig={'PageSize': PAGE_SIZE}):
+        yield [
+            {
+                'InstanceId': i['InstanceId'],
+                'PrivateIpAddress': i.get('PrivateIpAddress'),
+                'Tags': i.get('Tags', []),
+            }
+            for reservation in page.get('Reservations', [])
+            for i in reservation.get('Instances', [])
+        ]
 
 
 def build_host_info(instance, region):
     """
-    Build the information for one single host
+    Build the information for one single host from its DescribeInstances data
     """
     tags = {}
 
-    for t_key, t_value in [(t['Key'], t['Value']) for t in instance.tags]:
+    for t_key, t_value in [(t['Key'], t['Value']) for t in instance.get('Tags', [])]:
         tags.update({t_key: t_value})
 
+    return host_from_tags(tags, instance['InstanceId'], instance.get('PrivateIpAddress'), region)
+
+
+def host_from_tags(tags, instance_id, private_ip, region):
+    """
+    Build the information for one single host from the tags of its instance
+    """
     # Extract information from tags
     hostname = tags.get('AnsibleName', tags.get('Name', None))
 
@@ -144,8 +610,8 @@ def build_host_info(instance, region):
 
     # If the hostname is completely missing, use ID and the private IP address
     if hostname is None:
-        hostname = instance.id
-        variables['ansible_host'] = instance.private_ip_address
+        hostname = instance_id
+        variables['ansible_host'] = private_ip
 
     # Build and return
     return {
@@ -155,7 +621,7 @@ def build_host_info(instance, region):
     }
 
 
-def build_groups(regions=[]):
+def build_groups(regions=()):
     """
     Build the list of groups for the inventory
     """
@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+#
+# Indexed SQLite materialisation of a compiled YAML inventory.
+#
+# The compiled hosts, groups and memberships are stored in a SQLite file next to
+# the inventory cache, together with a flattened copy of the host variables
+# (nested keys are joined with dots, lists of scalars have a row per element).
+# Queries are a list of conditions, all of which must be true:
+#
+#   group=web                 Members of the group, "~" to use a glob
+#   name~web*                 Host names, "=" or "~" (glob)
+#   datacenter=lon            Variable equal to, or "!=" not equal to, a value
+#   os_version>=7             Numeric comparisons: <, <=, >, >=
+#   role in web,db            Variable in a list of values, also "not in"
+#   ansible_host in 10.2.0.0/16   IPv4 addresses in a network
+#   ec2.ami~ami-12*           Variable matching a glob
+#
+# The database records the fingerprints of the files and directories the
+# inventory was loaded from and it's used until one of them changes. When the
+# inventory runs executables or reads the fact cache the database also expires
+# with time, as their output can't be checked.
+#
+
+from __future__ import print_function
+
+import re
+import os
+import json
+import time
+import hashlib
+import sqlite3
+from autolibs.gitmeta import fingerprint
+from constructed import ipv4_network, lookup_var
+
+
+def sources_changed(sources):
+    """
+    Checks if any of the files recorded with their fingerprint has changed
+    """
+    return any(fingerprint(path) != stat for path, stat in sources.iteritems())
+
+
+class InventoryDB(object):
+    """
+    SQLite materialisation of a compiled inventory
+    """
+
+    SCHEMA = [
+        "CREATE TABLE hosts (id INTEGER PRIMARY KEY, name TEXT NOT NULL, vars TEXT NOT NULL)",
+        "CREATE TABLE groups (id INTEGER PRIMARY KEY, name TEXT NOT NULL, type TEXT, description TEXT)",
+        "CREATE TABLE memberships (group_id INTEGER NOT NULL, host_id INTEGER NOT NULL)",
+        "CREATE TABLE host_vars (host_id INTEGER NOT NULL, key TEXT NOT NULL, value TEXT, num REAL, ip INTEGER)",
+        "CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    ]
+
+    INDEXES = [
+        "CREATE UNIQUE INDEX hosts_name ON hosts (name)",
+        "CREATE UNIQUE INDEX groups_name ON groups (name)",
+        "CREATE INDEX memberships_group ON memberships (group_id, host_id)",
+        "CREATE INDEX memberships_host ON memberships (host_id)",
+        "CREATE INDEX host_vars_value ON host_vars (key, value)",
+        "CREATE INDEX host_vars_num ON host_vars (key, num)",
+        "CREATE INDEX host_vars_ip ON host_vars (key, ip)",
+    ]
+
+    _CONDITION = re.compile(r'^\s*([\w.-]+)\s*(\s+not\s+in\s+|\s+in\s+|!=|>=|<=|=|~|<|>)\s*(.*?)\s*$')
+    _IPV4 = re.compile(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$')
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self._conn = None
+
+    def is_fresh(self, override_yaml, expire):
+        """
+        Checks if the database has been built from the current inventory files and
+        override, and within expire seconds for the inventories that are dynamic
+        """
+        if not os.path.exists(self.db_file):
+            return False
+
+        try:
+            meta = dict(self._connect().execute("SELECT key, value FROM meta"))
+        except sqlite3.Error:
+            # Databases built before the metadata was recorded
+            self.close()
+            return False
+
+        if meta.get('override') != self._digest(override_yaml):
+            return False
+        if sources_changed(json.loads(meta.get('sources', '{}'))):
+            return False
+        if json.loads(meta.get('dynamic', 'true')):
+            return (time.time() - os.path.getmtime(self.db_file)) < expire
+
+        return True
+
+    def build(self, inventory):
+        """
+        Materialises a compiled YAMLInventory into the database. The file is built
+        aside and moved in place so concurrent readers never see a partial one.
+        """
+        self.close()
+        tmp_file = "%s.%d.tmp" % (self.db_file, os.getpid())
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+        conn = sqlite3.connect(tmp_file)
+        try:
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA synchronous = OFF")
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+
+            # Groups
+            group_ids = {}
+            group_info = dict((g['name'], g) for g in inventory.group_list)
+            for i, g_name in enumerate(sorted(inventory.ansible_group_list)):
+                group_ids[g_name] = i + 1
+                info = group_info.get(g_name, {})
+                conn.execute(
+                    "INSERT INTO groups (id, name, type, description) VALUES (?, ?, ?, ?)",
+                    (i + 1, g_name, info.get('type', 'generic') or 'generic', info.get('description', g_name))
+                )
+
+            # Hosts and their flattened variables
+            host_ids = {}
+            for i, h_name in enumerate(sorted(inventory.ansible_host_list)):
+                host_ids[h_name] = i + 1
+                h_vars = inventory.ansible_host_list[h_name]['vars']
+                conn.execute(
+                    "INSERT INTO hosts (id, name, vars) VALUES (?, ?, ?)",
+                    (i + 1, h_name, json.dumps(h_vars, sort_keys=True))
+                )
+                conn.executemany(
+                    "INSERT INTO host_vars (host_id, key, value, num, ip) VALUES (?, ?, ?, ?, ?)",
+                    ((i + 1,) + row for row in self._flatten(h_vars))
+                )
+
+            # Memberships
+            for g_name, group in inventory.ansible_group_list.iteritems():
+                conn.executemany(
+                    "INSERT INTO memberships (group_id, host_id) VALUES (?, ?)",
+                    ((group_ids[g_name], host_ids[h]) for h in set(group['hosts']) if h in host_ids)
+                )
+
+            # Where the inventory was loaded from, to check if it's still fresh
+            conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+                ('override', self._digest(inventory.override_yaml)),
+                ('sources', json.dumps(inventory.sources)),
+                ('dynamic', json.dumps(inventory.dynamic)),
+            ])
+
+            for statement in self.INDEXES:
+                conn.execute(statement)
+            conn.commit()
+        finally:
+            conn.close()
+
+        os.rename(tmp_file, self.db_file)
+
+    def select(self, conditions=None, fields=None):
+        """
+        Returns the hosts matching all the conditions. Without fields only the
+        names are returned, otherwise a list of dictionaries with the requested
+        (dotted) variables. The field "groups" lists the groups of the host.
+        """
+        where, params = [], []
+        for condition in conditions or []:
+            sql, sql_params = self._condition_sql(condition)
+            where.append(sql)
+            params.extend(sql_params)
+
+        query = "SELECT %s FROM hosts h" % ("h.id, h.name, h.vars" if fields else "h.name")
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY h.name"
+
+        conn = self._connect()
+        rows = conn.execute(query, params).fetchall()
+        if not fields:
+            return [r[0] for r in rows]
+
+        result = []
+        for h_id, h_name, h_vars in rows:
+            h_vars = json.loads(h_vars)
+            entry = {'name': h_name}
+            for field in fields:
+                if field == 'groups':
+                    entry[field] = [r[0] for r in conn.execute(
+                        "SELECT g.name FROM memberships m JOIN groups g ON g.id = m.group_id "
+                        "WHERE m.host_id = ? ORDER BY g.name", (h_id,)
+                    )]
+                elif field != 'name':
+                    entry[field] = lookup_var(h_vars, field.split('.'), None)
+            result.append(entry)
+
+        return result
+
+    def close(self):
+        """
+        Closes the connection to the database
+        """
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            if not os.path.exists(self.db_file):
+                raise IOError("The inventory database %s doesn't exist." % self.db_file)
+            self._conn = sqlite3.connect(self.db_file)
+        return self._conn
+
+    def _condition_sql(self, condition):
+        """
+        Translates one condition into an SQL expression over the hosts table
+        """
+        match = self._CONDITION.match(condition)
+        if match is None:
+            raise ValueError("Invalid query condition '%s'." % condition)
+        key, op, value = match.group(1), re.sub(r'\s+', ' ', match.group(2).strip()), match.group(3)
+        value = value.strip('\'"')
+
+        if key == 'name':
+            if op not in ['=', '~', '!=']:
+                raise ValueError("Only =, != and ~ can be used with host names, in '%s'." % condition)
+            return {'=': "h.name = ?", '!=': "h.name != ?", '~': "h.name GLOB ?"}[op], [value]
+
+        if key == 'group':
+            if op not in ['=', '~', '!=']:
+                raise ValueError("Only =, != and ~ can be used with groups, in '%s'." % condition)
+            sql = ("h.id %s (SELECT m.host_id FROM memberships m JOIN groups g ON g.id = m.group_id "
+                   "WHERE g.name %s ?)") % ("NOT IN" if op == '!=' else "IN", "GLOB" if op == '~' else "=")
+            return sql, [value]
+
+        subquery = "h.id %s (SELECT host_id FROM host_vars WHERE key = ? AND %s)"
+
+        if op in ['=', '!=']:
+            return subquery % ("NOT IN" if op == '!=' else "IN", "value = ?"), [key, self._text(value)]
+
+        if op == '~':
+            return subquery % ("IN", "value GLOB ?"), [key, value]
+
+        if op in ['<', '<=', '>', '>=']:
+            try:
+                return subquery % ("IN", "num %s ?" % op), [key, float(value)]
+            except ValueError:
+                raise ValueError("A number is required in '%s'." % condition)
+
+        # Operators "in" and "not in"
+        negate = "NOT IN" if op == 'not in' else "IN"
+        if '/' in value:
+            network, netmask = ipv4_network(value)
+            return subquery % (negate, "ip BETWEEN ? AND ?"), [key, network, network | (~netmask & 0xffffffff)]
+
+        values = [self._text(v.strip()) for v in value.split(',') if v.strip()]
+        if not values:
+            raise ValueError("A list of values is required in '%s'." % condition)
+        return subquery % (negate, "value IN (%s)" % ", ".join("?" * len(values))), [key] + values
+
+    @classmethod
+    def _flatten(cls, variables, prefix=""):
+        """
+        Flattens the variables into (key, value, number, ip) rows
+        """
+        for key, value in variables.iteritems():
+            key = "%s%s" % (prefix, key)
+
+            if isinstance(value, dict):
+                for row in cls._flatten(value, key + "."):
+                    yield row
+
+            elif isinstance(value, list):
+                # Lists of complex objects are kept only in the JSON of the host
+                for item in value:
+                    if not isinstance(item, (dict, list)):
+                        yield cls._row(key, item)
+
+            else:
+                yield cls._row(key, value)
+
+    @classmethod
+    def _row(cls, key, value):
+        num = ip = None
+        if isinstance(value, (int, long, float)) and not isinstance(value, bool):
+            num = value
+        elif isinstance(value, basestring):
+            if cls._IPV4.match(value):
+                try:
+                    ip = ipv4_network(value)[0]
+                except ValueError:
+                    pass
+            else:
+                try:
+                    num = float(value)
+                except ValueError:
+                    pass
+        return key, cls._text(value), num, ip
+
+    @staticmethod
+    def _text(value):
+        if value is None:
+            return None
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        if isinstance(value, basestring):
+            if value.lower() in ['true', 'false']:
+                return value.lower()
+            return value
+        return "%s" % value
+
+    @staticmethod
+    def _digest(text):
+        return hashlib.sha1(json.dumps(text or "")).hexdigest()
+
+# vim: ft=python:ts=4:sw=4
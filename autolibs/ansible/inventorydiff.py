@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+#
+# Content hashes of the compiled inventory and differences between revisions.
+#
+# Every compiled host and group has a stable hash of its content. The hashes of
+# the hosts and of the groups are combined in two Merkle-style roots and those
+# in the root of the whole inventory, so two inventories can be compared first
+# on the roots and then on the single entities. Only the entities whose hashes
+# differ are compared variable by variable.
+#
+
+from __future__ import print_function
+
+import os
+import re
+import glob
+import json
+import time
+import pipes
+import shutil
+import hashlib
+import tempfile
+from cfutils.common import *
+from cfutils.execute import *
+
+# Number of compiled revisions kept for each inventory
+REVISION_CACHES = 10
+
+
+def content_hash(obj):
+    """
+    Stable hash of a JSON-serialisable object
+    """
+    return hashlib.sha1(json.dumps(obj, sort_keys=True, separators=(',', ':'))).hexdigest()
+
+
+def merkle_root(hashes):
+    """
+    Combines a dictionary name -> hash into a single hash
+    """
+    digest = hashlib.sha1()
+    for name in sorted(hashes):
+        digest.update(("%s\0%s\n" % (name, hashes[name])).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def compute_hashes(ansible_host_list, ansible_group_list):
+    """
+    Computes the hashes of all hosts and groups and their roots
+    """
+    hosts = dict((h, content_hash(v)) for h, v in ansible_host_list.iteritems())
+
+    # The order of the members of a group is not relevant
+    groups = dict(
+        (g, content_hash(dict(v, hosts=sorted(v.get("hosts", [])))))
+        for g, v in ansible_group_list.iteritems()
+    )
+
+    roots = {
+        'hosts': merkle_root(hosts),
+        'groups': merkle_root(groups),
+    }
+
+    return {
+        'root': merkle_root(roots),
+        'roots': roots,
+        'hosts': hosts,
+        'groups': groups,
+    }
+
+
+def diff_inventories(old, new):
+    """
+    Differences between two compiled inventories. The comparison stops at the
+    roots when they are equal and only the entities with different hashes are
+    compared variable by variable.
+    """
+    result = {
+        'root': {'old': old.hashes['root'], 'new': new.hashes['root']},
+        'hosts': {'added': [], 'removed': [], 'changed': {}},
+        'groups': {'added': [], 'removed': [], 'changed': {}},
+    }
+
+    if old.hashes['root'] == new.hashes['root']:
+        return result
+
+    entities = [
+        ('hosts', old.ansible_host_list, new.ansible_host_list),
+        ('groups', old.ansible_group_list, new.ansible_group_list),
+    ]
+
+    for kind, old_list, new_list in entities:
+        if old.hashes['roots'][kind] == new.hashes['roots'][kind]:
+            continue
+
+        old_hashes, new_hashes = old.hashes[kind], new.hashes[kind]
+        result[kind]['added'] = sorted(set(new_hashes) - set(old_hashes))
+        result[kind]['removed'] = sorted(set(old_hashes) - set(new_hashes))
+
+        for name in set(old_hashes) & set(new_hashes):
+            if old_hashes[name] != new_hashes[name]:
+                result[kind]['changed'][name] = _diff_entity(old_list[name], new_list[name])
+
+    return result
+
+
+def _diff_entity(old, new):
+    """
+    Differences between two versions of a host or a group
+    """
+    result = {}
+
+    # Variables, compared on the top level keys
+    old_vars, new_vars = old.get("vars", {}), new.get("vars", {})
+    changed_vars = {}
+    for key in set(old_vars) | set(new_vars):
+        if old_vars.get(key) != new_vars.get(key) or (key in old_vars) != (key in new_vars):
+            changed_vars[key] = {}
+            if key in old_vars:
+                changed_vars[key]['old'] = old_vars[key]
+            if key in new_vars:
+                changed_vars[key]['new'] = new_vars[key]
+    if changed_vars:
+        result['vars'] = changed_vars
+
+    # Memberships
+    for key in ["hosts", "member_of"]:
+        old_items, new_items = set(old.get(key, [])), set(new.get(key, []))
+        if old_items != new_items:
+            result[key] = {
+                'added': sorted(new_items - old_items),
+                'removed': sorted(old_items - new_items),
+            }
+
+    return result
+
+
+def inventory_at_revision(repo_info, inventory, revision):
+    """
+    Compiles an inventory as it was at a GIT revision, using a temporary worktree.
+    The result is cached by commit and override, as the content of a commit never
+    changes, but only for CACHE_EXPIRE seconds when the inventory runs executables
+    or reads facts. Only the last REVISION_CACHES revisions are kept.
+    """
+    from inventory import YAMLInventory
+
+    stdout, stderr, rc = exec_cmd(
+        "git rev-parse --verify %s" % pipes.quote("%s^{commit}" % revision),
+        cwd=repo_info.repo_base
+    )
+    if rc != 0:
+        raise ValueError("Unknown GIT revision '%s'." % revision)
+    commit = stdout.strip()
+
+    override_id = hashlib.sha1(inventory.override_yaml or "").hexdigest()[:12]
+    rev_cache = '%s%s-%s.yml' % (_revision_prefix(inventory.cache_file), commit[:12], override_id)
+    if os.path.exists(rev_cache):
+        try:
+            cached = YAMLInventory.from_cache(rev_cache)
+            if not cached.dynamic or time.time() - os.path.getmtime(rev_cache) < inventory.CACHE_EXPIRE:
+                return cached
+        except (ValueError, IOError, OSError):
+            pass
+        try:
+            os.remove(rev_cache)
+        except OSError:
+            pass
+
+    worktree = tempfile.mkdtemp(prefix='inventory-diff-')
+    try:
+        _, stderr, rc = exec_cmd(
+            "git worktree add --detach %s %s" % (pipes.quote(worktree), commit),
+            cwd=repo_info.repo_base
+        )
+        if rc != 0:
+            raise IOError("Can't check out the revision '%s': %s" % (revision, stderr.strip()))
+
+        # The main file is looked up at the same position inside the worktree
+        main_yaml = os.path.relpath(paths_full(inventory.inventory_base, inventory.yaml_file), repo_info.repo_base)
+        main_yaml = os.path.join(worktree, main_yaml)
+
+        result = YAMLInventory(
+            main_yaml,
+            override_yaml=inventory.override_yaml,
+            repo_info=repo_info.__class__(worktree),
+            partition=inventory.partition,
+            cache_file=rev_cache,
+            script_dir=inventory.script_dir,
+            working_dir=inventory.working_dir
+        )
+
+    finally:
+        shutil.rmtree(worktree, ignore_errors=True)
+        exec_cmd("git worktree prune", cwd=repo_info.repo_base)
+
+    _prune_revision_caches(inventory.cache_file, REVISION_CACHES)
+    return result
+
+
+def _revision_prefix(cache_file):
+    """
+    The prefix of the cache files of the revisions of the inventory cached in
+    cache_file
+    """
+    return re.sub(r'\.yml$', '', cache_file) + '-rev-'
+
+
+def _prune_revision_caches(cache_file, keep):
+    """
+    Removes the oldest revision caches of an inventory, keeping the last ones
+    """
+    prefix = _revision_prefix(cache_file)
+    pattern = re.compile(re.escape(prefix) + r'[0-9a-f]{12}-[0-9a-f]{12}\.yml$')
+
+    caches = []
+    for path in glob.glob(prefix + '*.yml'):
+        if not pattern.match(path):
+            continue
+        try:
+            caches.append((os.path.getmtime(path), path))
+        except OSError:
+            continue
+
+    for _, path in sorted(caches, reverse=True)[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+# vim: ft=python:ts=4:sw=4
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+#
+# Custom dynamic inventory script for Ansible that reads instances from the
+# Terraform state
+#
+# The script reads the state files of the Terraform environments and extracts
+# the EC2 instances managed by Terraform, without contacting AWS. The instances
+# are recognised with the same tags used by the AWS inventory script, see
+# inventoryaws.py, and the output has the same format, so the two scripts can be
+# used interchangeably.
+#
+# The following resource types are recognised:
+#
+#   aws_instance                The instance ID is in the "id" attribute
+#   aws_spot_instance_request   The instance ID is in "spot_instance_id"
+#
+# Both the state format of Terraform up to 0.11 (version 3, with the attributes
+# flattened in "primary") and the format of Terraform 0.12 and later (version 4,
+# with the attributes of each instance of a resource) are supported. The region
+# is taken from the availability zone of the instance.
+#
+# The state reflects the instances as they were at the last apply or refresh of
+# Terraform, and the instances whose recorded state is not "running" are
+# skipped like in the AWS inventory.
+#
+
+from __future__ import print_function
+
+import re
+import os
+import json
+from inventoryaws import host_from_tags, build_groups
+from autolibs.terraform.repository import TerraformRepo
+
+RESOURCE_TYPES = {
+    'aws_instance': 'id',
+    'aws_spot_instance_request': 'spot_instance_id',
+}
+
+
+def state_files(environments=None, repo_base=None):
+    """
+    The existing state files of the Terraform environments, all by default
+    """
+    terraform_repo = TerraformRepo(repo_base)
+
+    if not environments:
+        environments = sorted(terraform_repo.environments())
+
+    result = []
+    for environment in environments:
+        state_file = terraform_repo.state_file(environment)
+        if os.path.isfile(state_file):
+            result.append(state_file)
+
+    return result
+
+
+def load_state(state_file):
+    """
+    Reads a Terraform state file
+    """
+    try:
+        with open(state_file) as f:
+            tfstate = json.load(f)
+    except (IOError, ValueError) as e:
+        raise Exception("Can't read the Terraform state %s: %s" % (state_file, e))
+
+    if not isinstance(tfstate, dict):
+        raise Exception("Invalid Terraform state %s" % state_file)
+
+    return tfstate
+
+
+def state_resources(tfstate):
+    """
+    The recognised resources of a Terraform state as (type, attributes, tags)
+    """
+    # Terraform 0.12 and later
+    if tfstate.get('version', 3) >= 4:
+        for resource in tfstate.get('resources', []):
+            if resource.get('mode', 'managed') != 'managed' or resource.get('type') not in RESOURCE_TYPES:
+                continue
+            for instance in resource.get('instances', []):
+                if instance.get('deposed'):
+                    continue
+                attributes = instance.get('attributes') or {}
+                yield resource['type'], attributes, attributes.get('tags') or {}
+        return
+
+    # Terraform up to 0.11, the tags are flattened in the attributes
+    for module in tfstate.get('modules', []):
+        for res_name, res_content in module.get('resources', {}).iteritems():
+            if res_name.startswith('data.') or res_content.get('type') not in RESOURCE_TYPES:
+                continue
+            attributes = (res_content.get('primary') or {}).get('attributes', {})
+            tags = dict(
+                (k[5:], v) for k, v in attributes.iteritems()
+                if k.startswith('tags.') and k != 'tags.%'
+            )
+            yield res_content['type'], attributes, tags
+
+
+def instance_region(attributes, default=None):
+    """
+    The region of an instance, from its availability zone. The regions can have
+    more parts, like us-gov-west-1, and the Local Zones have a suffix after the
+    region, like us-west-2-lax-1a
+    """
+    match = re.match(r'^([a-z]+(?:-[a-z]+)+-\d+)', attributes.get('availability_zone') or "")
+    if match is None:
+        return default
+    return match.group(1)
+
+
+def build_inventory(state_files=(), region=None):
+    """
+    Build the inventory from the Terraform state files
+    """
+    hosts, regions = [], []
+
+    for state_file in state_files:
+        for res_type, attributes, tags in state_resources(load_state(state_file)):
+            # Only running instances and with the Ansible tag
+            if tags.get('Ansible') != 'True':
+                continue
+            if attributes.get('instance_state', 'running') != 'running':
+                continue
+
+            instance_id = attributes.get(RESOURCE_TYPES[res_type])
+            if not instance_id:
+                continue
+
+            host_region = instance_region(attributes, region)
+            if host_region is None:
+                raise Exception("Can't find the region of %s in %s" % (instance_id, state_file))
+            if host_region not in regions:
+                regions.append(host_region)
+
+            hosts.append(host_from_tags(tags, instance_id, attributes.get('private_ip'), host_region))
+
+    return {
+        'hosts': hosts,
+        'groups': build_groups(regions=sorted(regions)),
+        'vars': {
+            'aws': True
+        }
+    }
+
+# vim: ft=python:ts=4:sw=4
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+#
+# Phase-level timing profile of the inventory compilation.
+#
+# The report is a JSON document with the wall and CPU time of each phase, of
+# each imported file and of each executable, some counters like the cache
+# hit/miss and the number of hosts and groups, and the peak RSS of the process
+# and of its children. Times of imported files include their nested imports.
+#
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import resource
+from contextlib import contextmanager
+
+
+class Profiler(object):
+    """
+    Collects the timings of the phases of the inventory compilation
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.phases = []
+        self.files = []
+        self.executables = []
+        self.counters = {}
+        self._start = self._times()
+
+    @contextmanager
+    def phase(self, name, category='phases'):
+        """
+        Measures the wall and CPU time of a block of code
+        """
+        if not self.enabled:
+            yield
+            return
+
+        start = self._times()
+        try:
+            yield
+        finally:
+            end = self._times()
+            getattr(self, category).append({
+                'name': name,
+                'wall': round(end[0] - start[0], 6),
+                'cpu': round(end[1] - start[1], 6),
+                'children_cpu': round(end[2] - start[2], 6),
+            })
+
+    def count(self, name, value):
+        """
+        Records a counter
+        """
+        if self.enabled:
+            self.counters[name] = value
+
+    def report(self):
+        """
+        The profile collected so far
+        """
+        end = self._times()
+        return {
+            'total': {
+                'wall': round(end[0] - self._start[0], 6),
+                'cpu': round(end[1] - self._start[1], 6),
+                'children_cpu': round(end[2] - self._start[2], 6),
+            },
+            'phases': self.phases,
+            'files': self.files,
+            'executables': self.executables,
+            'counters': self.counters,
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'children_peak_rss_kb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        }
+
+    def write(self, destination):
+        """
+        Writes the report to a file, or to stderr when the destination is "-"
+        """
+        if not self.enabled:
+            return
+
+        report = json.dumps(self.report(), indent=2, sort_keys=True)
+        if destination in ['-', 'stderr']:
+            print(report, file=sys.stderr)
+        else:
+            with open(destination, 'w') as f:
+                f.write(report)
+
+    @staticmethod
+    def _times():
+        """
+        Wall time, CPU time of the process and CPU time of its children
+        """
+        t = os.times()
+        return time.time(), t[0] + t[1], t[2] + t[3]
+
+# vim: ft=python:ts=4:sw=4
@@ -30,27 +30,39 @@ from __future__ import print_function
 import re
 import os
 import sys
+import json
 import yaml
 import glob
+import sqlite3
+import hashlib
+import threading
 import config
 from cfutils.common import *
 from cfutils.execute import *
-from cfutils.gitutils import *
-from ansible import constants as C
+from autolibs.gitfiles import repo_files
+from autolibs.gitmeta import repo_root
+from autolibs.snapshot import RepoSnapshot
+from autolibs.lazy import lazy_property, Memoised
+from codeindex import CodeIndex
+from ansiblecfg import AnsibleCfg
 
+VAULT_HEADER = re.compile(r'^\$ANSIBLE_VAULT;[^;]+;[^;]+$')
 
-class AnsibleRepo:
+
+class AnsibleRepo(object):
     """
-    Information about an Ansible repository
+    Information about an Ansible repository. There is one instance for each
+    repository in the process, shared by its threads, and the configuration of
+    Ansible, the executables and the paths are read on their first use and kept
+    in the snapshot of the repository. A new instance is built when a
+    configuration file changes. All the paths are resolved from the base of the
+    repository, never from the working directory.
     """
+    __metaclass__ = Memoised
 
     def __init__(self, repo_base=None):
         # Get repository base
-        if repo_base is None and is_git_repo(repo_base):
-            repo_base = get_git_root()
-        if not is_git_repo(repo_base):
-            raise ValueError("Not a GIT repository: %s" % repo_base)
-        self.repo_base = repo_base
+        self.repo_base = repo_root(repo_base)
 
         # Load configuration
         self._config = config.AnsibleConfig(self.repo_base)
@@ -60,129 +72,312 @@ class AnsibleRepo:
         if not os.path.isdir(self.base):
             raise IOError("Base Ansible directory doesn't exist in %s" % self.base)
 
-        # Change the working directory to the root of the repository
-        old_cwd = os.getcwd()
-        os.chdir(self.base)
-        self._p, _ = C.load_config_file()
-        os.chdir(old_cwd)
-
-        self._set_executables()
+        # Metadata saved between processes
+        self._snapshot = RepoSnapshot.of(self.repo_base)
 
         # Buffers
-        self._tags      = None
-        self._playbooks = None
-        self._vaults    = None
-
-        # Base paths
-        self.roles_base     = paths_full(self.base, "roles")
-        self.playbooks_base = paths_full(self.base, self._config.playbooks_dir())
-        self.inventory_base = self.ans_config('defaults', 'inventory', '/etc/ansible/hosts')
-
-        # Others
-        self.run_as         = self._config.run_as()
-        self.vault_file     = self._config.vault_file()
-        self.ssh_key        = self._config.ssh_key_file()
-        self.dynainv_file   = self._config.dynamic_inventory_file()
-        self.dynainv_path   = paths_full('scripts/ansible', self.dynainv_file)
+        self._code_index = None
+        self._lock       = threading.RLock()
+
+    def sources(self):
+        """
+        The configuration files the instance is built from
+        """
+        return [self._config.config_file] + AnsibleCfg.candidates(self.base)
+
+    @lazy_property
+    def roles_base(self):
+        """
+        Directory of the roles
+        """
+        return paths_full(self.base, "roles")
+
+    @lazy_property
+    def playbooks_base(self):
+        """
+        Directory of the playbooks
+        """
+        return paths_full(self.base, self._config.playbooks_dir())
+
+    @lazy_property
+    def inventory_base(self):
+        """
+        Inventory configured in ansible.cfg
+        """
+        return self.ans_config('defaults', 'inventory', '/etc/ansible/hosts')
+
+    @lazy_property
+    def run_as(self):
+        """
+        User used to run Ansible
+        """
+        return self._config.run_as()
+
+    @lazy_property
+    def vault_file(self):
+        """
+        Name of the file containing the Ansible Vault password
+        """
+        return self._config.vault_file()
+
+    @lazy_property
+    def ssh_key(self):
+        """
+        Name of the SSH private key used to connect to the remote machines
+        """
+        return self._config.ssh_key_file()
+
+    @lazy_property
+    def dynainv_file(self):
+        """
+        Name of the dynamic inventory script file
+        """
+        return self._config.dynamic_inventory_file()
+
+    @lazy_property
+    def dynainv_path(self):
+        """
+        Path of the dynamic inventory script
+        """
+        return paths_full(self.repo_base, 'scripts/ansible', self.dynainv_file)
+
+    @lazy_property
+    def ansible(self):
+        """
+        Path of the "ansible" executable
+        """
+        return self._bin_path('ANSIBLE', self._config.exec_ansible())
+
+    @lazy_property
+    def ansible_playbook(self):
+        """
+        Path of the "ansible-playbook" executable
+        """
+        return self._bin_path('ANSIBLE_PLAYBOOK', self._config.exec_ansible_playbook())
+
+    @lazy_property
+    def ansible_vault(self):
+        """
+        Path of the "ansible-vault" executable
+        """
+        return self._bin_path('ANSIBLE_VAULT', self._config.exec_ansible_vault())
 
     def ans_config(self, section, name, default):
         """
         Gets an Ansible configuration using the repository's ansible.cfg if present
         """
-        env_var = "ANSIBLE_%s" % name.upper()
-        return C.get_config(self._p, section, name, env_var, default)
+        return self._snapshot.get(
+            "ans_config %s.%s %r" % (section, name, default),
+            lambda: AnsibleCfg(self.base).get(section, name, default),
+            self.sources()
+        )
+
+    def files(self, path=None, fresh=False):
+        """
+        Lists the files of the repository known to git, optionally only under a path
+        """
+        files = repo_files(self.base, fresh=fresh)
+        if path is None:
+            return files
+
+        prefix = os.path.join(os.path.abspath(path), '')
+        return [f for f in files if f.startswith(prefix)]
 
     def playbooks(self):
         """
         Finds all the playbook of the repository
         """
-        if self._playbooks is not None:
-            return self._playbooks
+        # Built only when a directory of the playbooks changed, which the list of
+        # the files can't see when the directory has no other files
+        return self._snapshot.get(
+            "playbooks",
+            lambda: [
+                name for name in self.files(self.playbooks_base, fresh=True)
+                if re.findall(r'\.ya?ml$', name, re.IGNORECASE)
+            ],
+            self._playbook_dirs
+        )
 
-        self._playbooks = []
+    def _playbook_dirs(self, playbooks):
+        """
+        The directories under the base of the playbooks that hold any file of the
+        repository, also the ones without playbooks where a new one can be added,
+        and their parents up to the base
+        """
+        base = os.path.abspath(self.playbooks_base)
+        result = set([base])
 
-        for root, _, files in os.walk(self.playbooks_base, topdown=False):
-            if '.git' in root:
-                continue
+        for name in self.files(base):
+            current = os.path.dirname(name)
+            while current not in result and len(current) > len(base):
+                result.add(current)
+                current = os.path.dirname(current)
 
-            for name in files:
-                name = paths_full(root, name)
+        return [self._config.config_file] + sorted(result)
 
-                if not re.findall(r'\.ya?ml$', name, re.IGNORECASE):
-                    continue
+    def vaulted(self):
+        """
+        Finds all the vaulted files of the repository
+        """
+        index = self._load_vault_index()
+        new_index = {}
 
-                self._playbooks.append(name)
+        vaults = []
+        for name, entry in self._scan_vaults(index):
+            new_index[name] = entry
+            if entry[3]:
+                vaults.append(name)
 
-        return self._playbooks
+        if new_index != index:
+            self._save_vault_index(new_index)
 
-    def vaulted(self):
+        return vaults
+
+    def any_vaulted(self):
         """
-        Finds all the vaulted files of the repository
+        Tells if the repository has at least one vaulted file, stopping at the first
+        """
+        index = self._load_vault_index()
+        new_index = dict(index)
+        found = False
+
+        for name, entry in self._scan_vaults(index):
+            new_index[name] = entry
+            if entry[3]:
+                found = True
+                break
+
+        if new_index != index:
+            self._save_vault_index(new_index)
+
+        return found
+
+    def vault_index_file(self):
         """
-        if self._vaults is not None:
-            return self._vaults
+        File of the index of the vault headers, one for each repository
+        """
+        return self._local_tmp_file('vault-index', 'json')
 
-        self._vaults = []
+    def _local_tmp_file(self, name, extension):
+        """
+        A file in the local_tmp of Ansible, named after the repository. A relative
+        local_tmp is relative to the base of the repository
+        """
+        local_tmp = os.path.expanduser(self.ans_config('defaults', 'local_tmp', '~/.ansible/tmp'))
+        repo_id = hashlib.sha1(os.path.abspath(self.base).encode('utf-8')).hexdigest()[:12]
+        return paths_full(self.base, local_tmp, '%s-%s.%s' % (name, repo_id, extension))
+
+    def _scan_vaults(self, index):
+        """
+        Generates the files of the repository with their index entry. The header of
+        a file is read only when its inode, size or mtime differ from the index
+        """
+        for name in self.files():
+            try:
+                st = os.stat(name)
+            except OSError:
+                continue
 
-        for root, _, files in os.walk(self.base, topdown=False):
-            if '.git' in root:
+            entry = index.get(name)
+            if entry is not None and entry[:3] == [st.st_ino, st.st_size, st.st_mtime]:
+                yield name, entry
                 continue
 
-            for name in files:
-                name = paths_full(root, name)
-                try:
-                    with open(name) as f:
-                        if re.findall(r'^\$ANSIBLE_VAULT;[^;]+;[^;]+$', f.readline()):
-                            self._vaults.append(name)
-                except (OSError, IOError):
-                    continue
+            try:
+                with open(name) as f:
+                    is_vault = bool(VAULT_HEADER.findall(f.readline()))
+            except (OSError, IOError):
+                continue
 
-        return self._vaults
+            yield name, [st.st_ino, st.st_size, st.st_mtime, is_vault]
 
-    def tags(self):
+    def _load_vault_index(self):
         """
-        Lists all the tags of the repository
+        Loads the index of the vault headers, empty if missing or invalid
         """
-        if self._tags is not None:
-            return self._tags
+        try:
+            with open(self.vault_index_file()) as f:
+                index = json.load(f)
+        except (OSError, IOError, ValueError):
+            return {}
 
-        self._tags = []
+        if not isinstance(index, dict):
+            return {}
+        return index
 
-        for task_file in glob.glob(paths_full(self.roles_base, "*/tasks/*.yml")):
+    def _save_vault_index(self, index):
+        """
+        Saves the index of the vault headers. The index is only an optimisation so
+        failures are ignored
+        """
+        index_file = self.vault_index_file()
+        tmp_file = "%s.%d.%d.tmp" % (index_file, os.getpid(), threading.current_thread().ident)
+        try:
+            if not os.path.isdir(os.path.dirname(index_file)):
+                os.makedirs(os.path.dirname(index_file))
+            with open(tmp_file, 'w') as f:
+                json.dump(index, f)
+            os.rename(tmp_file, index_file)
+        except (OSError, IOError):
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def code_index(self):
+        """
+        The index of the code of the repository, updated with the changed files
+        """
+        files = self._code_files()
+
+        # The index is only an optimisation, without a usable file it's kept in memory
+        with self._lock:
+            if self._code_index is None:
+                self._code_index = CodeIndex(self._local_tmp_file('code-index', 'db'))
             try:
-                f = open(task_file, "r")
-                doc = yaml.load(f, Loader=yaml.CLoader)
-                if doc is None:
-                    continue
-                f.close()
-            except (OSError, IOError, yaml.YAMLError):
+                self._code_index.update(files)
+            except (OSError, IOError, sqlite3.Error):
+                self._code_index = CodeIndex(':memory:')
+                self._code_index.update(files)
+            return self._code_index
+
+    def _code_files(self):
+        """
+        The (path, kind, role) of the task files, the handlers and the playbooks
+        """
+        files = []
+        roles_prefix = os.path.join(os.path.abspath(self.roles_base), '')
+        for name in self.files():
+            if not re.findall(r'\.ya?ml$', name, re.IGNORECASE):
                 continue
 
-            for task in doc:
-                tags = task.get("tags", [])
-                if not isinstance(tags, list):
-                    tags = [tags]
-                self._tags.extend(tags)
+            if name.startswith(roles_prefix):
+                parts = name[len(roles_prefix):].split(os.sep)
+                if len(parts) > 2 and parts[1] in ['tasks', 'handlers']:
+                    files.append((name, parts[1], parts[0]))
+
+        files.extend((name, 'playbook', None) for name in self.playbooks())
+        return files
 
-        self._tags = sorted(list(set(self._tags)))
-        return self._tags
+    def tags(self):
+        """
+        Lists all the tags of the repository
+        """
+        return self.code_index().tags()
 
-    def _set_executables(self):
+    def task_names(self):
         """
-        Sets the ansible executables configuration
+        Lists the names of all the tasks of the repository
+        """
+        return self.code_index().task_names()
+
+    def _bin_path(self, env_var, default):
+        """
+        Path of an Ansible executable, from an environment variable or the configuration
         """
         opt_dirs = ["/usr/local/bin", "/usr/bin", "/usr/local/sbin", "/usr/sbin:/bin"]
-        self.ansible = get_bin_path(
-            os.environ.get('ANSIBLE', self._config.exec_ansible()),
-            opt_dirs=opt_dirs
-        )
-        self.ansible_playbook = get_bin_path(
-            os.environ.get('ANSIBLE_PLAYBOOK', self._config.exec_ansible_playbook()),
-            opt_dirs=opt_dirs
-        )
-        self.ansible_vault = get_bin_path(
-            os.environ.get('ANSIBLE_VAULT', self._config.exec_ansible_vault()),
-            opt_dirs=opt_dirs
+        return self._snapshot.get(
+            "bin_path %s" % env_var,
+            lambda: get_bin_path(os.environ.get(env_var, default), opt_dirs=opt_dirs),
+            [self._config.config_file]
         )
 
 # vim: ft=python:ts=4:sw=4
\ No newline at end of file
@@ -68,12 +68,12 @@ def deploy(args, ansible_args):
     debug_level = get_debuglevel(ansible_args)
 
     # Warn the user that vault is being used
-    if len(repo.vaulted()) > 0 and debug_level > 0:
+    if repo.any_vaulted() and debug_level > 0:
         print_c("Found encrypted files, vault password needed.", color="yellow")
         if deploy.vault_file:
             print_c("Vault password found in: \"%s\"." % deploy.vault_file, color="green")
 
-    env = {}
+    env = dict(deploy.environment)
 
     # Warn the user we're in check mode
     if '--check' in ansible_args:
@@ -32,9 +32,15 @@ import sys
 import argparse
 from cfutils.formatting import *
 from autolibs.ansible.inventory import *
+from autolibs.ansible.profiler import Profiler
 from autolibs.ansible.repository import *
 
 
+def split_list(value):
+    """ Splits a comma separated list of values """
+    return [v.strip() for v in (value or '').split(',') if v.strip()]
+
+
 def inventory(args):
     main_yaml = os.environ.get('INVENTORY_MAIN', "main.yml")
     if args.main is not None:
@@ -43,18 +49,65 @@ def inventory(args):
     # The user can add a high-priority YAML code that is imported last
     override = os.environ.get('INVENTORY_OVERRIDE', '')
 
+    # Load only the subtrees of the inventory needed by a partition
+    partition = os.environ.get('INVENTORY_PARTITION', None)
+    if args.partition is not None:
+        partition = args.partition
+
+    # Compile the hosts on multiple processes, 0 means one per CPU
+    workers = os.environ.get('INVENTORY_WORKERS', None)
+    if args.workers is not None:
+        workers = args.workers
+    workers = int(workers) if workers not in [None, ''] else None
+
+    # Timing profile of the compilation, written to a file or to stderr with "-"
+    profile = os.environ.get('INVENTORY_PROFILE', None)
+    if args.profile is not None:
+        profile = args.profile
+    profiler = Profiler(enabled=bool(profile))
+
+    options = {
+        'override_yaml': override,
+        'partition': partition,
+        'workers': workers,
+        'profiler': profiler,
+        'script_dir': os.path.abspath(os.path.dirname(sys.argv[0])),
+        'working_dir': os.getcwd(),
+    }
+
     try:
         # Get the appropriate information from the inventory
-        if args.list:
-            output = YAMLInventory(main_yaml, override_yaml=override).get_list()
+        if args.where or args.query is not None or args.hosts or args.groups:
+            fields = [f.strip() for f in (args.query or '').split(',') if f.strip() not in ['', 'name']]
+            if args.where:
+                if args.hosts or args.groups:
+                    raise ValueError("Use the conditions \"name~\" and \"group=\" instead of --hosts "
+                                     "and --groups with --where.")
+                output = YAMLInventory.load_database(main_yaml, **options).select(args.where, fields)
+            else:
+                output = YAMLInventory(main_yaml, **options).query(
+                    hosts=split_list(args.hosts), groups=split_list(args.groups), fields=fields
+                )
+            if fields:
+                p_json(output)
+            else:
+                print('\n'.join(output))
+
+        elif args.diff:
+            current = YAMLInventory(main_yaml, **options)
+            previous = inventory_at_revision(AnsibleRepo(), current, args.diff)
+            p_json(diff_inventories(previous, current))
+
+        elif args.list:
+            output = YAMLInventory(main_yaml, **options).get_list()
             p_json(output)
 
         elif args.host:
-            output = YAMLInventory(main_yaml, override_yaml=override).get_host(args.host)
+            output = YAMLInventory(main_yaml, **options).get_host(args.host)
             p_json(output)
 
         elif args.list_hosts != '' or args.list_groups != '':
-            inventory = YAMLInventory(main_yaml, override_yaml=override)
+            inventory = YAMLInventory(main_yaml, **options)
 
             # Display hosts
             if args.list_hosts is None:
@@ -77,6 +130,9 @@ def inventory(args):
         print(e, file=sys.stderr)
         sys.exit(1)
 
+    finally:
+        profiler.write(profile)
+
 
 def main():
     # Command line arguments
@@ -116,6 +172,72 @@ def main():
               "Ansible doesn't specify a main file. The main file can can be "
               "specified also with the environment variable INVENTORY_MAIN.")
     )
+    parser.add_argument(
+        '--where', '-w',
+        action='append',
+        help=("Select the hosts matching a condition, like \"group=web\", "
+              "\"datacenter!=lon\", \"ansible_host in 10.2.0.0/16\" or "
+              "\"name~web*\". It can be repeated, all conditions must be true. "
+              "The query runs on an indexed SQLite copy of the inventory.")
+    )
+    parser.add_argument(
+        '--query', '-q',
+        action='store',
+        nargs='?',
+        const='name',
+        help=("Comma separated list of variables to display for the hosts "
+              "selected with --where, or with --hosts and --groups. Without a "
+              "value only the names are shown.")
+    )
+    parser.add_argument(
+        '--hosts',
+        action='store',
+        help=("Comma separated list of host names, also with wildcards like "
+              "\"web*\", to select the hosts to display with --query. The "
+              "projection is served from the compiled inventory.")
+    )
+    parser.add_argument(
+        '--groups',
+        action='store',
+        help=("Comma separated list of groups, also with wildcards, to select "
+              "the hosts to display with --query.")
+    )
+    parser.add_argument(
+        '--diff', '-d',
+        action='store',
+        metavar='REV',
+        help=("Show the hosts and groups that changed since the GIT revision REV. "
+              "Only the entities whose content hashes differ are compared.")
+    )
+    parser.add_argument(
+        '--partition', '-p',
+        action='store',
+        help=("Load only the imports and executables tagged for this partition, "
+              "usually the environment, together with the untagged ones. The "
+              "partition can be specified also with the environment variable "
+              "INVENTORY_PARTITION.")
+    )
+
+    parser.add_argument(
+        '--profile',
+        action='store',
+        nargs='?',
+        const='-',
+        metavar='FILE',
+        help=("Write a JSON timing profile of the compilation to FILE, or to "
+              "stderr when FILE is omitted or \"-\". It can be enabled also with "
+              "the environment variable INVENTORY_PROFILE.")
+    )
+    parser.add_argument(
+        '--workers',
+        action='store',
+        type=int,
+        help=("Number of processes used to compile the hosts of large inventories, "
+              "0 to use one per CPU. By default the hosts are compiled by the main "
+              "process, check the gain on the machine with the --scaling option of "
+              "benchmarks/bench_inventory.py first. It can be specified also with "
+              "the environment variable INVENTORY_WORKERS.")
+    )
 
     try:
         inventory(parser.parse_args())
@@ -25,11 +25,27 @@
 
 from __future__ import print_function
 
-import boto3
+import os
+import sys
+import json
 import argparse
 from autolibs.ansible.inventoryaws import *
 
 
+def print_ndjson(regions, workers, timeout, cache_options):
+    """
+    Prints the inventory one record per line, flushing every page of hosts
+    """
+    for group in build_groups(regions=regions):
+        print(json.dumps({'group': group}))
+    print(json.dumps({'vars': {'aws': True}}))
+    sys.stdout.flush()
+
+    for hosts in iter_host_pages(regions=regions, workers=workers, timeout=timeout, **cache_options):
+        sys.stdout.write("".join(json.dumps({'host': h}) + "\n" for h in hosts))
+        sys.stdout.flush()
+
+
 def main():
     # Command line arguments
     parser = argparse.ArgumentParser()
@@ -40,22 +56,100 @@ def main():
         default="",
         help="List of regions where to run the inventory."
     )
+    parser.add_argument(
+        '--workers',
+        action='store',
+        type=int,
+        default=int(os.environ.get('INVENTORY_AWS_WORKERS', 8)),
+        help=("Number of regions scanned in parallel. It can be specified also "
+              "with the environment variable INVENTORY_AWS_WORKERS.")
+    )
+    parser.add_argument(
+        '--timeout',
+        action='store',
+        type=int,
+        default=int(os.environ.get('INVENTORY_AWS_TIMEOUT', 30)),
+        help=("Seconds after which the scan of a region is abandoned and reported "
+              "as failed. It can be specified also with the environment variable "
+              "INVENTORY_AWS_TIMEOUT.")
+    )
+    parser.add_argument(
+        '--cache-ttl',
+        action='store',
+        type=int,
+        default=int(os.environ.get('INVENTORY_AWS_CACHE_TTL', 0)),
+        help=("Seconds for which the snapshots of the regions are used without "
+              "contacting AWS. After that the old snapshot is still used while it's "
+              "refreshed in background. 0 disables the snapshots. It can be "
+              "specified also with the environment variable INVENTORY_AWS_CACHE_TTL.")
+    )
+    parser.add_argument(
+        '--cache-dir',
+        action='store',
+        default=os.environ.get('INVENTORY_AWS_CACHE_DIR', None),
+        help=("Directory of the snapshots, by default %s. It can be specified also "
+              "with the environment variable INVENTORY_AWS_CACHE_DIR." % DEFAULT_CACHE_DIR)
+    )
+    parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help="Scan all the regions now and replace their snapshots."
+    )
+    parser.add_argument(
+        '--ndjson',
+        action='store_true',
+        help=("Print one JSON record per line, the hosts as soon as each page of "
+              "instances arrives. The YAML inventory reads this output when the "
+              "executable has \"format: ndjson\".")
+    )
+    parser.add_argument(
+        '--background-refresh',
+        action='store_true',
+        help=argparse.SUPPRESS
+    )
     args = parser.parse_args()
 
-    # Find the list of regions
-    regions = filter(None, args.regions.lower().split(','))
-    if not regions:
-        regions = [x['RegionName'] for x in boto3.client('ec2').describe_regions()['Regions']]
-
-    # Extract the information
-    output = {
-        'hosts': build_hosts(regions=regions),
-        'groups': build_groups(regions=regions),
-        'vars': {
-            'aws': True
-        }
+    # Detached refresh of the snapshots, started by another run
+    if args.background_refresh:
+        try:
+            refresh_snapshots(
+                filter(None, args.regions.split(',')), args.workers, args.timeout, args.cache_dir
+            )
+        except Exception:
+            sys.exit(1)
+        sys.exit(0)
+
+    cache_options = {
+        'cache_ttl': args.cache_ttl,
+        'refresh': args.refresh,
+        'cache_dir': args.cache_dir,
     }
 
+    try:
+        # Find the list of regions
+        regions = filter(None, args.regions.lower().split(','))
+        if not regions:
+            regions = list_regions(**cache_options)
+
+        # Stream the records as they arrive
+        if args.ndjson:
+            print_ndjson(regions, args.workers, args.timeout, cache_options)
+            return
+
+        # Extract the information
+        output = {
+            'hosts': build_hosts(regions=regions, workers=args.workers, timeout=args.timeout, **cache_options),
+            'groups': build_groups(regions=regions),
+            'vars': {
+                'aws': True
+            }
+        }
+
+    except Exception as e:
+        print_c("ERROR! ", color="light_red", file=sys.stderr)
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
     p_json(output)
 
 
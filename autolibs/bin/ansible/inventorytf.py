@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+from __future__ import print_function
+
+import os
+import sys
+import argparse
+from autolibs.ansible.inventorytf import *
+from cfutils.formatting import *
+
+
+def main():
+    # Command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--environments', '-e',
+        action='store',
+        default=os.environ.get('INVENTORY_TF_ENVIRONMENTS', ""),
+        help=("Comma separated list of the Terraform environments to read, all by "
+              "default. It can be specified also with the environment variable "
+              "INVENTORY_TF_ENVIRONMENTS.")
+    )
+    parser.add_argument(
+        '--state', '-s',
+        action='append',
+        default=[],
+        help=("Terraform state file to read instead of the ones of the environments. "
+              "It can be repeated.")
+    )
+    parser.add_argument(
+        '--region', '-r',
+        action='store',
+        default=os.environ.get('INVENTORY_TF_REGION', None),
+        help=("Region of the instances without an availability zone in the state. It "
+              "can be specified also with the environment variable INVENTORY_TF_REGION.")
+    )
+    args = parser.parse_args()
+
+    try:
+        # Find the state files
+        states = args.state
+        if not states:
+            states = state_files(filter(None, args.environments.split(',')))
+
+        output = build_inventory(states, region=args.region)
+
+    except Exception as e:
+        print_c("ERROR! ", color="light_red", file=sys.stderr)
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+    p_json(output)
+
+
+if __name__ == '__main__':
+    main()
+
+# vim: ft=python:ts=4:sw=4
@@ -81,7 +81,10 @@ def list_host_groups(repo_info, playbook, target):
     """ List the hosts and groups available in the repository. """
     deploy_info = DeployConfig(repo_info, playbook, target, "")
 
-    stdout, stderr, rc = exec_cmd("%s --list-hosts=name --list-groups=name" % deploy_info.inventory)
+    env = os.environ.copy()
+    env.update(deploy_info.environment)
+
+    stdout, stderr, rc = exec_cmd("%s --list-hosts=name --list-groups=name" % deploy_info.inventory, env=env)
     if rc > 0 or stdout.strip() == "":
         return []
 
@@ -93,6 +96,11 @@ def list_tags(repo_info, playbook, target):
     return repo_info.tags()
 
 
+def list_task_names(repo_info, playbook, target):
+    """ It lists the names of the Ansible tasks in the repository. """
+    return repo_info.task_names()
+
+
 def main():
     parser = argparse.ArgumentParser()
 
@@ -141,6 +149,9 @@ def main():
         if previous_word in ['-t', '--tags', '--skip-tags']:
             result = list_tags(repo_info, playbook, environment)
 
+        elif previous_word == '--start-at-task':
+            result = list_task_names(repo_info, playbook, environment)
+
         elif previous_word in ['-l', '--limit']:
             result = list_host_groups(repo_info, playbook, environment)
 
@@ -29,10 +29,10 @@ import os
 import packer
 import ansible
 import terraform
-import configparser
+from autolibs.repoconfig import RepoConfig
 
 
-class Config:
+class Config(object):
     """
     Repository Configuration
     """
@@ -40,13 +40,9 @@ class Config:
     def __init__(self, repo_base):
         self._repo_base = repo_base
 
-        self.config_file = os.path.join(self._repo_base, self.config_file())
-        self.config = configparser.ConfigParser()
-        self.config.read(self.config_file)
-        if "packer" not in self.config.sections():
-            raise LookupError("Repository configuration section doesn't exist in %s." % self.config_file)
-        self._repository = self.config['repository']
-
+        repo_config = RepoConfig.of(self._repo_base)
+        repo_config.section("repository", "Repository")
+        self.config_file = repo_config.config_file
 
         # Ansible
         try:
@@ -73,11 +69,18 @@ class Config:
         """
         return ".repoconfig"
 
+    @property
+    def config(self):
+        """
+        The parsed configuration file
+        """
+        return RepoConfig.of(self._repo_base).config
+
     def secret_files(self):
         """
         List of sensitive files
         """
-        return self._repository.get("secret_files", "").split(',')
+        return RepoConfig.of(self._repo_base).getlist("repository", "secret_files")
 
 
 # vim: ft=python:ts=4:sw=4
\ No newline at end of file
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Enumeration of the files of a repository
+#
+
+#
+# The files are read from the git index with one call of "git ls-files" that
+# returns the tracked files and, optionally, the untracked files that are not
+# ignored. The .git directory, the ignored files and the untracked directories
+# listed in .gitignore are never traversed. If git can't be used, the files are
+# found walking the directory and skipping .git.
+#
+# Each list is kept with the fingerprints of the git index and of the
+# directories that contain the files, up to the listed directory, and it's read
+# again when one of them changes: a file added, removed or renamed changes the
+# directory that holds it and staging changes the index. A file added under a
+# directory that has no files at all isn't seen until something else changes,
+# the callers that know that something changed can ask for a fresh list and the
+# ones that need to forget all the lists can use clear_files().
+#
+
+from __future__ import print_function
+
+import os
+import sys
+import subprocess
+from autolibs.gitmeta import find_git_dir, fingerprint
+
+_FILES = {}
+
+
+def repo_files(path, untracked=True, fresh=False):
+    """
+    The absolute paths of the existing files under a directory of a repository,
+    read again when fresh is set
+    """
+    path = os.path.abspath(path)
+    key = (path, untracked)
+
+    cached = _FILES.get(key)
+    if not fresh and cached is not None and _unchanged(cached[0]):
+        return cached[1]
+
+    files = _git_files(path, untracked)
+    if files is None:
+        files = _walk_files(path)
+
+    _FILES[key] = (_stamp(path, files), files)
+    return files
+
+
+def clear_files():
+    """
+    Forgets the lists of files already read
+    """
+    _FILES.clear()
+
+
+def _stamp(path, files):
+    """
+    The fingerprints of the git index and of the directories of a list of files
+    """
+    dirs = set([path])
+    for name in files:
+        current = os.path.dirname(name)
+        while current not in dirs and len(current) > len(path):
+            dirs.add(current)
+            current = os.path.dirname(current)
+
+    paths = list(dirs)
+    info = find_git_dir(path)
+    if info is not None:
+        paths.append(os.path.join(info.git_dir, 'index'))
+
+    return dict((p, fingerprint(p)) for p in paths)
+
+
+def _unchanged(stamp):
+    """
+    Tells if all the paths of a stamp still have the same fingerprint
+    """
+    return all(fingerprint(p) == value for p, value in stamp.items())
+
+
+def _git_files(path, untracked):
+    """
+    The files of a directory from the git index, None if git can't be used
+    """
+    cmd = ['git', 'ls-files', '-z', '--cached']
+    if untracked:
+        cmd += ['--others', '--exclude-standard']
+
+    try:
+        with open(os.devnull, 'w') as devnull:
+            process = subprocess.Popen(cmd, cwd=path, stdout=subprocess.PIPE, stderr=devnull)
+            output, _ = process.communicate()
+    except OSError:
+        return None
+
+    if process.returncode != 0:
+        return None
+
+    names = sorted(set(filter(None, output.split('\0'))))
+    if isinstance(path, unicode):
+        names = [n.decode(sys.getfilesystemencoding() or 'utf-8', 'replace') for n in names]
+
+    # The index lists also the deleted files and the submodules
+    files = []
+    for name in names:
+        name = os.path.join(path, name)
+        if os.path.isfile(name):
+            files.append(name)
+
+    return files
+
+
+def _walk_files(path):
+    """
+    The files of a directory walking the file system
+    """
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs[:] = [d for d in dirs if d != '.git']
+        files.extend(os.path.join(root, n) for n in names)
+    return files
+
+# vim: ft=python:ts=4:sw=4
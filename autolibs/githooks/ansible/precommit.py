@@ -46,14 +46,7 @@ def pre_commit():
 
     # Check YAML syntax (not Ansible validity, it will take too long)
     print_c("  Checking YAML syntax... ", end='')
-    bad_yaml = []
-    for root, _, files in os.walk(repo.base, topdown=False):
-        if '.git' in root:
-            continue
-        for name in files:
-            name = os.path.join(root, name)
-            if not is_valid_yaml(name):
-                bad_yaml.append(name)
+    bad_yaml = [name for name in repo.files() if not is_valid_yaml(name)]
 
     if len(bad_yaml) > 0:
         print_c("ERROR", color='light_red')
@@ -65,7 +58,7 @@ def pre_commit():
             "Bad files:"
         )
         for f in bad_yaml:
-            print("  %s" % f[(len(repo.base) + 1):])
+            print("  %s" % os.path.relpath(f, repo.base))
         print(
             "\nAborting the commit.\n"
         )
@@ -75,14 +68,7 @@ def pre_commit():
 
     # Check cleartext passwords
     print_c("  Checking cleartext secrets... ", end='')
-    vaults = []
-    for root, _, files in os.walk(repo.base, topdown=False):
-        if '.git' in root:
-            continue
-        for name in files:
-            name = os.path.join(root, name)
-            if contains_cleartext_secrets(name):
-                vaults.append(name)
+    vaults = [name for name in repo.files() if contains_cleartext_secrets(name)]
 
     if len(vaults) > 0:
         print_c("ERROR", color='light_red')
@@ -98,7 +84,7 @@ def pre_commit():
             "Sensitive files:"
         )
         for f in vaults:
-            print("  %s" % f[(len(repo.base) + 1):])
+            print("  %s" % os.path.relpath(f, repo.base))
         print(
             "\nAborting the commit.\n"
         )
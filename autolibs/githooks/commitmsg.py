@@ -32,6 +32,7 @@ import sys
 from cfutils.common import *
 from cfutils.execute import *
 from cfutils.gitutils import *
+from autolibs.gitmeta import current_branch
 from cfutils.formatting import print_c
 
 
@@ -136,7 +137,7 @@ def commit_msg(commit_msg):
     if not is_merge:
         print_c("  Check branch name... ", end='')
 
-        git_branch = re.search(r'\s*\*\s+(.*)', exec_git('branch'), re.MULTILINE).group(1).strip()
+        git_branch = current_branch() or ""
 
         # Branch type
         branch_type = build_regex("(feature|bugfix|hotfix|ticket|release)", pattern_name="type")
@@ -33,6 +33,7 @@ import psutil
 
 from cfutils.execute import *
 from cfutils.gitutils import *
+from autolibs.gitmeta import current_branch
 from autolibs.config import Config
 from packer import prepush as packer
 from cfutils.formatting import print_c
@@ -59,7 +60,7 @@ def pre_push():
 
     # Check we're not committing into protected branches
     print_c("  Target branch... ", end='')
-    git_branch = re.search(r'\s*\*\s+(.*)', exec_git('branch'), re.MULTILINE).group(1).strip()
+    git_branch = current_branch() or ""
     if git_branch in ['master', 'development', 'devel']:
         print_c("ERROR", color="light_red")
         print(
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Metadata of GIT repositories read without running git
+#
+
+#
+# The repository is found walking up from a directory until a .git is found.
+# When .git is a file, like in linked worktrees and submodules, it contains the
+# path of the real GIT directory in a "gitdir:" line, and when the GIT directory
+# has a "commondir" file the shared references are read from the directory it
+# points to. The environment variables GIT_DIR and GIT_WORK_TREE, set by git
+# when it runs the hooks, are honoured when the search starts from the working
+# directory.
+#
+# HEAD and the references are read from the loose files first and then from
+# packed-refs. The repositories found are kept with the fingerprint of their
+# .git and the references with the fingerprints of the files they were read
+# from, and they are looked up again when one of them changes. The paths that
+# are not in a repository are not kept, so a repository created later is found.
+# The callers that need to forget all the results can use clear_cache().
+#
+
+from __future__ import print_function
+
+import os
+import collections
+
+GitDir = collections.namedtuple('GitDir', ['root', 'git_dir', 'common_dir'])
+
+_GIT_DIRS = {}
+_GIT_DIRS_MAX = 1024
+_REFS = {}
+_PACKED_REFS = {}
+
+
+def find_git_dir(path=None):
+    """
+    The GitDir of the repository containing path, or the working directory, None
+    if it's not in a GIT repository
+    """
+    key = os.path.abspath(path or os.getcwd())
+    if path is None and os.environ.get('GIT_DIR'):
+        key = (key, os.environ['GIT_DIR'], os.environ.get('GIT_WORK_TREE'))
+
+    cached = _GIT_DIRS.get(key)
+    if cached is not None and fingerprint(cached[0]) == cached[1]:
+        return cached[2]
+
+    info = _find_git_dir(path)
+    if info is None:
+        _GIT_DIRS.pop(key, None)
+        return None
+
+    # The .git of the working tree, or the GIT directory when it's elsewhere
+    dot_git = os.path.join(info.root, '.git')
+    if not os.path.exists(dot_git):
+        dot_git = info.git_dir
+
+    if len(_GIT_DIRS) >= _GIT_DIRS_MAX:
+        _GIT_DIRS.clear()
+    _GIT_DIRS[key] = (dot_git, fingerprint(dot_git), info)
+
+    return info
+
+
+def is_git_repo(path=None):
+    """
+    Checks if a path, or the working directory, is in a GIT repository
+    """
+    return find_git_dir(path) is not None
+
+
+def get_git_root(path=None):
+    """
+    The top directory of the working tree containing path, or the working directory
+    """
+    info = find_git_dir(path)
+    if info is None:
+        raise ValueError("Not a GIT repository: %s" % (path or os.getcwd()))
+    return info.root
+
+
+def repo_root(repo_base=None):
+    """
+    The base of a repository as given, or the top of the working tree containing
+    the working directory. Raises ValueError if it's not a GIT repository.
+    """
+    if not is_git_repo(repo_base):
+        raise ValueError("Not a GIT repository: %s" % repo_base)
+    if repo_base is None:
+        return get_git_root()
+    return repo_base
+
+
+def head(path=None):
+    """
+    The content of HEAD, the name of a reference or a commit ID when detached
+    """
+    info = _require(path)
+    value = _read_ref(info, 'HEAD')
+    if value is not None and value.startswith('ref: '):
+        return value[5:].strip()
+    return value
+
+
+def current_branch(path=None):
+    """
+    The name of the checked out branch, None when HEAD is detached
+    """
+    value = head(path)
+    if value is not None and value.startswith('refs/heads/'):
+        return value[len('refs/heads/'):]
+    return None
+
+
+def resolve_ref(ref, path=None):
+    """
+    The commit ID of a reference, following the symbolic references, or None
+    """
+    info = _require(path)
+
+    for _ in range(10):
+        value = _read_ref(info, ref)
+        if value is None or not value.startswith('ref: '):
+            return value
+        ref = value[5:].strip()
+
+    return None
+
+
+def fingerprint(path):
+    """
+    The inode, size and mtime of a path, None if it doesn't exist
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_ino, st.st_size, st.st_mtime]
+
+
+def clear_cache():
+    """
+    Forgets the repositories and the references already read
+    """
+    _GIT_DIRS.clear()
+    _REFS.clear()
+    _PACKED_REFS.clear()
+
+
+def _require(path):
+    info = find_git_dir(path)
+    if info is None:
+        raise ValueError("Not a GIT repository: %s" % (path or os.getcwd()))
+    return info
+
+
+def _find_git_dir(path):
+    """
+    Walks up from path looking for the GIT directory
+    """
+    start = os.path.abspath(path or os.getcwd())
+
+    # Set by git in the hooks
+    if path is None and os.environ.get('GIT_DIR'):
+        git_dir = os.path.abspath(os.environ['GIT_DIR'])
+        if not _is_git_dir(git_dir):
+            return None
+        root = os.environ.get('GIT_WORK_TREE')
+        if root is None:
+            found = _find_git_dir(start) if os.path.basename(git_dir) != '.git' else None
+            root = found.root if found is not None else os.path.dirname(git_dir)
+        return GitDir(os.path.abspath(root), git_dir, _common_dir(git_dir))
+
+    current = start
+    while True:
+        dot_git = os.path.join(current, '.git')
+
+        if os.path.isdir(dot_git) and _is_git_dir(dot_git):
+            return GitDir(current, dot_git, _common_dir(dot_git))
+
+        if os.path.isfile(dot_git):
+            git_dir = _read_gitdir_file(dot_git)
+            if git_dir is not None and _is_git_dir(git_dir):
+                return GitDir(current, git_dir, _common_dir(git_dir))
+
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+
+
+def _is_git_dir(git_dir):
+    return os.path.isfile(os.path.join(git_dir, 'HEAD'))
+
+
+def _read_gitdir_file(dot_git):
+    """
+    The GIT directory pointed by a .git file
+    """
+    try:
+        with open(dot_git) as f:
+            line = f.readline().strip()
+    except (OSError, IOError):
+        return None
+
+    if not line.startswith('gitdir:'):
+        return None
+    git_dir = line[len('gitdir:'):].strip()
+    return os.path.normpath(os.path.join(os.path.dirname(dot_git), git_dir))
+
+
+def _common_dir(git_dir):
+    """
+    The directory with the references shared by all the worktrees
+    """
+    try:
+        with open(os.path.join(git_dir, 'commondir')) as f:
+            common_dir = f.readline().strip()
+    except (OSError, IOError):
+        return git_dir
+    return os.path.normpath(os.path.join(git_dir, common_dir))
+
+
+def _read_ref(info, ref):
+    """
+    The content of a reference from the loose files or packed-refs
+    """
+    key = (info.git_dir, ref)
+    sources = [
+        os.path.join(info.git_dir, ref),
+        os.path.join(info.common_dir, ref),
+        os.path.join(info.common_dir, 'packed-refs'),
+    ]
+    stamp = [fingerprint(p) for p in sources]
+
+    cached = _REFS.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    value = None
+
+    # HEAD and the other per-worktree references are in the GIT directory
+    for base in [info.git_dir, info.common_dir]:
+        try:
+            with open(os.path.join(base, ref)) as f:
+                value = f.readline().strip()
+            break
+        except (OSError, IOError):
+            continue
+
+    if value is None:
+        value = _packed_refs(info.common_dir).get(ref)
+
+    _REFS[key] = (stamp, value)
+    return value
+
+
+def _packed_refs(common_dir):
+    """
+    The references in packed-refs
+    """
+    packed_refs = os.path.join(common_dir, 'packed-refs')
+    stamp = fingerprint(packed_refs)
+
+    cached = _PACKED_REFS.get(common_dir)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    refs = {}
+    try:
+        with open(packed_refs) as f:
+            for line in f:
+                if line.startswith('#') or line.startswith('^'):
+                    continue
+                parts = line.strip().split(' ', 1)
+                if len(parts) == 2:
+                    refs[parts[1]] = parts[0]
+    except (OSError, IOError):
+        pass
+    _PACKED_REFS[common_dir] = (stamp, refs)
+
+    return refs
+
+# vim: ft=python:ts=4:sw=4
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Lazy attributes and per-process instances
+#
+
+from __future__ import print_function
+
+import os
+import threading
+from autolibs.gitmeta import fingerprint
+
+
+class lazy_property(object):
+    """
+    Attribute computed by a method on its first access and then stored in the
+    instance, so the following accesses don't call the method again. Concurrent
+    first accesses on the same instance compute the value only once.
+    """
+
+    def __init__(self, method):
+        self.method = method
+        self.__name__ = method.__name__
+        self.__doc__ = method.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        with instance.__dict__.setdefault('_lazy_lock', threading.RLock()):
+            if self.__name__ not in instance.__dict__:
+                instance.__dict__[self.__name__] = self.method(instance)
+            return instance.__dict__[self.__name__]
+
+
+class Memoised(type):
+    """
+    Metaclass that builds one instance for each class and repository base in the
+    process, shared by all its threads. A relative base is made absolute, without
+    a base the key is the current working directory, where the repository is
+    discovered. When the class has a
+    sources() method, the fingerprints of the files it returns are taken when the
+    instance is built and a new instance is built when one of them changes.
+    """
+
+    _instances = {}
+    _locks = {}
+    _lock = threading.Lock()
+
+    def __call__(cls, repo_base=None):
+        if repo_base is not None:
+            repo_base = os.path.abspath(repo_base)
+        key = (cls, repo_base, os.getcwd() if repo_base is None else None)
+
+        # Only the builds of the same key wait for each other
+        with Memoised._lock:
+            key_lock = Memoised._locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            cached = Memoised._instances.get(key)
+            if cached is not None and Memoised._unchanged(cached[1]):
+                return cached[0]
+
+            instance = super(Memoised, cls).__call__(repo_base)
+            sources = instance.sources() if hasattr(instance, 'sources') else []
+            Memoised._instances[key] = (instance, dict((p, fingerprint(p)) for p in sources))
+            return instance
+
+    @staticmethod
+    def _unchanged(stats):
+        return all(fingerprint(p) == stat for p, stat in stats.items())
+
+    @staticmethod
+    def clear():
+        """
+        Forgets all the instances already built
+        """
+        with Memoised._lock:
+            Memoised._instances.clear()
+            Memoised._locks.clear()
+
+# vim: ft=python:ts=4:sw=4
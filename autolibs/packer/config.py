@@ -26,11 +26,11 @@
 from __future__ import print_function
 
 import os
-import configparser
-from cfutils.gitutils import *
+from autolibs.gitmeta import is_git_repo
+from autolibs.repoconfig import RepoConfig
 
 
-class PackerConfig:
+class PackerConfig(object):
     """
     Packer Section Configuration
     """
@@ -39,15 +39,24 @@ class PackerConfig:
             raise ValueError("Not a GIT repository: %s" % repo_base)
         self._repo_base = repo_base
 
-        self.config_file = os.path.join(self._repo_base, self.config_file())
+        # Configuration section, shared with the other components and looked up
+        # at every access so the changes to the file are seen
+        repo_config = RepoConfig.of(self._repo_base)
+        repo_config.section("packer", "Packer")
+        self.config_file = repo_config.config_file
 
-        # Configuration section
-        self.config = configparser.ConfigParser()
-        self.config.read(self.config_file)
-        if "packer" not in self.config.sections():
-            raise LookupError("Packer configuration section doesn't exist in %s." % self.config_file)
+    @property
+    def config(self):
+        """
+        The parsed configuration file
+        """
+        return RepoConfig.of(self._repo_base).config
 
-        self._packer = self.config['packer']
+    def _get(self, option, default=None):
+        """
+        A value of the Packer section
+        """
+        return RepoConfig.of(self._repo_base).get("packer", option, default)
 
     @staticmethod
     def config_file():
@@ -60,7 +69,7 @@ class PackerConfig:
         """
         Base directory of Packer
         """
-        base_dir = self._packer.get("base_dir", "packer")
+        base_dir = self._get("base_dir", "packer")
         if full_path:
             base_dir = os.path.join(self._repo_base, base_dir)
         return base_dir
@@ -69,6 +78,6 @@ class PackerConfig:
         """
         Name of the Packer configuration file
         """
-        return self._packer.get("packer_file", "packer.json")
+        return self._get("packer_file", "packer.json")
 
 # vim: ft=python:ts=4:sw=4
\ No newline at end of file
@@ -27,21 +27,21 @@ from __future__ import print_function
 
 import os
 import config
-from cfutils.gitutils import *
+from autolibs.gitmeta import repo_root
+from autolibs.lazy import Memoised
 
 
-class PackerRepo:
+class PackerRepo(object):
     """
-    Information about the Packer section of the Automation Repository
+    Information about the Packer section of the Automation Repository. There is
+    one instance for each repository in the process, built again when the
+    configuration changes.
     """
+    __metaclass__ = Memoised
 
     def __init__(self, repo_base=None):
         # Get repository base
-        if repo_base is None and is_git_repo(repo_base):
-            repo_base = get_git_root()
-        if not is_git_repo(repo_base):
-            raise ValueError("Not a GIT repository: %s" % repo_base)
-        self.repo_base = repo_base
+        self.repo_base = repo_root(repo_base)
 
         # Load configuration
         self._config = config.PackerConfig(self.repo_base)
@@ -51,6 +51,12 @@ class PackerRepo:
         if not os.path.isdir(self.base):
             raise IOError("Base Packer directory doesn't exist in %s" % self.base)
 
+    def sources(self):
+        """
+        The configuration files the instance is built from
+        """
+        return [self._config.config_file]
+
     def images(self):
         """
         List of the VM images configured in packer
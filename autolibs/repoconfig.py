@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Configuration of the Automation Repository
+#
+
+#
+# The .repoconfig of a repository is parsed once per process and shared by the
+# configuration classes of all the components. The file is checked at every
+# access and parsed again only if its inode, size or mtime changed.
+#
+
+from __future__ import print_function
+
+import os
+import threading
+import configparser
+from autolibs.gitmeta import fingerprint
+
+CONFIG_FILE = ".repoconfig"
+
+
+class RepoConfig(object):
+    """
+    The parsed .repoconfig of a repository
+    """
+
+    _configs = {}
+    _lock = threading.Lock()
+
+    def __init__(self, repo_base):
+        self.repo_base = repo_base
+        self.config_file = os.path.join(repo_base, CONFIG_FILE)
+        self.fingerprint = fingerprint(self.config_file)
+
+        self.config = configparser.ConfigParser()
+        self.config.read(self.config_file)
+
+    @classmethod
+    def of(cls, repo_base):
+        """
+        The configuration of a repository, parsed again only when the file changes
+        """
+        key = os.path.abspath(repo_base)
+
+        with cls._lock:
+            cached = cls._configs.get(key)
+            if cached is None or cached.fingerprint != fingerprint(cached.config_file):
+                cached = cls._configs[key] = cls(repo_base)
+
+        return cached
+
+    def sections(self):
+        """
+        The list of the sections
+        """
+        return self.config.sections()
+
+    def section(self, name, description=None):
+        """
+        A section of the configuration, raises LookupError if it doesn't exist
+        """
+        if name not in self.config.sections():
+            raise LookupError("%s configuration section doesn't exist in %s." % (
+                description or name.capitalize(), self.config_file
+            ))
+        return self.config[name]
+
+    def get(self, section, option, default=None):
+        """
+        A value as a string
+        """
+        return self.config.get(section, option, fallback=default)
+
+    def getlist(self, section, option, default=""):
+        """
+        A comma separated value as a list
+        """
+        return self.get(section, option, default).split(',')
+
+# vim: ft=python:ts=4:sw=4
@@ -31,7 +31,7 @@ import config
 import packer
 import ansible
 import terraform
-from cfutils.gitutils import *
+from autolibs.gitmeta import repo_root
 
 
 class RepoInfo:
@@ -41,11 +41,7 @@ class RepoInfo:
 
     def __init__(self, repo_base=None):
         # Get repository base
-        if repo_base is None and is_git_repo(repo_base):
-            repo_base = get_git_root()
-        if not is_git_repo(repo_base):
-            raise ValueError("Not a GIT repository: %s" % repo_base)
-        self.repo_base = repo_base
+        self.repo_base = repo_root(repo_base)
 
         # Ansible
         try:
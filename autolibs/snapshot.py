@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Snapshot of the metadata of a repository shared between processes
+#
+
+#
+# The values that the scripts discover on every run, like the Ansible
+# configuration, the paths of the executables and the list of playbooks, are
+# saved in autolibs-snapshot.json in the GIT directory and read back with a single read by the
+# following processes.
+#
+# Every value is saved together with the files and the directories it depends
+# on, as they were before the value was computed. When the snapshot is loaded
+# all of them are checked and if any changed, or the PATH or the ANSIBLE_*
+# environment variables are different, the whole snapshot is discarded and the
+# values are computed again. The snapshot is only an optimisation and it's
+# ignored when it can't be read or written.
+#
+# The threads of a process share the snapshot of each repository. Every access
+# checks again the files of the value and computes it again if they changed, so
+# a long running process sees the changes too. The values are computed outside
+# of the lock, when two threads compute the same value the first one saved is
+# kept.
+#
+
+from __future__ import print_function
+
+import os
+import json
+import hashlib
+import threading
+from autolibs.gitmeta import find_git_dir, fingerprint
+
+SNAPSHOT_FILE = "autolibs-snapshot.json"
+SNAPSHOT_VERSION = 2
+
+
+def env_fingerprint():
+    """
+    Hash of the environment variables that can change the values
+    """
+    env = sorted((k, v) for k, v in os.environ.items() if k == 'PATH' or k.startswith('ANSIBLE'))
+    return hashlib.sha1(json.dumps(env)).hexdigest()
+
+
+class RepoSnapshot(object):
+    """
+    Metadata of a repository saved between processes
+    """
+
+    _snapshots = {}
+    _snapshots_lock = threading.Lock()
+
+    def __init__(self, repo_base):
+        self.repo_base = repo_base
+        self.snapshot_file = None
+        self._lock = threading.RLock()
+        self._values = {}
+        self._watch = {}
+
+        # Only the top of a working tree has a snapshot
+        info = find_git_dir(repo_base)
+        if info is not None and info.root == os.path.abspath(repo_base):
+            self.snapshot_file = os.path.join(info.git_dir, SNAPSHOT_FILE)
+            self._load()
+
+    @classmethod
+    def of(cls, repo_base):
+        """
+        The snapshot of a repository, read once per process
+        """
+        key = os.path.abspath(repo_base)
+        with cls._snapshots_lock:
+            if key not in cls._snapshots:
+                cls._snapshots[key] = cls(key)
+            return cls._snapshots[key]
+
+    def get(self, key, builder, watch=()):
+        """
+        The value of key from the snapshot, or computed by builder and saved. The
+        value depends on the paths in watch, or on the ones returned by watch when
+        it's a function of the value, and it's computed again when one of them
+        changes.
+        """
+        with self._lock:
+            cached = self._values.get(key)
+            stats = self._watch.get(key)
+        if stats is not None and self._unchanged(stats):
+            return cached
+
+        stats = {}
+        if not callable(watch):
+            stats = dict((p, fingerprint(p)) for p in watch)
+
+        value = builder()
+
+        if callable(watch):
+            stats = dict((p, fingerprint(p)) for p in watch(value))
+
+        # Round-trip through JSON so the values are the same as when loaded
+        value = json.loads(json.dumps(value))
+        with self._lock:
+            if key in self._watch and self._unchanged(self._watch[key]):
+                return self._values[key]
+            self._values[key] = value
+            self._watch[key] = stats
+            self._save()
+
+        return value
+
+    def _load(self):
+        try:
+            with open(self.snapshot_file) as f:
+                data = json.load(f)
+        except (OSError, IOError, ValueError):
+            return
+
+        if not isinstance(data, dict) or data.get('version') != SNAPSHOT_VERSION:
+            return
+        if data.get('env') != env_fingerprint():
+            return
+        watch = data.get('watch', {})
+        if not all(self._unchanged(stats) for stats in watch.values()):
+            return
+
+        self._values = data.get('values', {})
+        self._watch = watch
+
+    def _save(self):
+        if self.snapshot_file is None:
+            return
+
+        data = {
+            'version': SNAPSHOT_VERSION,
+            'env': env_fingerprint(),
+            'watch': self._watch,
+            'values': self._values,
+        }
+
+        tmp_file = "%s.%d.tmp" % (self.snapshot_file, os.getpid())
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump(data, f)
+            os.rename(tmp_file, self.snapshot_file)
+        except (OSError, IOError):
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    @staticmethod
+    def _unchanged(stats):
+        """
+        Tells if all the watched paths of a value still have the same fingerprint
+        """
+        return all(fingerprint(p) == stat for p, stat in stats.items())
+
+# vim: ft=python:ts=4:sw=4
@@ -26,11 +26,11 @@
 from __future__ import print_function
 
 import os
-import configparser
-from cfutils.gitutils import *
+from autolibs.gitmeta import is_git_repo
+from autolibs.repoconfig import RepoConfig
 
 
-class TerraformConfig:
+class TerraformConfig(object):
     """
     Terraform Section Configuration
     """
@@ -39,15 +39,24 @@ class TerraformConfig:
             raise ValueError("Not a GIT repository: %s" % repo_base)
         self._repo_base = repo_base
 
-        self.config_file = os.path.join(self._repo_base, self.config_file())
+        # Configuration section, shared with the other components and looked up
+        # at every access so the changes to the file are seen
+        repo_config = RepoConfig.of(self._repo_base)
+        repo_config.section("terraform", "Terraform")
+        self.config_file = repo_config.config_file
 
-        # Configuration section
-        self.config = configparser.ConfigParser()
-        self.config.read(self.config_file)
-        if "terraform" not in self.config.sections():
-            raise LookupError("Terraform configuration section doesn't exist in %s." % self.config_file)
+    @property
+    def config(self):
+        """
+        The parsed configuration file
+        """
+        return RepoConfig.of(self._repo_base).config
 
-        self._terraform = self.config['terraform']
+    def _get(self, option, default=None):
+        """
+        A value of the Terraform section
+        """
+        return RepoConfig.of(self._repo_base).get("terraform", option, default)
 
     @staticmethod
     def config_file():
@@ -60,7 +69,7 @@ class TerraformConfig:
         """
         Base directory of Terraform
         """
-        base_dir = self._terraform.get("base_dir", "terraform")
+        base_dir = self._get("base_dir", "terraform")
         if full_path:
             base_dir = os.path.join(self._repo_base, base_dir)
         return base_dir
@@ -69,7 +78,7 @@ class TerraformConfig:
         """
         Directory containing the environments
         """
-        environments_dir = self._terraform.get("environments_dir", "environments")
+        environments_dir = self._get("environments_dir", "environments")
         if full_path:
             environments_dir = os.path.join(self._repo_base, environments_dir)
         return environments_dir
@@ -78,6 +87,6 @@ class TerraformConfig:
         """
         Name of the Terraform state file
         """
-        return self._terraform.get("state_file", "terraform.tfstate")
+        return self._get("state_file", "terraform.tfstate")
 
 # vim: ft=python:ts=4:sw=4
\ No newline at end of file
@@ -27,21 +27,21 @@ from __future__ import print_function
 
 import os
 import config
-from cfutils.gitutils import *
+from autolibs.gitmeta import repo_root
+from autolibs.lazy import lazy_property, Memoised
 
 
-class TerraformRepo:
+class TerraformRepo(object):
     """
-    Information about the Terraform section of the Automation Repository
+    Information about the Terraform section of the Automation Repository. There is
+    one instance for each repository in the process, built again when the
+    configuration changes.
     """
+    __metaclass__ = Memoised
 
     def __init__(self, repo_base=None):
         # Get repository base
-        if repo_base is None and is_git_repo(repo_base):
-            repo_base = get_git_root()
-        if not is_git_repo(repo_base):
-            raise ValueError("Not a GIT repository: %s" % repo_base)
-        self.repo_base = repo_base
+        self.repo_base = repo_root(repo_base)
 
         # Load configuration
         self._config = config.TerraformConfig(self.repo_base)
@@ -51,11 +51,18 @@ class TerraformRepo:
         if not os.path.isdir(self.base):
             raise IOError("Base Terraform directory doesn't exist in %s" % self.base)
 
-        # Base path of the environments directory
-        self.environments_base = os.path.join(
-            self.base,
-            self._config.environments_dir()
-        )
+    def sources(self):
+        """
+        The configuration files the instance is built from
+        """
+        return [self._config.config_file]
+
+    @lazy_property
+    def environments_base(self):
+        """
+        Base path of the environments directory
+        """
+        return os.path.join(self.base, self._config.environments_dir())
 
     def environments(self):
         """
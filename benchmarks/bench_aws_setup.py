@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# bench_aws_setup.py - Per-region setup cost of inventory-aws
+#
+
+#
+# Measures the time needed to prepare the EC2 access to each region, without
+# contacting AWS:
+#
+#   per_region_session  The old setup: credentials read and a new resource from
+#                       the default session for every region
+#   shared_session      The credentials read once, one shared session and the
+#                       clients cached per region
+#
+# Each strategy runs in a new interpreter, so botocore starts with empty caches,
+# and the results are written as JSON.
+#
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+STRATEGIES = ['per_region_session', 'shared_session']
+PACKAGE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REGIONS = [
+    'ap-northeast-1', 'ap-northeast-2', 'ap-south-1', 'ap-southeast-1', 'ap-southeast-2', 'ca-central-1',
+    'eu-central-1', 'eu-north-1', 'eu-west-1', 'eu-west-2', 'eu-west-3', 'sa-east-1', 'us-east-1',
+    'us-east-2', 'us-west-1', 'us-west-2', 'ap-east-1',
+]
+
+
+def measure(strategy, regions):
+    """
+    Prepares the EC2 access of all the regions and returns the time of each one
+    """
+    import boto3
+    import autolibs.ansible.inventoryaws
+    aws = sys.modules['autolibs.ansible.inventoryaws']
+
+    timings = []
+    start = time.time()
+    for r in regions:
+        region_start = time.time()
+        if strategy == 'per_region_session':
+            access_key, secret_key = aws.read_credentials()
+            boto3.resource('ec2', region_name=r, aws_access_key_id=access_key, aws_secret_access_key=secret_key)
+        else:
+            aws.ec2_client(r)
+        timings.append(round(time.time() - region_start, 6))
+
+    return {
+        'total': round(time.time() - start, 6),
+        'first_region': timings[0],
+        'other_regions_mean': round(sum(timings[1:]) / max(1, len(timings) - 1), 6),
+        'regions': dict(zip(regions, timings)),
+    }
+
+
+def run_strategy(strategy, regions, package, work_dir):
+    """
+    Runs one strategy in a new interpreter
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([package] + [p for p in [env.get('PYTHONPATH')] if p])
+
+    cmd = [sys.executable, os.path.abspath(__file__), '--measure', strategy, '--regions', ",".join(regions)]
+    process = subprocess.Popen(cmd, env=env, cwd=work_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError("Strategy %s failed:\n%s" % (strategy, stderr.decode('utf-8', 'replace')))
+
+    return json.loads(stdout.decode('utf-8'))
+
+
+def benchmark(args):
+    """
+    Runs all the strategies with a dummy credentials file
+    """
+    regions = [r.strip() for r in args.regions.split(',') if r.strip()]
+    work_dir = tempfile.mkdtemp(prefix='bench-aws-')
+
+    try:
+        credentials = os.path.join(work_dir, "aws_credentials")
+        with open(credentials, 'w') as f:
+            f.write("[default]\naws_access_key_id = AKIAEXAMPLE\naws_secret_access_key = secret\n")
+        os.chmod(credentials, 0o600)
+
+        results = {}
+        for strategy in STRATEGIES:
+            runs = [run_strategy(strategy, regions, os.path.abspath(args.package), work_dir)
+                    for _ in range(args.repeat)]
+            results[strategy] = {
+                'median_total': sorted(r['total'] for r in runs)[len(runs) // 2],
+                'runs': runs,
+            }
+            print("%s: %.3fs" % (strategy, results[strategy]['median_total']), file=sys.stderr)
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': sys.version.split()[0],
+        'regions': regions,
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-region setup cost of inventory-aws.")
+    parser.add_argument('--regions', default=",".join(REGIONS), help="Comma separated list of regions.")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs of each strategy.")
+    parser.add_argument('--package', default=PACKAGE, help="Checkout of autolibs to benchmark.")
+    parser.add_argument('--output', '-o', help="File where to write the results, stdout by default.")
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        regions = [r.strip() for r in args.regions.split(',') if r.strip()]
+        print(json.dumps(measure(args.measure, regions)))
+        return
+
+    try:
+        report = json.dumps(benchmark(args), indent=2, sort_keys=True)
+    except RuntimeError as e:
+        print("ERROR! %s" % e, file=sys.stderr)
+        sys.exit(1)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
+
+# vim: ft=python:ts=4:sw=4
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# bench_inventory.py - Benchmark suite of YAMLInventory
+#
+
+#
+# Measures YAMLInventory on a synthetic repository (see synthetic.py) in these
+# scenarios:
+#
+#   cold_compile    Compilation of the YAML sources, without a cache
+#   warm_load       Load of a fresh cache
+#   list_encoding   Warm load, --list output built and encoded as JSON
+#   host_lookup     Warm load, --host output of one host encoded as JSON
+#
+# Each run is executed in a new interpreter so the peak RSS belongs only to the
+# scenario. The results are written as JSON, together with the parameters of
+# the synthetic inventory and the version of autolibs, and two result files
+# can be compared with --compare:
+#
+#   ./bench_inventory.py --hosts 20000 --output before.json
+#   ./bench_inventory.py --hosts 20000 --output after.json
+#   ./bench_inventory.py --compare before.json after.json
+#
+# Another checkout of autolibs can be benchmarked with --package.
+#
+# The scaling of the parallel compilation is measured with --scaling, which runs
+# cold_compile with each number of workers and reports the speedups of the wall
+# time and of the create_ansible_hosts phase over the first one:
+#
+#   ./bench_inventory.py --hosts 20000 --scenarios "" --scaling 1,2,4,8
+#
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import resource
+import subprocess
+import synthetic
+
+SCENARIOS = ['cold_compile', 'warm_load', 'list_encoding', 'host_lookup']
+PACKAGE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(scenario, repo, main_yaml, workers=None):
+    """
+    Runs one scenario inside the current process and returns its measures
+    """
+    from autolibs.ansible.inventory import YAMLInventory
+    from autolibs.ansible.profiler import Profiler
+    from autolibs.ansible.repository import AnsibleRepo
+
+    repo_info = AnsibleRepo(repo)
+    cache_file = YAMLInventory.cache_path(repo_info, yaml_file=main_yaml)
+
+    if scenario == 'cold_compile':
+        if os.path.exists(cache_file):
+            os.remove(cache_file)
+    elif not os.path.exists(cache_file):
+        YAMLInventory(main_yaml, repo_info=repo_info, workers=workers)
+    else:
+        # Keep the cache within its expiry time
+        os.utime(cache_file, None)
+
+    result = {'rss_before_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+    profiler = Profiler(enabled=(scenario == 'cold_compile'))
+
+    start_wall, start_cpu = time.time(), sum(os.times()[:2])
+    inventory = YAMLInventory(main_yaml, repo_info=repo_info, workers=workers, profiler=profiler)
+
+    if scenario == 'list_encoding':
+        result['output_bytes'] = len(json.dumps(inventory.get_list(), indent=4))
+
+    elif scenario == 'host_lookup':
+        host = random.Random(0).choice(sorted(inventory.ansible_host_list))
+        result['output_bytes'] = len(json.dumps(inventory.get_host(host), indent=4))
+
+    result.update({
+        'wall': round(time.time() - start_wall, 6),
+        'cpu': round(sum(os.times()[:2]) - start_cpu, 6),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'children_peak_rss_kb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        'hosts': len(inventory.ansible_host_list),
+        'groups': len(inventory.ansible_group_list),
+    })
+    if profiler.enabled:
+        result['phases'] = dict((p['name'], p['wall']) for p in profiler.phases)
+
+    return result
+
+
+def run_scenario(scenario, repo, main_yaml, package, workers=None):
+    """
+    Runs one scenario in a new interpreter, using the autolibs in package
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([package] + [p for p in [env.get('PYTHONPATH')] if p])
+
+    cmd = [sys.executable, os.path.abspath(__file__), '--measure', scenario, '--repo', repo, '--main', main_yaml]
+    if workers is not None:
+        cmd += ['--workers', str(workers)]
+
+    process = subprocess.Popen(cmd, env=env, cwd=repo, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError("Scenario %s failed:\n%s" % (scenario, stderr.decode('utf-8', 'replace')))
+
+    return json.loads(stdout.decode('utf-8'))
+
+
+def summary(runs):
+    """
+    Minimum, median and maximum of the measures of the runs
+    """
+    result = {}
+    for key in ['wall', 'cpu', 'peak_rss_kb']:
+        values = sorted(r[key] for r in runs)
+        result[key] = {
+            'min': values[0],
+            'median': values[len(values) // 2],
+            'max': values[-1],
+        }
+    return result
+
+
+def scaling(repo, main_yaml, package, workers_list, repeat):
+    """
+    Runs cold_compile with each number of workers, the speedups are the ratios of
+    the medians of the first number over the ones of each number
+    """
+    result = []
+    for workers in [int(w) for w in workers_list.split(',') if w.strip()]:
+        runs = []
+        for i in range(repeat):
+            runs.append(run_scenario('cold_compile', repo, main_yaml, package, workers))
+            print("scaling %d workers %d/%d: %.3fs" % (workers, i + 1, repeat, runs[-1]['wall']), file=sys.stderr)
+
+        phases = sorted(r['phases']['create_ansible_hosts'] for r in runs)
+        result.append({
+            'workers': workers,
+            'wall': summary(runs)['wall']['median'],
+            'create_ansible_hosts': phases[len(phases) // 2],
+        })
+
+    for entry in result:
+        for key in ['wall', 'create_ansible_hosts']:
+            entry['%s_speedup' % key] = round(result[0][key] / entry[key], 2) if entry[key] else None
+        print("%2d workers: wall %.3fs (%.2fx), create_ansible_hosts %.3fs (%.2fx)" % (
+            entry['workers'], entry['wall'], entry['wall_speedup'],
+            entry['create_ansible_hosts'], entry['create_ansible_hosts_speedup']
+        ), file=sys.stderr)
+
+    return result
+
+
+def package_version(package):
+    """
+    The GIT revision of the benchmarked autolibs, if available
+    """
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(
+                ['git', 'describe', '--always', '--dirty'], cwd=package, stderr=devnull
+            ).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(args):
+    """
+    Generates the synthetic repository and runs all the scenarios
+    """
+    params = synthetic.options(args)
+    repo = args.repo or tempfile.mkdtemp(prefix='bench-inventory-')
+    package = os.path.abspath(args.package)
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            raise ValueError("Unknown scenario '%s', valid scenarios are %s." % (scenario, ", ".join(SCENARIOS)))
+
+    try:
+        print("Generating the inventory in %s" % repo, file=sys.stderr)
+        main_yaml = synthetic.generate(repo, **params)
+
+        results = {}
+        for scenario in scenarios:
+            runs = []
+            for i in range(args.repeat):
+                runs.append(run_scenario(scenario, repo, main_yaml, package, args.workers))
+                print("%s %d/%d: %.3fs" % (scenario, i + 1, args.repeat, runs[-1]['wall']), file=sys.stderr)
+            results[scenario] = {'summary': summary(runs), 'runs': runs}
+
+        if args.scaling:
+            results['scaling'] = scaling(repo, main_yaml, package, args.scaling, args.repeat)
+
+    finally:
+        if args.repo is None and not args.keep:
+            shutil.rmtree(repo, ignore_errors=True)
+
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'autolibs': package_version(package),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.sysconf('SC_NPROCESSORS_ONLN'),
+        'parameters': dict(params, workers=args.workers, repeat=args.repeat),
+        'results': results,
+    }
+
+
+def compare(old_file, new_file):
+    """
+    Compares the medians of two result files
+    """
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+
+    if old['parameters'] != new['parameters']:
+        print("WARNING: the results have been collected with different parameters.", file=sys.stderr)
+
+    print("%-16s %-12s %14s %14s %8s" % ("scenario", "measure", old['autolibs'], new['autolibs'], "ratio"))
+    for scenario in SCENARIOS:
+        if scenario not in old['results'] or scenario not in new['results']:
+            continue
+        for key in ['wall', 'cpu', 'peak_rss_kb']:
+            a = old['results'][scenario]['summary'][key]['median']
+            b = new['results'][scenario]['summary'][key]['median']
+            ratio = "%.2fx" % (float(b) / a) if a else "-"
+            print("%-16s %-12s %14s %14s %8s" % (scenario, key, a, b, ratio))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite of YAMLInventory on a synthetic inventory.")
+    synthetic.add_arguments(parser)
+    parser.add_argument('--repeat', type=int, default=5, help="Runs of each scenario.")
+    parser.add_argument('--scenarios', default=",".join(SCENARIOS), help="Comma separated list of scenarios.")
+    parser.add_argument('--workers', type=int, help="Processes used to compile the hosts.")
+    parser.add_argument('--scaling', help="Comma separated numbers of workers to measure the scaling with.")
+    parser.add_argument('--package', default=PACKAGE, help="Checkout of autolibs to benchmark.")
+    parser.add_argument('--repo', help="Directory of the synthetic repository, a temporary one by default.")
+    parser.add_argument('--keep', action='store_true', help="Don't delete the temporary repository.")
+    parser.add_argument('--output', '-o', help="File where to write the results, stdout by default.")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="Compare two result files.")
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    parser.add_argument('--main', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.repo, args.main, args.workers)))
+        return
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    try:
+        report = json.dumps(benchmark(args), indent=2, sort_keys=True)
+    except (ValueError, RuntimeError) as e:
+        print("ERROR! %s" % e, file=sys.stderr)
+        sys.exit(1)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
+
+# vim: ft=python:ts=4:sw=4
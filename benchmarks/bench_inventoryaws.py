@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# bench_inventoryaws.py - Offline benchmark of inventory-aws
+#
+
+#
+# Runs inventory-aws against moto, a local stand-in of EC2 that doesn't need
+# network access nor AWS accounts. The instances are seeded across the regions
+# with the tags used by the inventory:
+#
+#   - tagged and running instances, half of them with an AnsibleName
+#   - instances without the Ansible tag, that must be ignored
+#   - tagged but stopped instances, that must be ignored
+#
+# Each run seeds a new interpreter, then measures the scan of all the regions
+# and the encoding of the output, and checks the result against the seeded
+# instances. The results are written as JSON. moto is required:
+#
+#   pip install moto
+#
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import shutil
+import inspect
+import argparse
+import tempfile
+import resource
+import subprocess
+
+PACKAGE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REGIONS = "eu-west-1,eu-west-2,us-east-1,us-west-2"
+BATCH = 250
+
+
+def seed(client, region, instances, untagged_ratio, stopped_ratio):
+    """
+    Creates the instances of a region and returns the expected hosts
+    """
+    image_id = client.describe_images()['Images'][0]['ImageId']
+    untagged = int(instances * untagged_ratio)
+    stopped = int(instances * stopped_ratio)
+    tagged = instances - untagged - stopped
+
+    expected = {}
+    for kind, count in [('tagged', tagged), ('stopped', stopped), ('untagged', untagged)]:
+        done = 0
+        while done < count:
+            size = min(BATCH, count - done)
+            tags = [
+                {'Key': 'AnsibleGroups', 'Value': "linux,batch_%d" % (done // BATCH)},
+                {'Key': 'Environment', 'Value': "env_%d" % (done % 3)},
+                {'Key': 'AnsibleVars', 'Value': "role=worker tier=%d" % (done % 5)},
+            ]
+            if kind != 'untagged':
+                tags.append({'Key': 'Ansible', 'Value': 'True'})
+
+            response = client.run_instances(
+                ImageId=image_id, MinCount=size, MaxCount=size,
+                TagSpecifications=[{'ResourceType': 'instance', 'Tags': tags}]
+            )
+            ids = [i['InstanceId'] for i in response['Instances']]
+
+            if kind == 'stopped':
+                client.stop_instances(InstanceIds=ids)
+
+            elif kind == 'tagged':
+                for n, instance in enumerate(response['Instances']):
+                    name = instance['InstanceId']
+                    if n % 2 == 0:
+                        name = "%s-host%06d" % (region, done + n)
+                        client.create_tags(Resources=[instance['InstanceId']],
+                                           Tags=[{'Key': 'AnsibleName', 'Value': name}])
+                    expected[name] = instance.get('PrivateIpAddress')
+
+            done += size
+
+    return expected
+
+
+def check(output, expected, regions):
+    """
+    Compares the output of the inventory with the seeded instances
+    """
+    errors = []
+    hosts = dict((h['name'], h) for h in output['hosts'])
+
+    if len(output['hosts']) != len(expected):
+        errors.append("%d hosts returned, %d expected." % (len(output['hosts']), len(expected)))
+    if set(hosts) != set(expected):
+        errors.append("%d hosts are missing and %d are unexpected." % (
+            len(set(expected) - set(hosts)), len(set(hosts) - set(expected))))
+
+    for name, host in hosts.items():
+        region = [r for r in regions if r in host['memberof']]
+        if len(region) != 1 or 'linux' not in host['memberof']:
+            errors.append("Wrong groups of %s: %s" % (name, host['memberof']))
+            break
+        if host['vars'].get('role') != 'worker':
+            errors.append("Wrong variables of %s: %s" % (name, host['vars']))
+            break
+        if name.startswith('i-') and host['vars'].get('ansible_host') != expected.get(name):
+            errors.append("Wrong ansible_host of %s." % name)
+            break
+
+    if sorted(g['name'] for g in output['groups']) != sorted(regions):
+        errors.append("Wrong region groups: %s" % [g['name'] for g in output['groups']])
+
+    return errors
+
+
+def measure(args):
+    """
+    Seeds moto and measures one scan inside the current process
+    """
+    import boto3
+    from moto import mock_ec2
+    import autolibs.ansible.inventoryaws
+    aws = sys.modules['autolibs.ansible.inventoryaws']
+
+    regions = [r.strip() for r in args.regions.split(',') if r.strip()]
+
+    with mock_ec2():
+        # Seed the instances, not measured
+        seed_start = time.time()
+        expected = {}
+        for i, r in enumerate(regions):
+            count = args.instances // len(regions) + (1 if i < args.instances % len(regions) else 0)
+            client = boto3.client('ec2', region_name=r, aws_access_key_id='seed', aws_secret_access_key='seed')
+            expected.update(seed(client, r, count, args.untagged_ratio, args.stopped_ratio))
+        seed_time = time.time() - seed_start
+
+        # Older versions of build_hosts don't have all the options
+        options = {'workers': args.workers, 'timeout': args.timeout}
+        accepted = inspect.getargspec(aws.build_hosts).args
+        options = dict((k, v) for k, v in options.items() if k in accepted and v is not None)
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start_wall, start_cpu = time.time(), sum(os.times()[:2])
+
+        output = {
+            'hosts': aws.build_hosts(regions=regions, **options),
+            'groups': aws.build_groups(regions=regions),
+            'vars': {'aws': True},
+        }
+        scan_wall = time.time() - start_wall
+        encoded = json.dumps(output, indent=4)
+
+        result = {
+            'seed_time': round(seed_time, 6),
+            'scan_wall': round(scan_wall, 6),
+            'wall': round(time.time() - start_wall, 6),
+            'cpu': round(sum(os.times()[:2]) - start_cpu, 6),
+            'rss_before_kb': rss_before,
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'hosts': len(output['hosts']),
+            'output_bytes': len(encoded),
+            'errors': check(output, expected, regions),
+        }
+
+    return result
+
+
+def run_once(args, package, work_dir):
+    """
+    Runs one measure in a new interpreter
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([package] + [p for p in [env.get('PYTHONPATH')] if p])
+    env['INVENTORY_AWS_CREDENTIALS'] = os.path.join(work_dir, "aws_credentials")
+    env['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+    cmd = [
+        sys.executable, os.path.abspath(__file__), '--measure',
+        '--regions', args.regions, '--instances', str(args.instances),
+        '--untagged-ratio', str(args.untagged_ratio), '--stopped-ratio', str(args.stopped_ratio),
+    ]
+    if args.workers is not None:
+        cmd += ['--workers', str(args.workers)]
+    if args.timeout is not None:
+        cmd += ['--timeout', str(args.timeout)]
+
+    process = subprocess.Popen(cmd, env=env, cwd=work_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError("The scan failed:\n%s" % stderr.decode('utf-8', 'replace'))
+
+    return json.loads(stdout.decode('utf-8'))
+
+
+def benchmark(args):
+    """
+    Runs the scans with a dummy credentials file
+    """
+    package = os.path.abspath(args.package)
+    work_dir = tempfile.mkdtemp(prefix='bench-inventoryaws-')
+
+    try:
+        credentials = os.path.join(work_dir, "aws_credentials")
+        with open(credentials, 'w') as f:
+            f.write("[default]\naws_access_key_id = AKIAEXAMPLE\naws_secret_access_key = secret\n")
+        os.chmod(credentials, 0o600)
+
+        runs = []
+        for i in range(args.repeat):
+            runs.append(run_once(args, package, work_dir))
+            print("scan %d/%d: %.3fs, %d hosts" % (i + 1, args.repeat, runs[-1]['wall'], runs[-1]['hosts']),
+                  file=sys.stderr)
+            for error in runs[-1]['errors']:
+                print("  ERROR: %s" % error, file=sys.stderr)
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    summary = {}
+    for key in ['wall', 'cpu', 'peak_rss_kb', 'output_bytes']:
+        values = sorted(r[key] for r in runs)
+        summary[key] = {'min': values[0], 'median': values[len(values) // 2], 'max': values[-1]}
+
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': sys.version.split()[0],
+        'parameters': {
+            'regions': args.regions.split(','),
+            'instances': args.instances,
+            'untagged_ratio': args.untagged_ratio,
+            'stopped_ratio': args.stopped_ratio,
+            'workers': args.workers,
+            'timeout': args.timeout,
+            'repeat': args.repeat,
+        },
+        'valid': not any(r['errors'] for r in runs),
+        'summary': summary,
+        'runs': runs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of inventory-aws using moto.")
+    parser.add_argument('--regions', default=REGIONS, help="Comma separated list of regions.")
+    parser.add_argument('--instances', type=int, default=5000, help="Total number of instances.")
+    parser.add_argument('--untagged-ratio', type=float, default=0.1, help="Instances without the Ansible tag.")
+    parser.add_argument('--stopped-ratio', type=float, default=0.05, help="Tagged instances that are stopped.")
+    parser.add_argument('--workers', type=int, help="Regions scanned in parallel.")
+    parser.add_argument('--timeout', type=int, help="Timeout of each region.")
+    parser.add_argument('--repeat', type=int, default=3, help="Number of scans.")
+    parser.add_argument('--package', default=PACKAGE, help="Checkout of autolibs to benchmark.")
+    parser.add_argument('--output', '-o', help="File where to write the results, stdout by default.")
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args)))
+        return
+
+    try:
+        report = benchmark(args)
+    except RuntimeError as e:
+        print("ERROR! %s" % e, file=sys.stderr)
+        sys.exit(1)
+
+    encoded = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(encoded)
+    else:
+        print(encoded)
+
+    if not report['valid']:
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
+
+# vim: ft=python:ts=4:sw=4
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# bench_repository.py - Constructor cost of the repository classes
+#
+
+#
+# Measures the cost of building AnsibleRepo, PackerRepo and TerraformRepo in a
+# small synthetic repository (see synthetic.py) in these scenarios:
+#
+#   base            AnsibleRepo discovered from the working directory, only the
+#                   base directory is used
+#   completion      AnsibleRepo discovered from the working directory and its
+#                   playbooks_base, like the shell completion
+#   full            AnsibleRepo and all its attributes, ansible.cfg and the
+#                   executables included
+#   repeated        AnsibleRepo built 10 times, like the callers that create
+#                   their own instances
+#   all_sections    AnsibleRepo, PackerRepo and TerraformRepo
+#
+# Each run is executed in a new interpreter after the imports, and the results
+# are written as JSON. Another checkout of autolibs can be benchmarked with
+# --package. The executables are looked up through $ANSIBLE, $ANSIBLE_PLAYBOOK
+# and $ANSIBLE_VAULT, that are set to "true" when missing so Ansible doesn't
+# need to be installed.
+#
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import synthetic
+
+SCENARIOS = ['base', 'completion', 'full', 'repeated', 'all_sections']
+PACKAGE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ATTRIBUTES = [
+    'roles_base', 'playbooks_base', 'inventory_base', 'run_as', 'vault_file', 'ssh_key',
+    'dynainv_file', 'dynainv_path', 'ansible', 'ansible_playbook', 'ansible_vault',
+]
+
+
+def measure(scenario):
+    """
+    Runs one scenario in the repository of the working directory
+    """
+    from autolibs.ansible.repository import AnsibleRepo
+    from autolibs.packer.repository import PackerRepo
+    from autolibs.terraform.repository import TerraformRepo
+
+    start_wall, start_cpu = time.time(), sum(os.times()[:2])
+
+    if scenario == 'base':
+        AnsibleRepo().base
+
+    elif scenario == 'completion':
+        AnsibleRepo().playbooks_base
+
+    elif scenario == 'full':
+        repo = AnsibleRepo()
+        for attribute in ATTRIBUTES:
+            getattr(repo, attribute)
+
+    elif scenario == 'repeated':
+        for _ in range(10):
+            AnsibleRepo().playbooks_base
+
+    elif scenario == 'all_sections':
+        AnsibleRepo()
+        PackerRepo()
+        TerraformRepo()
+
+    return {
+        'wall': round(time.time() - start_wall, 6),
+        'cpu': round(sum(os.times()[:2]) - start_cpu, 6),
+    }
+
+
+def run_scenario(scenario, repo, package):
+    """
+    Runs one scenario in a new interpreter, using the autolibs in package
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([package] + [p for p in [env.get('PYTHONPATH')] if p])
+    for name in ['ANSIBLE', 'ANSIBLE_PLAYBOOK', 'ANSIBLE_VAULT']:
+        env.setdefault(name, 'true')
+
+    cmd = [sys.executable, os.path.abspath(__file__), '--measure', scenario]
+    process = subprocess.Popen(cmd, env=env, cwd=repo, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError("Scenario %s failed:\n%s" % (scenario, stderr.decode('utf-8', 'replace')))
+
+    return json.loads(stdout.decode('utf-8'))
+
+
+def make_repo(path):
+    """
+    Generates a small repository with the Ansible, Packer and Terraform sections
+    """
+    synthetic.generate(path, hosts=10, groups=5, depth=1, files=1)
+
+    for section in ['packer', 'terraform']:
+        os.makedirs(os.path.join(path, section))
+        with open(os.path.join(path, ".repoconfig"), 'a') as f:
+            f.write("\n[%s]\nbase_dir = %s\n" % (section, section))
+
+
+def benchmark(args):
+    """
+    Runs all the scenarios in a temporary repository
+    """
+    package = os.path.abspath(args.package)
+    work_dir = tempfile.mkdtemp(prefix='bench-repository-')
+
+    try:
+        repo = os.path.join(work_dir, "repo")
+        make_repo(repo)
+
+        results = {}
+        for scenario in args.scenarios.split(','):
+            runs = [run_scenario(scenario, repo, package) for _ in range(args.repeat)]
+            values = sorted(r['wall'] for r in runs)
+            results[scenario] = {
+                'wall': {'min': values[0], 'median': values[len(values) // 2], 'max': values[-1]},
+                'runs': runs,
+            }
+            print("%s: %.4fs" % (scenario, results[scenario]['wall']['median']), file=sys.stderr)
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': sys.version.split()[0],
+        'package': package,
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Constructor cost of the repository classes.")
+    parser.add_argument('--scenarios', default=",".join(SCENARIOS), help="Comma separated list of scenarios.")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs of each scenario.")
+    parser.add_argument('--package', default=PACKAGE, help="Checkout of autolibs to benchmark.")
+    parser.add_argument('--output', '-o', help="File where to write the results, stdout by default.")
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure)))
+        return
+
+    try:
+        report = json.dumps(benchmark(args), indent=2, sort_keys=True)
+    except RuntimeError as e:
+        print("ERROR! %s" % e, file=sys.stderr)
+        sys.exit(1)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
+
+# vim: ft=python:ts=4:sw=4
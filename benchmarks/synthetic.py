@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# synthetic.py - Generator of synthetic repositories with a YAML inventory
+#
+
+#
+# The generated directory is a GIT repository with a .repoconfig, an Ansible
+# base with an ansible.cfg that keeps the caches inside the repository and an
+# inventory tree:
+#
+#   ansible/inventories/main.yml         Imports groups.yml and the host tree
+#   ansible/inventories/groups.yml       Groups arranged in "depth" levels
+#   ansible/inventories/hosts/...        Index files importing "fanout" children
+#                                        down to the leaf files with the hosts
+#   ansible/inventories/exec_N.py        Executables printing more hosts
+#
+# Everything is deterministic for a given seed.
+#
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import stat
+import random
+import argparse
+import subprocess
+
+
+REPOCONFIG = """\
+[repository]
+secret_files = vault.txt
+
+[ansible]
+base_dir = ansible
+"""
+
+ANSIBLE_CFG = """\
+[defaults]
+inventory = inventories
+local_tmp = {local_tmp}
+"""
+
+EXECUTABLE = """\
+#!{python}
+import sys
+sys.stdout.write({data!r})
+"""
+
+
+def random_value(rnd, size):
+    """ A random string value """
+    return ''.join(rnd.choice('abcdefghijklmnopqrstuvwxyz0123456789') for _ in range(size))
+
+
+def random_vars(rnd, count, prefix, value_size):
+    """ A dictionary of random variables """
+    return dict(("%s_var_%d" % (prefix, i), random_value(rnd, value_size)) for i in range(count))
+
+
+def build_groups(rnd, groups, depth, var_count, value_size):
+    """
+    Groups arranged in levels, each group is member of one group of the level above
+    """
+    depth = max(1, min(depth, groups))
+    per_level = max(1, groups // depth)
+    result, previous = [], []
+
+    for level in range(depth):
+        count = per_level if level < depth - 1 else groups - per_level * (depth - 1)
+        current = []
+        for i in range(count):
+            group = {
+                'name': "group_l%d_%d" % (level, i),
+                'type': "level_%d" % level,
+                'vars': random_vars(rnd, var_count, "group", value_size),
+            }
+            if previous:
+                group['memberof'] = [rnd.choice(previous)]
+            current.append(group['name'])
+            result.append(group)
+        previous = current
+
+    return result
+
+
+def build_hosts(rnd, first, count, group_names, memberships, var_count, value_size, prefix="host"):
+    """
+    Hosts with random memberships and variables
+    """
+    hosts = []
+    for i in range(first, first + count):
+        h_vars = random_vars(rnd, var_count, "host", value_size)
+        h_vars.update({
+            'ansible_host': "10.%d.%d.%d" % ((i >> 16) & 255, (i >> 8) & 255, i & 255),
+            'datacenter': "dc%d" % (i % 4),
+            'os_family': rnd.choice(['RedHat', 'Debian']),
+        })
+        hosts.append({
+            'name': "%s%06d" % (prefix, i),
+            'memberof': rnd.sample(group_names, min(memberships, len(group_names))),
+            'vars': h_vars,
+        })
+    return hosts
+
+
+def write_yaml(path, data):
+    """ Writes YAML data, JSON is a subset of YAML and much faster to write """
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+
+
+def write_tree(base, relative, leaves, fanout):
+    """
+    Writes an index file importing at most "fanout" children, recursively down to
+    the leaf files. Returns the path of the index relative to the inventory base.
+    """
+    if len(leaves) == 1:
+        return leaves[0]
+
+    index_dir = os.path.join(base, relative)
+    if not os.path.isdir(index_dir):
+        os.makedirs(index_dir)
+
+    chunk = -(-len(leaves) // fanout)
+    imports = []
+    for i in range(0, len(leaves), chunk):
+        imports.append(write_tree(base, os.path.join(relative, "n%d" % (i // chunk)), leaves[i:i + chunk], fanout))
+
+    index = os.path.join(relative, "index.yml")
+    write_yaml(os.path.join(base, index), {'import': imports})
+    return index
+
+
+def generate(path, hosts=1000, groups=50, depth=3, files=10, fanout=4, host_vars=10, group_vars=5,
+             value_size=16, memberships=3, executables=0, executable_hosts=100, constructed=0, seed=42):
+    """
+    Generates a synthetic repository in path and returns the path of the main
+    inventory file
+    """
+    rnd = random.Random(seed)
+    inventory_base = os.path.join(path, "ansible", "inventories")
+    hosts_base = os.path.join(inventory_base, "hosts")
+    for d in [hosts_base, os.path.join(path, "ansible", "playbooks"), os.path.join(path, "tmp")]:
+        if not os.path.isdir(d):
+            os.makedirs(d)
+
+    with open(os.path.join(path, ".repoconfig"), 'w') as f:
+        f.write(REPOCONFIG)
+    with open(os.path.join(path, "ansible", "ansible.cfg"), 'w') as f:
+        f.write(ANSIBLE_CFG.format(local_tmp=os.path.join(path, "tmp")))
+    with open(os.path.join(path, ".gitignore"), 'w') as f:
+        f.write("/tmp/\n")
+
+    # Groups
+    group_list = build_groups(rnd, groups, depth, group_vars, value_size)
+    group_names = [g['name'] for g in group_list]
+    for i in range(constructed):
+        group_list.append({
+            'name': "constructed_%d" % i,
+            'condition': "datacenter == 'dc%d' and os_family == 'RedHat'" % (i % 4),
+        })
+    write_yaml(os.path.join(inventory_base, "groups.yml"), {'groups': group_list})
+
+    # Hosts, split over the leaf files
+    files = max(1, min(files, hosts))
+    per_file = -(-hosts // files)
+    leaves = []
+    for i in range(files):
+        first = i * per_file
+        count = min(per_file, hosts - first)
+        if count <= 0:
+            break
+        leaf = os.path.join("hosts", "leaf_%d.yml" % i)
+        write_yaml(
+            os.path.join(inventory_base, leaf),
+            {'hosts': build_hosts(rnd, first, count, group_names, memberships, host_vars, value_size)}
+        )
+        leaves.append(leaf)
+    hosts_index = write_tree(inventory_base, "hosts", leaves, max(2, fanout))
+
+    # Executables
+    exec_list = []
+    for i in range(executables):
+        exec_path = os.path.join(inventory_base, "exec_%d.py" % i)
+        data = {'hosts': build_hosts(
+            rnd, 0, executable_hosts, group_names, memberships, host_vars, value_size, prefix="exec%d_" % i
+        )}
+        with open(exec_path, 'w') as f:
+            f.write(EXECUTABLE.format(python=sys.executable, data=json.dumps(data)))
+        os.chmod(exec_path, os.stat(exec_path).st_mode | stat.S_IXUSR)
+        exec_list.append({'path': exec_path})
+
+    main_yaml = os.path.join(inventory_base, "main.yml")
+    write_yaml(main_yaml, {
+        'import': ["groups.yml", hosts_index],
+        'executables': exec_list,
+        'vars': random_vars(rnd, group_vars, "global", value_size),
+    })
+
+    # The repository tools require GIT
+    if not os.path.isdir(os.path.join(path, ".git")):
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call(["git", "init", "-q", path], stdout=devnull)
+
+    return main_yaml
+
+
+def add_arguments(parser):
+    """
+    Adds the options of the generator to an argument parser
+    """
+    parser.add_argument('--hosts', type=int, default=1000, help="Number of hosts.")
+    parser.add_argument('--groups', type=int, default=50, help="Number of groups.")
+    parser.add_argument('--depth', type=int, default=3, help="Levels of the group hierarchy.")
+    parser.add_argument('--files', type=int, default=10, help="Number of files the hosts are split into.")
+    parser.add_argument('--fanout', type=int, default=4, help="Number of imports per index file.")
+    parser.add_argument('--host-vars', type=int, default=10, help="Variables per host.")
+    parser.add_argument('--group-vars', type=int, default=5, help="Variables per group and global.")
+    parser.add_argument('--value-size', type=int, default=16, help="Length of the variable values.")
+    parser.add_argument('--memberships', type=int, default=3, help="Groups per host.")
+    parser.add_argument('--executables', type=int, default=0, help="Number of executables.")
+    parser.add_argument('--executable-hosts', type=int, default=100, help="Hosts printed by each executable.")
+    parser.add_argument('--constructed', type=int, default=0, help="Number of groups with a condition.")
+    parser.add_argument('--seed', type=int, default=42, help="Seed of the random generator.")
+
+
+def options(args):
+    """
+    The options of the generator from the parsed arguments
+    """
+    names = [
+        'hosts', 'groups', 'depth', 'files', 'fanout', 'host_vars', 'group_vars', 'value_size',
+        'memberships', 'executables', 'executable_hosts', 'constructed', 'seed'
+    ]
+    return dict((n, getattr(args, n)) for n in names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates a synthetic repository with a YAML inventory.")
+    parser.add_argument('path', help="Directory where to create the repository.")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    print(generate(args.path, **options(args)))
+
+
+if __name__ == '__main__':
+    main()
+
+# vim: ft=python:ts=4:sw=4
@@ -35,7 +35,15 @@ __deploy_complete() {
     local list="$(${SUPPORT_SCRIPT} "${COMP_CWORD}" -- "${COMP_WORDS[@]}")"
     local current_word="${COMP_WORDS[COMP_CWORD]}"
 
-    COMPREPLY=($(compgen -W "$list" -- "$current_word"))
+    # One suggestion per line, task names contain spaces
+    local IFS=$'\n'
+
+    if [[ "${COMP_WORDS[COMP_CWORD-1]}" == "--start-at-task" ]] ; then
+        COMPREPLY=($(compgen -W "$list" -- "${current_word//\\ / }"))
+        [[ ${#COMPREPLY[@]} -gt 0 ]] && COMPREPLY=($(printf '%q\n' "${COMPREPLY[@]}"))
+    else
+        COMPREPLY=($(compgen -W "$list" -- "$current_word"))
+    fi
 }
 
 complete -F __deploy_complete "deploy"
@@ -66,6 +66,7 @@ setup(
             'deploy=autolibs.bin.ansible.deploy:main',
             'inventory=autolibs.bin.ansible.inventory:main',
             'inventory-aws=autolibs.bin.ansible.inventoryaws:main',
+            'inventory-tf=autolibs.bin.ansible.inventorytf:main',
             'vault-host=autolibs.bin.ansible.vault:main',
             'vault-group=autolibs.bin.ansible.vault:main',
             'packit=autolibs.bin.packer.packit:main',
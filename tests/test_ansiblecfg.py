@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# test_ansiblecfg.py - Tests of the reader of the Ansible configuration
+#
+
+from __future__ import print_function
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from autolibs.ansible import ansiblecfg
+from autolibs.ansible.ansiblecfg import AnsibleCfg
+from autolibs.ansible.inventory import YAMLInventory
+from autolibs.ansible.repository import AnsibleRepo
+
+
+class AnsibleCfgTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp(prefix='test-ansiblecfg-')
+
+        # The files of the user and of the system are replaced by temporary ones
+        self.config_files = ansiblecfg.CONFIG_FILES
+        ansiblecfg.CONFIG_FILES = [self.path('home/.ansible.cfg'), self.path('etc/ansible.cfg')]
+
+        self.environ = dict(os.environ)
+        for name in list(os.environ):
+            if name.startswith('ANSIBLE_'):
+                del os.environ[name]
+
+    def tearDown(self):
+        ansiblecfg.CONFIG_FILES = self.config_files
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.base)
+
+    def path(self, name):
+        return os.path.join(self.base, name)
+
+    def write(self, name, forks):
+        if not os.path.isdir(os.path.dirname(self.path(name))):
+            os.makedirs(os.path.dirname(self.path(name)))
+        with open(self.path(name), 'w') as f:
+            f.write("[defaults]\nforks = %s\n" % forks)
+
+
+class TestLookupChain(AnsibleCfgTestCase):
+
+    def setUp(self):
+        super(TestLookupChain, self).setUp()
+        self.write('env/ansible.cfg', 'env')
+        self.write('ansible/ansible.cfg', 'base')
+        self.write('home/.ansible.cfg', 'home')
+        self.write('etc/ansible.cfg', 'etc')
+
+    def forks(self):
+        return AnsibleCfg(self.path('ansible')).get('defaults', 'forks')
+
+    def test_environment_file(self):
+        os.environ['ANSIBLE_CONFIG'] = self.path('env/ansible.cfg')
+        self.assertEqual(self.forks(), 'env')
+
+    def test_environment_directory(self):
+        os.environ['ANSIBLE_CONFIG'] = self.path('env')
+        self.assertEqual(self.forks(), 'env')
+
+    def test_missing_environment_file(self):
+        os.environ['ANSIBLE_CONFIG'] = self.path('env/missing.cfg')
+        self.assertEqual(self.forks(), 'base')
+
+    def test_base(self):
+        self.assertEqual(self.forks(), 'base')
+        self.assertEqual(AnsibleCfg(self.path('ansible')).config_file, self.path('ansible/ansible.cfg'))
+
+    def test_home(self):
+        os.remove(self.path('ansible/ansible.cfg'))
+        self.assertEqual(self.forks(), 'home')
+
+    def test_system(self):
+        os.remove(self.path('ansible/ansible.cfg'))
+        os.remove(self.path('home/.ansible.cfg'))
+        self.assertEqual(self.forks(), 'etc')
+
+    def test_no_file(self):
+        for name in ['ansible/ansible.cfg', 'home/.ansible.cfg', 'etc/ansible.cfg']:
+            os.remove(self.path(name))
+
+        config = AnsibleCfg(self.path('ansible'))
+        self.assertIsNone(config.config_file)
+        self.assertEqual(config.get('defaults', 'forks', '5'), '5')
+
+
+class TestValues(AnsibleCfgTestCase):
+
+    def config(self, content):
+        if not os.path.isdir(self.path('ansible')):
+            os.makedirs(self.path('ansible'))
+        with open(self.path('ansible/ansible.cfg'), 'w') as f:
+            f.write(content)
+        return AnsibleCfg(self.path('ansible'))
+
+    def test_environment_overrides(self):
+        config = self.config("[defaults]\nforks = 5\n")
+        os.environ['ANSIBLE_FORKS'] = '50'
+        os.environ['ANSIBLE_REMOTE_USER'] = 'deploy'
+
+        self.assertEqual(config.get('defaults', 'forks'), '50')
+        self.assertEqual(config.get('defaults', 'remote_user', 'root'), 'deploy')
+
+    def test_missing_values(self):
+        config = self.config("[defaults]\nforks = 5\n")
+
+        self.assertEqual(config.get('defaults', 'timeout', '10'), '10')
+        self.assertIsNone(config.get('ssh_connection', 'pipelining'))
+
+    def test_unquoting(self):
+        config = self.config(
+            "[defaults]\n"
+            "double = \"a b\"\n"
+            "single = 'a b'\n"
+            "mixed = \"a b'\n"
+            "quote = \"\n"
+            "inner = a \"b\" c\n"
+        )
+        os.environ['ANSIBLE_FROM_ENV'] = "'x'"
+
+        self.assertEqual(config.get('defaults', 'double'), 'a b')
+        self.assertEqual(config.get('defaults', 'single'), 'a b')
+        self.assertEqual(config.get('defaults', 'mixed'), "\"a b'")
+        self.assertEqual(config.get('defaults', 'quote'), '"')
+        self.assertEqual(config.get('defaults', 'inner'), 'a "b" c')
+        self.assertEqual(config.get('defaults', 'from_env'), 'x')
+
+    def test_no_interpolation(self):
+        config = self.config("[defaults]\nlog_path = %(here)s/ansible.log\n")
+        self.assertEqual(config.get('defaults', 'log_path'), '%(here)s/ansible.log')
+
+    def test_invalid_file(self):
+        with self.assertRaises(ValueError):
+            self.config("forks = 5\n")
+
+
+class TestRelativePaths(AnsibleCfgTestCase):
+
+    def setUp(self):
+        super(TestRelativePaths, self).setUp()
+        subprocess.check_call(['git', 'init', '-q', self.base])
+        with open(self.path('.repoconfig'), 'w') as f:
+            f.write("[ansible]\nbase_dir = ansible\n")
+        os.makedirs(self.path('ansible/inventories'))
+        os.makedirs(self.path('ansible/tmp'))
+        with open(self.path('ansible/ansible.cfg'), 'w') as f:
+            f.write("[defaults]\ninventory = inventories\nlocal_tmp = tmp\n")
+        with open(self.path('ansible/inventories/main.yml'), 'w') as f:
+            f.write("hosts: [{name: h1}]\n")
+
+        # Resolved from the base of the repository, not the working directory
+        self.cwd = os.getcwd()
+        os.chdir(tempfile.gettempdir())
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        super(TestRelativePaths, self).tearDown()
+
+    def test_local_tmp(self):
+        repo = AnsibleRepo(self.base)
+        self.assertEqual(os.path.dirname(repo.vault_index_file()), self.path('ansible/tmp'))
+        self.assertEqual(os.path.dirname(YAMLInventory.cache_path(repo, yaml_file='main.yml')), self.path('ansible/tmp'))
+
+    def test_inventory(self):
+        inventory = YAMLInventory('main.yml', repo_info=AnsibleRepo(self.base))
+        self.assertEqual(inventory.inventory_base, self.path('ansible/inventories'))
+        self.assertEqual(inventory.get_hosts(), [{'name': 'h1'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ft=python:ts=4:sw=4
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# test_config.py - Tests of the repository configuration
+#
+
+from __future__ import print_function
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from autolibs.config import Config
+
+
+class TestConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp(prefix='test-config-')
+        subprocess.check_call(['git', 'init', '-q', self.base])
+        self.write("[repository]\nsecret_files = a.pem,b.pem\n\n[ansible]\nbase_dir = ansible\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.base)
+
+    def write(self, content):
+        with open(os.path.join(self.base, '.repoconfig'), 'w') as f:
+            f.write(content)
+
+    def test_secret_files(self):
+        self.assertEqual(Config(self.base).secret_files(), ['a.pem', 'b.pem'])
+
+    def test_reparse_reaches_the_sections(self):
+        config = Config(self.base)
+        self.assertEqual(config.ansible.base_dir(), 'ansible')
+
+        self.write("[repository]\nsecret_files = c.pem\n\n[ansible]\nbase_dir = automation/ansible\n")
+
+        self.assertEqual(config.secret_files(), ['c.pem'])
+        self.assertEqual(config.ansible.base_dir(), 'automation/ansible')
+        self.assertIn('ansible', config.config.sections())
+
+    def test_missing_section(self):
+        self.assertIsNone(Config(self.base).packer)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ft=python:ts=4:sw=4
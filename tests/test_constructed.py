@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# test_constructed.py - Tests of the constructed groups
+#
+
+from __future__ import print_function
+
+import unittest
+
+from autolibs.ansible.constructed import evaluate_constructed_groups
+
+
+def members(host_vars, condition):
+    """
+    The hosts matching a condition
+    """
+    memberships, _ = evaluate_constructed_groups(host_vars, [{'name': 'g', 'condition': condition}])
+    return memberships['g']
+
+
+class TestComparisons(unittest.TestCase):
+
+    HOSTS = {
+        'num': {'mem': 8192},
+        'small': {'mem': 512},
+        'str': {'mem': "4096"},
+        'bool': {'mem': True},
+        'none': {'mem': None},
+        'list': {'mem': [2048]},
+    }
+
+    def test_numbers_with_numbers(self):
+        self.assertEqual(members(self.HOSTS, "mem > 1000"), ['num'])
+        self.assertEqual(members(self.HOSTS, "mem <= 1000"), ['small'])
+        self.assertEqual(members(self.HOSTS, "mem > 500 and mem < 10000"), ['num', 'small'])
+
+    def test_strings_with_strings(self):
+        self.assertEqual(members(self.HOSTS, "mem > '1000'"), ['str'])
+        self.assertEqual(members(self.HOSTS, "mem < '1000'"), [])
+
+    def test_booleans_are_not_numbers(self):
+        self.assertEqual(members({'a': {'x': True}, 'b': {'x': 2}}, "x >= 1"), ['b'])
+
+    def test_unordered_literal(self):
+        self.assertRaises(ValueError, members, self.HOSTS, "mem > None")
+
+
+class TestKeyedGroups(unittest.TestCase):
+
+    def test_existing_group_is_not_generated(self):
+        host_vars = {'a': {'dc': 'lon'}, 'b': {'dc': 'par'}}
+        memberships, generated = evaluate_constructed_groups(
+            host_vars, keyed=[{'name': 'dc', 'key': 'dc'}], existing=['dc_lon']
+        )
+
+        self.assertEqual([g['name'] for g in generated], ['dc_par'])
+        self.assertEqual(memberships['dc_lon'], ['a'])
+        self.assertEqual(memberships['dc_par'], ['b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ft=python:ts=4:sw=4
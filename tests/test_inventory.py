@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# test_inventory.py - Tests of the YAML inventory
+#
+
+from __future__ import print_function
+
+import os
+import copy
+import errno
+import shutil
+import tempfile
+import time
+import unittest
+import yaml
+
+from autolibs.ansible.inventory import YAMLInventory, compile_host
+
+
+class FakeRepo(object):
+    """
+    The attributes of AnsibleRepo used by the inventory, on a temporary directory
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.inventory_base = base
+        self.local_tmp = os.path.join(base, 'tmp')
+
+    def ans_config(self, section, name, default):
+        if name == 'local_tmp':
+            return self.local_tmp
+        return default
+
+
+class InventoryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp(prefix='test-inventory-')
+        os.mkdir(os.path.join(self.base, 'tmp'))
+
+    def tearDown(self):
+        shutil.rmtree(self.base, ignore_errors=True)
+
+    def write(self, name, document):
+        """
+        Writes a YAML file of the inventory
+        """
+        with open(os.path.join(self.base, name), 'w') as f:
+            yaml.safe_dump(document, f)
+
+    def inventory(self, document, **kwargs):
+        """
+        Compiles an inventory made of a single main.yml
+        """
+        self.write('main.yml', document)
+
+        return YAMLInventory(
+            'main.yml',
+            repo_info=FakeRepo(self.base),
+            cache_file=os.path.join(self.base, 'inventory-cache.yml'),
+            working_dir=self.base,
+            **kwargs
+        )
+
+
+class TestCompileHost(InventoryTestCase):
+
+    def test_source_host_unchanged(self):
+        groups = {'linux': {'vars': {'a': 1}, 'hosts': [], 'member_of': []}}
+        host = {'name': 'h1', 'memberof': ['linux'], 'vars': {'b': 2}}
+        original = copy.deepcopy(host)
+
+        _, compiled = compile_host(host, groups)
+        compiled['member_of'].append('other')
+        compiled['vars']['memberof'].append('other')
+
+        self.assertEqual(host, original)
+
+    def test_constructed_groups_leave_host_list_unchanged(self):
+        document = {
+            'groups': [
+                {'name': 'linux'},
+                {'name': 'big', 'condition': "mem >= 4096"},
+                {'name': 'dc', 'key': 'datacenter'},
+            ],
+            'hosts': [
+                {'name': 'h%d' % i, 'memberof': ['linux'], 'vars': {'mem': 1024 * i, 'datacenter': 'lon'}}
+                for i in range(6)
+            ],
+        }
+        inventory = self.inventory(document)
+
+        for host in inventory.host_list:
+            self.assertEqual(host['memberof'], ['linux'])
+        self.assertIn('big', inventory.get_host('h5')['memberof'])
+        self.assertIn('dc_lon', inventory.get_host('h5')['memberof'])
+
+
+class ParallelInventory(YAMLInventory):
+    """
+    Inventory compiled in parallel also when it's small
+    """
+    PARALLEL_MIN_HOSTS = 1
+
+
+class TestParallelCompile(InventoryTestCase):
+
+    def test_same_result_as_serial(self):
+        document = {
+            'groups': [
+                {'name': 'linux', 'vars': {'os': 'linux'}},
+                {'name': 'big', 'condition': "mem >= 4096"},
+                {'name': 'dc', 'key': 'datacenter'},
+            ],
+            'vars': {'global': True},
+            'hosts': [
+                {'name': 'h%02d' % i, 'memberof': ['linux'], 'vars': {'mem': 1024 * i, 'datacenter': 'dc%d' % (i % 3)}}
+                for i in range(20)
+            ],
+        }
+        self.write('main.yml', document)
+        options = {'repo_info': FakeRepo(self.base), 'working_dir': self.base}
+
+        serial = YAMLInventory('main.yml', cache_file=os.path.join(self.base, 'serial.yml'), **options)
+        parallel = ParallelInventory(
+            'main.yml', cache_file=os.path.join(self.base, 'parallel.yml'), workers=3, **options
+        )
+
+        self.assertEqual(serial.get_list(), parallel.get_list())
+        self.assertEqual(serial.host_list, parallel.host_list)
+
+
+class TestStreams(InventoryTestCase):
+
+    def test_streams_stopped_on_errors(self):
+        with open(os.path.join(self.base, 'broken.yml'), 'w') as f:
+            f.write("hosts: [\n")
+        document = {
+            'import': ['broken.yml'],
+            'executables': [{'path': '/bin/sleep', 'args': ['30'], 'format': 'ndjson'}],
+        }
+
+        self.assertRaises(Exception, self.inventory, document)
+
+        # All the children have been reaped
+        with self.assertRaises(OSError) as context:
+            os.waitpid(-1, os.WNOHANG)
+        self.assertEqual(context.exception.errno, errno.ECHILD)
+
+    def script(self, name, content):
+        """
+        Writes an executable shell script
+        """
+        path = os.path.join(self.base, name)
+        with open(path, 'w') as f:
+            f.write("#!/bin/sh\n" + content)
+        os.chmod(path, 0o755)
+        return path
+
+    def test_streams_read_while_the_others_run(self):
+        # More records than the pipe can hold, then a pause
+        stream = self.script('stream.sh', (
+            "i=0\n"
+            "while [ $i -lt 2000 ]; do\n"
+            "  echo '{\"host\": {\"name\": \"s'$i'\", \"vars\": {\"pad\": \"%s\"}}}'\n"
+            "  i=$((i+1))\n"
+            "done\n"
+            "sleep 1\n"
+        ) % ('x' * 100))
+        slow = self.script('slow.sh', "sleep 1\necho 'hosts: [{name: y}]'\n")
+        document = {
+            'executables': [
+                {'path': slow},
+                {'path': stream, 'format': 'ndjson'},
+            ],
+        }
+
+        start = time.time()
+        inventory = self.inventory(document)
+
+        self.assertLess(time.time() - start, 1.8)
+        self.assertEqual(len(inventory.ansible_host_list), 2001)
+
+    def test_invalid_stream(self):
+        stream = self.script('stream.sh', "echo '{\"host\": {}}'\nsleep 30\n")
+
+        self.assertRaises(Exception, self.inventory, {'executables': [{'path': stream, 'format': 'ndjson'}]})
+
+
+class TestConstructedGroups(InventoryTestCase):
+
+    def test_keyed_group_with_the_name_of_a_group(self):
+        document = {
+            'groups': [
+                {'name': 'dc', 'key': 'datacenter'},
+                {'name': 'dc_lon', 'vars': {'manual': True}},
+            ],
+            'hosts': [
+                {'name': 'a', 'vars': {'datacenter': 'lon'}},
+                {'name': 'b', 'memberof': ['dc_lon']},
+                {'name': 'c', 'vars': {'datacenter': 'par'}},
+            ],
+        }
+        inventory = self.inventory(document)
+        output = inventory.get_list()
+
+        self.assertEqual(sorted(output['dc_lon']['hosts']), ['a', 'b'])
+        self.assertEqual(output['dc_lon']['vars']['manual'], True)
+        self.assertEqual(output['dc_par']['hosts'], ['c'])
+        self.assertEqual(len([g for g in inventory.group_list if g['name'] == 'dc_lon']), 1)
+
+
+class CountingInventory(YAMLInventory):
+    """
+    Inventory that counts its compilations and never uses the cache by age
+    """
+    CACHE_EXPIRE = 0
+    compiled = 0
+
+    def _load_yaml(self):
+        CountingInventory.compiled += 1
+        super(CountingInventory, self)._load_yaml()
+
+
+class TestLoadDatabase(InventoryTestCase):
+
+    def load(self):
+        return CountingInventory.load_database('main.yml', repo_info=FakeRepo(self.base), working_dir=self.base)
+
+    def test_fresh_until_the_sources_change(self):
+        CountingInventory.compiled = 0
+        self.write('main.yml', {'import': ['hosts/'], 'groups': [{'name': 'linux'}]})
+        os.mkdir(os.path.join(self.base, 'hosts'))
+        self.write('hosts/a.yml', {'hosts': [{'name': 'a', 'memberof': ['linux']}]})
+
+        self.assertEqual(self.load().select(['group=linux']), ['a'])
+        self.assertEqual(self.load().select(['group=linux']), ['a'])
+        self.assertEqual(CountingInventory.compiled, 1)
+
+        self.write('hosts/b.yml', {'hosts': [{'name': 'b', 'memberof': ['linux']}]})
+        self.assertEqual(self.load().select(['group=linux']), ['a', 'b'])
+        self.assertEqual(CountingInventory.compiled, 2)
+
+    def test_dynamic_inventories_expire(self):
+        CountingInventory.compiled = 0
+        self.write('main.yml', {
+            'groups': [{'name': 'linux'}],
+            'executables': [{'path': '/bin/echo', 'args': ['"hosts: [{name: a, memberof: [linux]}]"']}],
+        })
+
+        self.assertEqual(self.load().select(['group=linux']), ['a'])
+        self.assertEqual(self.load().select(['group=linux']), ['a'])
+        self.assertEqual(CountingInventory.compiled, 2)
+
+
+class RacingInventory(YAMLInventory):
+    """
+    Inventory whose cache is removed by someone else while it's being read
+    """
+    CACHE_EXPIRE = 3600
+
+    def _load_cache(self):
+        os.remove(self.cache_file)
+        raise ValueError("Half-written cache")
+
+
+class TestCacheFile(InventoryTestCase):
+
+    def test_saved_aside(self):
+        self.inventory({'hosts': [{'name': 'a'}]})
+
+        self.assertEqual(sorted(os.listdir(self.base)), ['inventory-cache.yml', 'main.yml', 'tmp'])
+
+    def test_cache_removed_while_read(self):
+        self.inventory({'hosts': [{'name': 'a'}]})
+
+        inventory = RacingInventory(
+            'main.yml', repo_info=FakeRepo(self.base), working_dir=self.base,
+            cache_file=os.path.join(self.base, 'inventory-cache.yml'),
+        )
+        self.assertEqual(inventory.get_hosts(), [{'name': 'a'}])
+
+
+class TestCachePath(InventoryTestCase):
+
+    def test_repositories_sharing_local_tmp(self):
+        shared_tmp = os.path.join(self.base, 'tmp')
+        hosts = {}
+        for name in ['repo1', 'repo2']:
+            repo = FakeRepo(os.path.join(self.base, name))
+            repo.local_tmp = shared_tmp
+            os.mkdir(repo.base)
+            self.write('%s/main.yml' % name, {'hosts': [{'name': '%s-host' % name}]})
+            database = YAMLInventory.load_database('main.yml', repo_info=repo, working_dir=repo.base)
+            hosts[name] = database.select()
+
+        self.assertEqual(hosts, {'repo1': ['repo1-host'], 'repo2': ['repo2-host']})
+
+    def test_main_file_and_override(self):
+        repo = FakeRepo(self.base)
+        paths = set([
+            YAMLInventory.cache_path(repo, yaml_file='main.yml'),
+            YAMLInventory.cache_path(repo, yaml_file='other.yml'),
+            YAMLInventory.cache_path(repo, yaml_file='main.yml', override_yaml='vars: {a: 1}'),
+            YAMLInventory.cache_path(repo, 'prod', yaml_file='main.yml'),
+        ])
+        self.assertEqual(len(paths), 4)
+        for path in paths:
+            self.assertEqual(os.path.dirname(path), repo.local_tmp)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ft=python:ts=4:sw=4
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# test_inventoryaws.py - Tests of the AWS inventory
+#
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+import autolibs.ansible.inventoryaws
+aws = sys.modules['autolibs.ansible.inventoryaws']
+
+
+class TestStreamRegions(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.originals = aws.get_session, aws.scan_region
+        aws.get_session = lambda: None
+        aws.scan_region = self.scan_region
+
+    def tearDown(self):
+        self.release.set()
+        aws.get_session, aws.scan_region = self.originals
+
+    def scan_region(self, region, config=None, pages=None):
+        """
+        The region "busy" sends a page every 50ms for 3 seconds, "slow" completes
+        after 600ms, "hung" never answers
+        """
+        if region == 'busy':
+            for i in range(60):
+                pages.put((region, [{'name': 'h%d' % i}], None))
+                time.sleep(0.05)
+            pages.put((region, None, None))
+        elif region.startswith('slow'):
+            time.sleep(0.6)
+            pages.put((region, None, None))
+        else:
+            self.release.wait(10)
+
+    def stream(self, regions, workers):
+        start = time.time()
+        completed = [r for r, hosts in aws.stream_regions(regions, workers=workers, timeout=1) if hosts is None]
+        return completed, time.time() - start
+
+    def test_hung_region_times_out_while_others_send_pages(self):
+        completed, elapsed = self.stream(['hung', 'busy'], workers=2)
+        self.assertEqual(completed, [])
+        self.assertLess(elapsed, 2)
+
+    def test_queued_regions_have_their_own_timeout(self):
+        regions = ['slow%d' % i for i in range(5)]
+        completed, elapsed = self.stream(regions, workers=2)
+        self.assertEqual(sorted(completed), regions)
+
+    def test_queued_region_of_stuck_pool_times_out(self):
+        completed, elapsed = self.stream(['hung', 'queued'], workers=1)
+        self.assertEqual(completed, [])
+        self.assertLess(elapsed, 3)
+
+
+class TestSnapshots(unittest.TestCase):
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp(prefix='test-inventoryaws-')
+        self.load_credentials = aws.load_credentials
+        aws.load_credentials = lambda: ('AKIAEXAMPLE', 'secret')
+
+    def tearDown(self):
+        aws.load_credentials = self.load_credentials
+        shutil.rmtree(self.base, ignore_errors=True)
+
+    def test_save_and_load(self):
+        aws.save_snapshot('eu-west-1', {'hosts': [{'name': 'a'}]}, self.base)
+        self.assertEqual(aws.load_snapshot('eu-west-1', self.base)['hosts'], [{'name': 'a'}])
+
+    def test_unwritable_cache_dir(self):
+        cache_dir = os.path.join(self.base, 'file')
+        open(cache_dir, 'w').close()
+
+        aws.save_snapshot('eu-west-1', {'hosts': []}, cache_dir)
+        self.assertEqual(aws.load_snapshot('eu-west-1', cache_dir), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ft=python:ts=4:sw=4
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# test_inventorydiff.py - Tests of the inventories compiled at a GIT revision
+#
+
+from __future__ import print_function
+
+import os
+import glob
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from autolibs.ansible import inventorydiff
+from autolibs.ansible.inventory import YAMLInventory
+from autolibs.ansible.inventorydiff import inventory_at_revision
+from autolibs.ansible.repository import AnsibleRepo
+
+
+class TestInventoryAtRevision(unittest.TestCase):
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp(prefix='test-inventorydiff-')
+        self.write('.repoconfig', "[ansible]\nbase_dir = ansible\n")
+        self.write('ansible/ansible.cfg', "[defaults]\ninventory = inventories\nlocal_tmp = tmp\n")
+        self.write('.gitignore', "tmp/\n")
+        os.makedirs(self.path('ansible/tmp'))
+
+        # Counts the compilations
+        self.compiled = []
+        self.load_yaml = YAMLInventory._load_yaml
+        self.cache_expire = YAMLInventory.CACHE_EXPIRE
+
+        def load_yaml(inventory):
+            self.compiled.append(inventory.yaml_file)
+            self.load_yaml(inventory)
+        YAMLInventory._load_yaml = load_yaml
+
+    def tearDown(self):
+        YAMLInventory._load_yaml = self.load_yaml
+        YAMLInventory.CACHE_EXPIRE = self.cache_expire
+        shutil.rmtree(self.base)
+
+    def path(self, name):
+        return os.path.join(self.base, name)
+
+    def write(self, name, content):
+        if not os.path.isdir(os.path.dirname(self.path(name))):
+            os.makedirs(os.path.dirname(self.path(name)))
+        with open(self.path(name), 'w') as f:
+            f.write(content)
+
+    def commit(self, main):
+        self.write('ansible/inventories/main.yml', main)
+        if not os.path.isdir(self.path('.git')):
+            subprocess.check_call(['git', 'init', '-q', self.base])
+        subprocess.check_call(['git', 'add', '-A'], cwd=self.base)
+        subprocess.check_call(
+            ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com', 'commit', '-q', '-m', 'test'],
+            cwd=self.base
+        )
+
+    def at_revision(self, override_yaml=""):
+        repo = AnsibleRepo(self.base)
+        current = YAMLInventory('main.yml', override_yaml, repo_info=repo, working_dir=repo.base)
+        del self.compiled[:]
+        return inventory_at_revision(repo, current, 'HEAD')
+
+    def test_static_inventory_cached(self):
+        self.commit("hosts: [{name: a}]\n")
+
+        self.assertEqual(self.at_revision().get_hosts(), [{'name': 'a'}])
+        self.assertEqual(len(self.compiled), 1)
+        self.assertEqual(self.at_revision().get_hosts(), [{'name': 'a'}])
+        self.assertEqual(self.compiled, [])
+
+    def test_dynamic_inventory_expires(self):
+        self.commit(
+            "executables:\n"
+            "  - path: /bin/echo\n"
+            "    args: ['\"hosts: [{name: a}]\"']\n"
+        )
+        YAMLInventory.CACHE_EXPIRE = 0
+
+        self.assertEqual(self.at_revision().get_hosts(), [{'name': 'a'}])
+        self.assertEqual(self.at_revision().get_hosts(), [{'name': 'a'}])
+        self.assertEqual(len(self.compiled), 1)
+
+    def test_override(self):
+        self.commit("hosts: [{name: a}]\n")
+
+        self.assertEqual(self.at_revision().query(), ['a'])
+        self.assertEqual(self.at_revision("hosts: [{name: b}]").query(), ['a', 'b'])
+        self.assertEqual(self.at_revision().query(), ['a'])
+
+    def test_old_revisions_pruned(self):
+        self.commit("hosts: [{name: a}]\n")
+        cache_file = self.path('ansible/tmp/inventory-cache.yml')
+        for i in range(5):
+            with open('%s-rev-%012x-%s.yml' % (cache_file[:-4], i, 'f' * 12), 'w') as f:
+                f.write('{}')
+            os.utime(f.name, (1000 + i, 1000 + i))
+        with open('%s-rev-other.yml' % cache_file[:-4], 'w') as f:
+            f.write('{}')
+
+        inventorydiff._prune_revision_caches(cache_file, 2)
+
+        self.assertEqual(sorted(os.path.basename(p) for p in glob.glob(cache_file[:-4] + '-rev-*')), [
+            'inventory-cache-rev-000000000003-ffffffffffff.yml',
+            'inventory-cache-rev-000000000004-ffffffffffff.yml',
+            'inventory-cache-rev-other.yml',
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ft=python:ts=4:sw=4
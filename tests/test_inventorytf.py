@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# test_inventorytf.py - Tests of the Terraform inventory
+#
+
+from __future__ import print_function
+
+import unittest
+
+from autolibs.ansible.inventorytf import instance_region
+
+
+class TestInstanceRegion(unittest.TestCase):
+
+    ZONES = {
+        'eu-west-2b': 'eu-west-2',
+        'ap-southeast-1a': 'ap-southeast-1',
+        'us-gov-west-1a': 'us-gov-west-1',
+        'us-iso-east-1a': 'us-iso-east-1',
+        'us-isob-east-1a': 'us-isob-east-1',
+        'cn-northwest-1a': 'cn-northwest-1',
+        'us-west-2-lax-1a': 'us-west-2',
+    }
+
+    def test_zones(self):
+        for zone, region in self.ZONES.items():
+            self.assertEqual(instance_region({'availability_zone': zone}), region, zone)
+
+    def test_default(self):
+        self.assertEqual(instance_region({}, 'eu-west-1'), 'eu-west-1')
+        self.assertEqual(instance_region({'availability_zone': 'invalid'}), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ft=python:ts=4:sw=4
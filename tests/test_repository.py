@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+#
+# MIT License
+#
+# Copyright (c) 2017 Fabrizio Colonna <colofabrix@tin.it>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# test_repository.py - Tests of the repository information kept in the process
+#
+
+from __future__ import print_function
+
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+
+from autolibs import gitmeta
+from autolibs.gitfiles import repo_files
+from autolibs.lazy import Memoised
+from autolibs.ansible.repository import AnsibleRepo
+
+
+class RepositoryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp(prefix='test-repository-')
+        subprocess.check_call(['git', 'init', '-q', self.base])
+        self.write('.repoconfig', "[ansible]\nbase_dir = ansible\n")
+        self.write('ansible/ansible.cfg', "[defaults]\nforks = 5\nlocal_tmp = tmp\n")
+        os.makedirs(self.path('ansible/playbooks'))
+        self.backdate()
+
+    def backdate(self):
+        """
+        Moves the timestamps in the past: they are coarse, so the changes made by
+        the tests must happen after the ones made before
+        """
+        past = time.time() - 10
+        for root, dirs, files in os.walk(self.base):
+            for name in dirs + files:
+                os.utime(os.path.join(root, name), (past, past))
+
+    def tearDown(self):
+        shutil.rmtree(self.base)
+
+    def path(self, name):
+        return os.path.join(self.base, name)
+
+    def write(self, name, content):
+        if not os.path.isdir(os.path.dirname(self.path(name))):
+            os.makedirs(os.path.dirname(self.path(name)))
+        with open(self.path(name), 'w') as f:
+            f.write(content)
+
+
+class TestAnsibleRepo(RepositoryTestCase):
+
+    def test_changes_seen_by_the_same_process(self):
+        self.assertEqual(AnsibleRepo(self.base).playbooks(), [])
+        self.assertEqual(AnsibleRepo(self.base).ans_config('defaults', 'forks', None), '5')
+
+        self.write('ansible/playbooks/site.yml', "- hosts: all\n")
+        self.write('ansible/ansible.cfg', "[defaults]\nforks = 50\nlocal_tmp = tmp\n")
+
+        repo = AnsibleRepo(self.base)
+        self.assertEqual(repo.playbooks(), [self.path('ansible/playbooks/site.yml')])
+        self.assertEqual(repo.ans_config('defaults', 'forks', None), '50')
+
+    def test_held_instance_sees_new_files(self):
+        repo = AnsibleRepo(self.base)
+        self.assertEqual(repo.vaulted(), [])
+
+        self.write('ansible/playbooks/site.yml', "- hosts: all\n")
+        self.write('ansible/vars/secret.yml', "$ANSIBLE_VAULT;1.1;AES256\n0000\n")
+
+        self.assertEqual(repo.playbooks(), [self.path('ansible/playbooks/site.yml')])
+        self.assertEqual(repo.vaulted(), [self.path('ansible/vars/secret.yml')])
+
+    def test_new_playbook_next_to_other_files(self):
+        self.write('ansible/playbooks/web/README', "Web servers\n")
+        self.backdate()
+        repo = AnsibleRepo(self.base)
+        self.assertEqual(repo.playbooks(), [])
+
+        self.write('ansible/playbooks/web/site.yml', "- hosts: web\n")
+
+        self.assertEqual(repo.playbooks(), [self.path('ansible/playbooks/web/site.yml')])
+
+    def test_ignored_directories_not_watched(self):
+        self.write('.gitignore', "ignored/\n")
+        self.write('ansible/playbooks/site.yml', "- hosts: all\n")
+        self.write('ansible/playbooks/ignored/deep/file.txt', "\n")
+
+        dirs = AnsibleRepo(self.base)._playbook_dirs([])
+
+        self.assertIn(self.path('ansible/playbooks'), dirs)
+        self.assertNotIn(self.path('ansible/playbooks/ignored'), dirs)
+        self.assertNotIn(self.path('ansible/playbooks/ignored/deep'), dirs)
+
+    def test_rebuilt_when_the_configuration_changes(self):
+        repo = AnsibleRepo(self.base)
+        self.assertIs(AnsibleRepo(self.base), repo)
+
+        os.makedirs(self.path('automation/ansible/playbooks'))
+        self.write('.repoconfig', "[ansible]\nbase_dir = automation/ansible\n")
+
+        rebuilt = AnsibleRepo(self.base)
+        self.assertIsNot(rebuilt, repo)
+        self.assertEqual(rebuilt.base, self.path('automation/ansible'))
+
+
+class SlowRepo(object):
+    """
+    Memoised class that takes a while to build one of its repositories
+    """
+    __metaclass__ = Memoised
+
+    def __init__(self, repo_base=None):
+        if repo_base == '/slow':
+            time.sleep(1)
+
+
+class BaseRepo(object):
+    """
+    Memoised class that keeps the base it's built with
+    """
+    __metaclass__ = Memoised
+
+    def __init__(self, repo_base=None):
+        self.repo_base = repo_base
+
+
+class TestMemoised(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dirs = [tempfile.mkdtemp(prefix='test-memoised-') for _ in range(2)]
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        for path in self.dirs:
+            shutil.rmtree(path)
+
+    def test_relative_base(self):
+        repos = []
+        for path in self.dirs:
+            os.chdir(path)
+            repos.append(BaseRepo('.'))
+
+        self.assertEqual([r.repo_base for r in repos], [os.path.realpath(p) for p in self.dirs])
+        self.assertIs(BaseRepo(self.dirs[1]), repos[1])
+
+    def test_clear(self):
+        BaseRepo(self.dirs[0])
+        Memoised.clear()
+
+        self.assertEqual(Memoised._instances, {})
+        self.assertEqual(Memoised._locks, {})
+
+    def test_other_keys_dont_wait(self):
+        thread = threading.Thread(target=SlowRepo, args=('/slow',))
+        thread.start()
+        time.sleep(0.1)
+
+        try:
+            start = time.time()
+            SlowRepo('/fast')
+            self.assertLess(time.time() - start, 0.5)
+        finally:
+            thread.join()
+
+        self.assertIs(SlowRepo('/slow'), SlowRepo('/slow'))
+
+
+class TestGitCaches(RepositoryTestCase):
+
+    def test_new_untracked_file(self):
+        self.assertEqual(repo_files(self.path('ansible/playbooks')), [])
+
+        self.write('ansible/playbooks/site.yml', "- hosts: all\n")
+
+        self.assertEqual(repo_files(self.path('ansible/playbooks')), [self.path('ansible/playbooks/site.yml')])
+
+    def test_head_after_checkout(self):
+        gitmeta.head(self.base)
+        self.write('.git/HEAD', "ref: refs/heads/other-branch\n")
+
+        self.assertEqual(gitmeta.current_branch(self.base), 'other-branch')
+
+
+
+class TestFindGitDir(unittest.TestCase):
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp(prefix='test-gitdir-')
+
+    def tearDown(self):
+        shutil.rmtree(self.base)
+
+    def test_repository_created_later(self):
+        self.assertIsNone(gitmeta.find_git_dir(self.base))
+
+        subprocess.check_call(['git', 'init', '-q', self.base])
+
+        self.assertEqual(gitmeta.find_git_dir(self.base).root, self.base)
+
+    def test_repository_removed(self):
+        subprocess.check_call(['git', 'init', '-q', self.base])
+        self.assertTrue(gitmeta.is_git_repo(self.base))
+
+        shutil.rmtree(os.path.join(self.base, '.git'))
+
+        self.assertFalse(gitmeta.is_git_repo(self.base))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ft=python:ts=4:sw=4